@@ -2,27 +2,47 @@ import os
 import json
 import sqlite3
 import asyncio
-import aiohttp
-from aiohttp import TCPConnector
 import google.generativeai as genai
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, copy_current_request_context, render_template, request, jsonify, send_from_directory, stream_with_context
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 from dotenv import load_dotenv
 import requests
-import urllib3
 from datetime import datetime
 import logging
+import socket
 import time
 import threading
 import concurrent.futures
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from elevenlabs.client import ElevenLabs
 import tempfile
 import base64
-
-# Suppress only the single InsecureRequestWarning from urllib3 needed.
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from asset_manifest import AssetManifestBuilder
+from runtime_config import RuntimeConfig, RuntimeConfigManager
+from warmup import WarmupManager
+from voice_catalog import VoiceCatalog
+from memory_shards import (
+    ShardLayoutError, ShardWriter, ShardedMaintenance, check_shard_layout, record_shard_layout,
+    shard_index, shard_paths, shard_status,
+)
+from db_migrations import apply_migrations
+from memory_search import search_conversations
+from profile_cache import ProfileCache
+from audio_codecs import AudioCache, ClientAudioProfiles, get_audio_format, negotiate_audio_format
+from audio_preprocess import PreprocessStats, preprocess_for_stt
+from turns import Turn, TurnRegistry
+from turn_scheduler import LANE_TEXT, LANE_VOICE, SchedulerFullError, TurnScheduler
+from loop_monitor import LoopLagMonitor
+from tts_router import TTSModelRouter
+from cassettes import Cassette, ReplayedChunk, fingerprint
+from http_clients import HttpClientManager
+from runtime_tuning import RuntimeTuner, TuningError
+from message_dedupe import STATE_COMPLETED, MessageDeduplicator
+from sampling_profiler import ProfilerBusyError, SamplingProfiler
+from log_pipeline import LogPipeline
+from filler_audio import FillerBank
+from history_export import CursorError, decode_cursor, gzip_stream, iter_ndjson, normalize_timestamp
 
 # Load environment variables
 load_dotenv()
@@ -36,54 +56,138 @@ CORS(app)
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# サブシステムごとのロガー（レベルとサンプリングは logging_settings で個別に設定する）
+turn_log = logging.getLogger('app.turn')
+stream_log = logging.getLogger('app.stream')
+tts_log = logging.getLogger('app.tts')
+perf_log = logging.getLogger('app.perf')
+# ログはメモリ上のキュー経由でバックグラウンドのスレッドが書き出す（start_background_services で開始し、
+# 設定の読み込み時にレベル等を反映）
+log_pipeline = LogPipeline()
 
-# Configure Gemini AI
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-if not gemini_api_key:
-    print("[ERROR] GEMINI_API_KEY not found in environment variables")
-else:
-    print(f"[DEBUG] Gemini API key configured: {gemini_api_key[:20]}...")
-
-genai.configure(api_key=gemini_api_key)
+# データベースパスを現在のディレクトリからの相対パスで設定
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(project_root, 'config', 'memory.db'))
+APP_CONFIG_PATH = os.getenv('APP_CONFIG_PATH', os.path.join(project_root, 'config', 'app_config.yml'))
+VOICE_CATALOG_SNAPSHOT_PATH = os.getenv('VOICE_CATALOG_SNAPSHOT_PATH', os.path.join(project_root, 'config', 'voices_snapshot.json'))
+FILLER_AUDIO_DIR = os.getenv('FILLER_AUDIO_DIR', os.path.join(project_root, 'config', 'fillers'))
+TUNING_AUDIT_LOG_PATH = os.getenv('TUNING_AUDIT_LOG_PATH', os.path.join(project_root, 'config', 'tuning_audit.jsonl'))
+MODELS_DIR = os.path.join(project_root, 'models')
+BACKGROUNDS_DIR = os.path.join(project_root, 'frontend', 'backgrounds')
 
-# モデル設定とバリデーション
-primary_model_name = os.getenv('GEMINI_PRIMARY_MODEL', 'gemini-2.5-flash')
-fallback_model_name = os.getenv('GEMINI_FALLBACK_MODEL', 'gemini-2.5-flash-lite')
+# フィンガープリント付きURL（?v=<hash>）で配信するアセットのキャッシュ期間（1年）
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
 
-print(f"[DEBUG] Primary model: {primary_model_name}")
-print(f"[DEBUG] Fallback model: {fallback_model_name}")
+# ランタイム設定（初回アクセス時に一度だけパースし、ファイル変更時にホットリロード）
+runtime_config = RuntimeConfigManager(APP_CONFIG_PATH, autoload=False)
 
-try:
-    primary_model = genai.GenerativeModel(primary_model_name)
-    fallback_model = genai.GenerativeModel(fallback_model_name)
-    print("[DEBUG] Gemini models initialized successfully")
-except Exception as e:
-    print(f"[ERROR] Failed to initialize Gemini models: {e}")
+# 起動後のバックグラウンドウォームアップ（/api/ready で状態を公開）
+warmup_manager = WarmupManager()
 
 # API Configuration
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
 ASSEMBLYAI_API_KEY = os.getenv('ASSEMBLYAI_API_KEY')
+ELEVENLABS_API_HOST = 'api.elevenlabs.io'
+
+# 外部APIクライアントはインポート時には生成せず、初回利用時またはウォームアップ時に生成する
+_gemini_models = None  # (primary, fallback)
+_gemini_lock = threading.Lock()
+_elevenlabs_client = None
+_elevenlabs_lock = threading.Lock()
 
-# ElevenLabs client initialization
-elevenlabs_client = None
-if ELEVENLABS_API_KEY:
-    elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+def create_gemini_models(config: RuntimeConfig):
+    """Geminiを設定し、プライマリ・フォールバックモデルを生成"""
+    if not GEMINI_API_KEY:
+        logger.error("GEMINI_API_KEY not found in environment variables")
+    genai.configure(api_key=GEMINI_API_KEY)
+    
+    logger.debug("Primary model: %s", config.gemini.primary_model)
+    logger.debug("Fallback model: %s", config.gemini.fallback_model)
+    
+    models = (
+        genai.GenerativeModel(config.gemini.primary_model),
+        genai.GenerativeModel(config.gemini.fallback_model),
+    )
+    logger.info("Gemini models initialized successfully")
+    return models
 
-# グローバル変数で利用可能な音声を管理
-AVAILABLE_VOICES = []
+def get_gemini_models():
+    """Geminiモデルを取得（初回のみ生成）"""
+    global _gemini_models
+    if _gemini_models is None:
+        with _gemini_lock:
+            if _gemini_models is None:
+                _gemini_models = create_gemini_models(runtime_config.current)
+    return _gemini_models
+
+def get_primary_model():
+    return get_gemini_models()[0]
+
+def get_fallback_model():
+    return get_gemini_models()[1]
+
+def get_elevenlabs_client() -> Optional[ElevenLabs]:
+    """ElevenLabsクライアントを取得（APIキー未設定時はNone）"""
+    global _elevenlabs_client
+    if _elevenlabs_client is None and ELEVENLABS_API_KEY:
+        with _elevenlabs_lock:
+            if _elevenlabs_client is None:
+                _elevenlabs_client = ElevenLabs(
+                    api_key=ELEVENLABS_API_KEY,
+                    httpx_client=http_clients.sync_client(ELEVENLABS_API_HOST)
+                )
+    return _elevenlabs_client
+
+def on_runtime_config_reload(old_config: RuntimeConfig, new_config: RuntimeConfig):
+    """設定リロード時にGeminiモデルを差し替える（処理中のターンは旧モデルのまま完了する）"""
+    global _gemini_models
+    if _gemini_models is None or old_config.gemini == new_config.gemini:
+        return
+    try:
+        _gemini_models = create_gemini_models(new_config)
+        logger.info(f"Gemini models switched: {new_config.gemini.primary_model} / {new_config.gemini.fallback_model}")
+    except Exception as e:
+        logger.error(f"Failed to switch Gemini models: {e}")
+
+runtime_config.add_listener(on_runtime_config_reload)
+
+def on_logging_config_reload(old_config: RuntimeConfig, new_config: RuntimeConfig):
+    """ログのレベル・サンプリング・形式を反映（設定ファイルの初回読み込み時も呼ばれる）"""
+    if old_config.logging != new_config.logging:
+        log_pipeline.apply_settings(new_config.logging)
+
+runtime_config.add_listener(on_logging_config_reload)
 
-# データベースパスを現在のディレクトリからの相対パスで設定
-current_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(current_dir)
-DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(project_root, 'config', 'memory.db'))
 
 class MemoryManager:
-    """AI短期記憶システムの管理クラス"""
+    """AI短期記憶システムの管理クラス
+
+    shard_count が 2 以上の場合、セッションを session_id のハッシュで複数のDBファイルに振り分け、
+    シャードごとに書き込み接続・プロフィールキャッシュを持つ（シャード数の変更は tools/memory_shards.py reshard）。
+    """
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, lazy: bool = False, shard_count_provider: Callable[[], int] = lambda: 1):
         # パスを絶対パスに変換
         self.db_path = os.path.abspath(db_path)
-        self.init_database()
+        self.shard_count_provider = shard_count_provider
+        self.shard_paths: List[str] = [self.db_path]
+        self._writers: List[ShardWriter] = []
+        self._profile_caches: List[ProfileCache] = []
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        if not lazy:
+            self.ensure_initialized()
+    
+    def ensure_initialized(self):
+        """未初期化であればデータベースを初期化"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if not self._initialized:
+                self.init_database()
+                self._initialized = True
     
     def init_database(self):
         """データベースの初期化"""
@@ -92,80 +196,101 @@ class MemoryManager:
         if not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
         
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    emotion TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_info (
-                    session_id TEXT PRIMARY KEY,
-                    name TEXT,
-                    preferences TEXT,
-                    context_data TEXT,
-                    last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"Database initialized successfully at: {self.db_path}")
-            
-        except sqlite3.Error as e:
-            logger.error(f"Database initialization failed: {e}")
-            # フォールバック：一時的なインメモリデータベース
-            logger.warning("Using in-memory database as fallback")
-            self.db_path = ':memory:'
+        shard_count = max(1, int(self.shard_count_provider() or 1))
+        # 再シャーディングせずに shard_count を変えた場合は、空のファイルで動き出さずに止める
+        problems = check_shard_layout(self.db_path, shard_count)
+        if problems:
+            for problem in problems:
+                logger.error(f"Memory shard layout mismatch: {problem}")
+            raise ShardLayoutError(
+                f"memory_settings.shard_count={shard_count} does not match the database files; "
+                f"run tools/memory_shards.py reshard first"
+            )
+        
+        paths = shard_paths(self.db_path, shard_count)
+        for index, path in enumerate(paths):
+            try:
+                # スキーマは db_migrations で一元管理し、未適用分のみ適用する
+                version = apply_migrations(path)
+                record_shard_layout(path, shard_count, index)
+                logger.info(f"Database initialized successfully at: {path} (schema version {version})")
+                
+            except sqlite3.Error as e:
+                logger.error(f"Database initialization failed: {e}")
+                # フォールバック：一時的なインメモリデータベース
+                logger.warning("Using in-memory database as fallback")
+                paths[index] = ':memory:'
+        
+        self.shard_paths = paths
+        self._writers = [ShardWriter(path) for path in paths]
+        self._profile_caches = [ProfileCache(lambda path=path: path) for path in paths]
+        if len(paths) == 1:
+            self.db_path = paths[0]
+    
+    def all_paths(self) -> List[str]:
+        """全シャードのDBファイル（メンテナンス・エクスポート用）"""
+        self.ensure_initialized()
+        return list(self.shard_paths)
+    
+    def shard_for(self, session_id: str) -> int:
+        return shard_index(session_id, len(self.shard_paths))
+    
+    def path_for(self, session_id: str) -> str:
+        """セッションのデータが入っているDBファイル"""
+        self.ensure_initialized()
+        return self.shard_paths[self.shard_for(session_id)]
+    
+    def writer_stats(self) -> List[Dict]:
+        return [writer.stats() for writer in self._writers]
+    
+    def invalidate_profile(self, session_id: str):
+        """プロフィールキャッシュを無効化（メンテナンスが user_info を書き換えた場合）"""
+        if self._profile_caches:
+            self._profile_caches[self.shard_for(session_id)].invalidate(session_id)
     
     def save_message(self, session_id: str, role: str, content: str, emotion: str = None):
-        """会話履歴を保存"""
+        """会話履歴を保存（シャードの書き込み接続に直列化）"""
+        self.ensure_initialized()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO conversations (session_id, role, content, emotion)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, role, content, emotion))
-            
-            conn.commit()
-            conn.close()
+            self._writers[self.shard_for(session_id)].insert_message(session_id, role, content, emotion)
         except sqlite3.Error as e:
             logger.error(f"Failed to save message: {e}")
     
-    def get_conversation_history(self, session_id: str, limit: int = 20) -> List[Dict]:
-        """会話履歴を取得"""
+    def get_conversation_history(self, session_id: str, limit: int = 20, before_id: Optional[int] = None) -> List[Dict]:
+        """会話履歴を取得（古い順）。before_id を指定するとそれより前のページを返す"""
+        self.ensure_initialized()
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.path_for(session_id))
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT role, content, emotion, timestamp
-                FROM conversations
-                WHERE session_id = ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', (session_id, limit))
+            # キーセットページング: (session_id, id DESC) のカバリングインデックスのみで完結する
+            if before_id is None:
+                cursor.execute('''
+                    SELECT id, role, content, emotion, timestamp
+                    FROM conversations
+                    WHERE session_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                ''', (session_id, limit))
+            else:
+                cursor.execute('''
+                    SELECT id, role, content, emotion, timestamp
+                    FROM conversations
+                    WHERE session_id = ? AND id < ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                ''', (session_id, before_id, limit))
             
             results = cursor.fetchall()
             conn.close()
             
             return [
                 {
-                    'role': row[0],
-                    'content': row[1],
-                    'emotion': row[2],
-                    'timestamp': row[3]
+                    'id': row[0],
+                    'role': row[1],
+                    'content': row[2],
+                    'emotion': row[3],
+                    'timestamp': row[4]
                 }
                 for row in reversed(results)
             ]
@@ -173,45 +298,38 @@ class MemoryManager:
             logger.error(f"Failed to get conversation history: {e}")
             return []
     
-    def update_user_info(self, session_id: str, name: str = None, preferences: str = None, context_data: str = None):
-        """ユーザー情報を更新"""
+    def get_history_page(self, session_id: str, limit: int = 20, before_id: Optional[int] = None) -> Dict:
+        """会話履歴を1ページ取得し、次ページ（より古い履歴）のカーソルを付けて返す"""
+        messages = self.get_conversation_history(session_id, limit, before_id)
+        next_cursor = messages[0]['id'] if len(messages) == limit else None
+        return {'messages': messages, 'next_cursor': next_cursor}
+    
+    def search_memory(self, session_id: str, query: str, top_k: int = 5,
+                      budget_ms: float = 50, before_id: Optional[int] = None) -> List[Dict]:
+        """全文検索インデックスから関連する過去のメッセージを取得（予算超過時は空）"""
+        self.ensure_initialized()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_info (session_id, name, preferences, context_data, last_interaction)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (session_id, name, preferences, context_data))
-            
-            conn.commit()
-            conn.close()
+            conn = sqlite3.connect(self.path_for(session_id))
+            try:
+                return search_conversations(conn, session_id, query, top_k, budget_ms, before_id)
+            finally:
+                conn.close()
         except sqlite3.Error as e:
-            logger.error(f"Failed to update user info: {e}")
+            logger.error(f"Failed to search memory: {e}")
+            return []
+    
+    def update_user_info(self, session_id: str, name: str = None, preferences: str = None, context_data: str = None):
+        """ユーザー情報を部分更新（None の列は変更しない）。書き込みはバックグラウンドでまとめて行う"""
+        self.ensure_initialized()
+        self._profile_caches[self.shard_for(session_id)].update(
+            session_id, name=name, preferences=preferences, context_data=context_data
+        )
     
     def get_user_info(self, session_id: str) -> Dict:
-        """ユーザー情報を取得"""
+        """ユーザー情報を取得（キャッシュから返し、ミス時のみDBを読む）"""
+        self.ensure_initialized()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT name, preferences, context_data, last_interaction
-                FROM user_info
-                WHERE session_id = ?
-            ''', (session_id,))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return {
-                    'name': result[0],
-                    'preferences': result[1],
-                    'context_data': result[2],
-                    'last_interaction': result[3]
-                }
-            return {}
+            return self._profile_caches[self.shard_for(session_id)].get(session_id)
         except sqlite3.Error as e:
             logger.error(f"Failed to get user info: {e}")
             return {}
@@ -298,16 +416,18 @@ class AIConversationManager:
     
     def __init__(self, memory_manager: MemoryManager):
         self.memory_manager = memory_manager
-        self.text_splitter = TextSplitter()  # テキスト分割器を追加
-        # 極限まで軽量化されたプロンプト（速度最優先）
-        self.character_prompts = {
-            'rei_engineer': "レイ:クール。技術の話で明るく。",
-            'yui_natural': "ユイ:優しい天然。",
-        }
+        self.text_splitter = TextSplitter(runtime_config.current.tts.chunk_size)  # テキスト分割器を追加
 
     def get_system_prompt(self, personality: str) -> str:
         """キャラクターに応じたシステムプロンプトを取得"""
-        return self.character_prompts.get(personality, self.character_prompts['yui_natural'])
+        return runtime_config.current.personality(personality).system_prompt
+
+    def get_text_splitter(self) -> TextSplitter:
+        """設定のチャンクサイズに合わせたテキスト分割器を取得（変更時は差し替え）"""
+        chunk_size = runtime_config.current.tts.chunk_size
+        if self.text_splitter.chunk_size != chunk_size:
+            self.text_splitter = TextSplitter(chunk_size)
+        return self.text_splitter
 
     def is_technical_topic(self, text: str) -> bool:
         """テキストが技術的な話題かどうかを判定"""
@@ -334,8 +454,9 @@ class AIConversationManager:
         else:
             return 'neutral'
     
-    async def generate_response_streaming(self, session_id: str, user_input: str, personality: str = 'yui_natural') -> None:
-        """ストリーミング応答生成 - チャンク単位で逐次処理"""
+    async def generate_response_streaming(self, session_id: str, user_input: str, personality: str = 'yui_natural',
+                                          turn: Optional[Turn] = None) -> None:
+        """ストリーミング応答生成 - チャンク単位で逐次処理（turn がキャンセルされたら打ち切る）"""
         try:
             perf_start = time.time()
             
@@ -348,21 +469,23 @@ class AIConversationManager:
             
             # Gemini ストリーミング応答開始
             try:
-                async for chunk in self.stream_gemini_response(primary_model, context, session_id, user_emotion, personality, is_tech_topic):
+                async for chunk in self.stream_gemini_response(get_primary_model(), context, session_id, user_emotion, personality, is_tech_topic, turn):
                     # チャンクが空でない場合のみ処理
                     if chunk and chunk.strip():
                         await asyncio.sleep(0)  # 他のタスクに制御を譲る
             except Exception as e:
                 logger.warning(f"Primary model streaming failed: {e}. Switching to fallback.")
-                async for chunk in self.stream_gemini_response(fallback_model, context, session_id, user_emotion, personality, is_tech_topic):
+                async for chunk in self.stream_gemini_response(get_fallback_model(), context, session_id, user_emotion, personality, is_tech_topic, turn):
                     if chunk and chunk.strip():
                         await asyncio.sleep(0)
             
             perf_end = time.time()
-            print(f"[PERF] Streaming response completed in: {perf_end - perf_start:.2f}s")
+            perf_log.info("[PERF] Streaming response completed in: %.2fs", perf_end - perf_start)
             
         except Exception as e:
             logger.error(f"Error in streaming response: {e}")
+            if turn and turn.is_cancelled:
+                return
             # エラー時は従来の方法にフォールバック
             response = await self.generate_response(session_id, user_input, personality)
             socketio.emit('message_response', {
@@ -374,32 +497,54 @@ class AIConversationManager:
                 'personality': personality,
                 'is_tech_excited': response.get('is_tech_excited', False),
                 'chunk_index': 0,
-                'is_final': True
+                'is_final': True,
+                'turn_id': turn.turn_id if turn else None
             })
     
-    async def stream_gemini_response(self, model, prompt: str, session_id: str, user_emotion: str, personality: str, is_tech_topic: bool):
-        """Gemini APIからストリーミング応答を取得し、チャンク処理"""
+    async def stream_gemini_response(self, model, prompt: str, session_id: str, user_emotion: str, personality: str, is_tech_topic: bool,
+                                     turn: Optional[Turn] = None):
+        """Gemini APIからストリーミング応答を取得し、チャンク処理
+
+        turn がキャンセルされたらストリームの読み出しをやめ、以降の音声合成・完了通知を行わない。
+        """
         full_response = ""
         chunk_index = 0
+        text_splitter = self.get_text_splitter()
         
-        try:
-            # Geminiの generate_content_stream を使用（レート制限対応）
+        async def open_stream():
+            # 非同期APIでストリーミング（生成中もイベントループと TTS ワーカーを止めない。レート制限対応）
             try:
-                response_stream = model.generate_content(prompt, stream=True)
+                return await model.generate_content_async(prompt, stream=True)
             except Exception as e:
                 if "429" in str(e) or "quota" in str(e).lower():
-                    logger.warning("Gemini rate limit exceeded, waiting 5 seconds...")
-                    await asyncio.sleep(5)  # 5秒待機
-                    response_stream = model.generate_content(prompt, stream=True)
-                else:
-                    raise
+                    backoff_ms = runtime_config.current.performance.rate_limit_backoff_ms
+                    logger.warning(f"Gemini rate limit exceeded, waiting {backoff_ms}ms...")
+                    await asyncio.sleep(backoff_ms / 1000)
+                    return await model.generate_content_async(prompt, stream=True)
+                raise
+        
+        try:
+            # カセットの記録・再生モードでは、上流とのやり取りを記録・再生する
+            response_stream = cassette.astream(
+                'gemini', fingerprint(getattr(model, 'model_name', ''), prompt), open_stream,
+                encode=lambda chunk: chunk.text, decode=ReplayedChunk, turn=turn
+            )
             
-            for chunk in response_stream:
+            async for chunk in response_stream:
+                if turn and turn.is_cancelled:
+                    # 残りの生成結果は読まずに捨てる（ストリームを閉じて上流の生成を止める）
+                    turn_registry.record('gemini_streams_aborted')
+                    stream_log.debug("Gemini stream aborted for superseded turn %s", turn.turn_id)
+                    close_stream = getattr(response_stream, 'aclose', None)
+                    if close_stream:
+                        await close_stream()
+                    return
+                
                 if chunk.text:
                     full_response += chunk.text
                     
                     # テキストを音声合成用に分割
-                    chunks = self.text_splitter.split_for_streaming(chunk.text)
+                    chunks = text_splitter.split_for_streaming(chunk.text)
                     
                     for text_chunk in chunks:
                         if text_chunk.strip():
@@ -412,7 +557,7 @@ class AIConversationManager:
                             
                             # キューイングされた音声合成開始
                             asyncio.create_task(self.process_audio_chunk(
-                                text_chunk, chunk_index, chunk_emotion, personality, session_id
+                                text_chunk, chunk_index, chunk_emotion, personality, session_id, turn
                             ))
                             
                             yield text_chunk
@@ -429,25 +574,27 @@ class AIConversationManager:
                 socketio.emit('streaming_complete', {
                     'session_id': session_id,
                     'total_chunks': chunk_index,
-                    'full_text': full_response
+                    'full_text': full_response,
+                    'turn_id': turn.turn_id if turn else None
                 })
                 
         except Exception as e:
             logger.error(f"Gemini streaming error: {e}")
             raise
     
-    async def process_audio_chunk(self, text: str, chunk_index: int, emotion: str, personality: str, session_id: str):
+    async def process_audio_chunk(self, text: str, chunk_index: int, emotion: str, personality: str, session_id: str,
+                                  turn: Optional[Turn] = None):
         """音声チャンクの並列処理 - キューイング対応版"""
         try:
-            print(f"[DEBUG] Queuing audio chunk {chunk_index}: '{text[:50]}...'")
+            stream_log.debug("Queuing audio chunk %d: '%.50s...'", chunk_index, text)
             
             # ElevenLabsキューワーカーを開始（初回のみ）
             await elevenlabs_queue.start_worker()
             
             # TTSリクエストをキューに追加
-            await elevenlabs_queue.add_tts_request(text, chunk_index, emotion, personality, session_id)
+            await elevenlabs_queue.add_tts_request(text, chunk_index, emotion, personality, session_id, turn)
             
-            print(f"[DEBUG] Audio chunk {chunk_index} added to queue. Queue size: {elevenlabs_queue.get_queue_size()}")
+            stream_log.debug("Audio chunk %d added to queue. Queue size: %d", chunk_index, elevenlabs_queue.get_queue_size())
             
         except Exception as e:
             logger.error(f"Error queuing audio chunk {chunk_index}: {e}")
@@ -459,19 +606,16 @@ class AIConversationManager:
                 'chunk_index': chunk_index,
                 'timestamp': datetime.now().isoformat(),
                 'personality': personality,
-                'session_id': session_id
+                'session_id': session_id,
+                'turn_id': turn.turn_id if turn else None
             }
-            print(f"[DEBUG] Emitting message_chunk (no audio) for chunk {chunk_index}")
+            stream_log.debug("Emitting message_chunk (no audio) for chunk %d", chunk_index)
             socketio.emit('message_chunk', chunk_data)
     
     def build_minimal_context(self, current_input: str, personality: str = 'yui_natural', is_tech_topic: bool = False) -> str:
         """軽量化されたキャラクタープロンプト（速度と個性のバランス）"""
-        if personality == 'yui_natural':
-            return f"ユイ:天然で優しい女の子。「〜♪」「〜だよ」と話す。\n{current_input}"
-        elif personality == 'rei_engineer':
-            return f"レイ:クールなエンジニア。短く的確に答える。技術話は詳しく。\n{current_input}"
-        else:
-            return f"ユイ:天然で優しい女の子。「〜♪」「〜だよ」と話す。\n{current_input}"
+        return runtime_config.current.personality(personality).streaming_template.render(current_input)
+
     async def generate_response(self, session_id: str, user_input: str, personality: str = 'yui_natural') -> Dict:
         """AI応答を生成 - フォールバック用"""
         try:
@@ -486,10 +630,10 @@ class AIConversationManager:
             
             # Gemini APIで応答生成
             try:
-                response = await self.call_gemini_api(primary_model, context)
+                response = await self.call_gemini_api(get_primary_model(), context)
             except Exception as e:
                 logger.warning(f"Primary model failed: {e}. Switching to fallback.")
-                response = await self.call_gemini_api(fallback_model, context)
+                response = await self.call_gemini_api(get_fallback_model(), context)
             
             # 応答の感情分析
             response_emotion = self.analyze_emotion(response)
@@ -500,7 +644,7 @@ class AIConversationManager:
             asyncio.create_task(self.save_conversation_async(session_id, user_input, response, user_emotion, response_emotion))
             
             perf_end = time.time()
-            print(f"[PERF] Response generation: {perf_end - perf_start:.2f}s")
+            perf_log.info("[PERF] Response generation: %.2fs", perf_end - perf_start)
             
             return {
                 'text': response,
@@ -526,10 +670,12 @@ class AIConversationManager:
             logger.error(f"Error saving conversation: {e}")
     
     async def call_gemini_api(self, model, prompt: str) -> str:
-        """Gemini APIを呼び出し"""
+        """Gemini APIを呼び出し（非同期APIを使い、イベントループをブロックしない）"""
         try:
-            response = model.generate_content(prompt)
-            return response.text
+            async def fetch_text():
+                response = await model.generate_content_async(prompt)
+                return response.text
+            return await cassette.acall('gemini', fingerprint(getattr(model, 'model_name', ''), prompt), fetch_text)
         except Exception as e:
             raise Exception(f"Gemini API error: {e}")
 
@@ -547,6 +693,7 @@ class ElevenLabsQueue:
         """ワーカータスクを開始"""
         if not self._worker_started:
             self._worker_started = True
+            loop_monitor.watch_current_loop()
             asyncio.create_task(self._process_queue())
     
     async def _process_queue(self):
@@ -578,19 +725,37 @@ class ElevenLabsQueue:
             emotion = task_data['emotion']
             personality = task_data['personality']
             session_id = task_data['session_id']
+            turn = task_data.get('turn')
+            
+            # 置き換えられたターンの音声は合成しない（クォータを使わず、新しい応答を待たせない）
+            if turn and turn.is_cancelled:
+                turn_registry.record('tts_requests_skipped')
+                tts_log.debug("Skipping queued TTS for chunk %d of superseded turn %s", chunk_index, turn.turn_id)
+                return
             
-            print(f"[DEBUG] Processing queued TTS for chunk {chunk_index}")
+            tts_log.debug("Processing queued TTS for chunk %d", chunk_index)
             
             # 音声合成実行
             tts_start = time.time()
-            audio_data = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                tts_manager.synthesize_speech_optimized, 
-                text
+            tts_timeout = runtime_config.current.performance.tts_timeout_ms / 1000
+            audio_data = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(
+                    None,
+                    tts_manager.synthesize_speech_optimized,
+                    text,
+                    None,
+                    personality,
+                    client_audio_profiles.format_for(session_id),
+                    turn
+                ),
+                timeout=tts_timeout
             )
             tts_time = time.time() - tts_start
-            print(f"[PERF] Queued audio chunk {chunk_index} synthesized in {tts_time:.2f}s")
-            print(f"[DEBUG] Audio data present: {audio_data is not None}")
+            perf_log.debug("[PERF] Queued audio chunk %d synthesized in %.2fs (audio: %s)",
+                           chunk_index, tts_time, audio_data is not None)
+            
+            if turn and turn.is_cancelled:
+                return
             
             # 結果をSocketIOで送信
             chunk_data = {
@@ -600,15 +765,18 @@ class ElevenLabsQueue:
                 'chunk_index': chunk_index,
                 'timestamp': datetime.now().isoformat(),
                 'personality': personality,
-                'session_id': session_id
+                'session_id': session_id,
+                'turn_id': turn.turn_id if turn else None
             }
             
-            print(f"[DEBUG] Emitting message_chunk for queued chunk {chunk_index}")
             socketio.emit('message_chunk', chunk_data)
-            print(f"[DEBUG] message_chunk emitted for queued chunk {chunk_index}")
+            stream_log.debug("message_chunk emitted for queued chunk %d", chunk_index)
             
         except Exception as e:
             logger.error(f"Error executing queued TTS task for chunk {task_data.get('chunk_index', 'unknown')}: {e}")
+            turn = task_data.get('turn')
+            if turn and turn.is_cancelled:
+                return
             # エラー時も空音声でレスポンス送信
             socketio.emit('message_chunk', {
                 'text': task_data['text'],
@@ -617,22 +785,24 @@ class ElevenLabsQueue:
                 'chunk_index': task_data['chunk_index'],
                 'timestamp': datetime.now().isoformat(),
                 'personality': task_data['personality'],
-                'session_id': task_data['session_id']
+                'session_id': task_data['session_id'],
+                'turn_id': turn.turn_id if turn else None
             })
     
-    async def add_tts_request(self, text: str, chunk_index: int, emotion: str, personality: str, session_id: str):
+    async def add_tts_request(self, text: str, chunk_index: int, emotion: str, personality: str, session_id: str,
+                              turn: Optional[Turn] = None):
         """TTSリクエストをキューに追加"""
         task_data = {
             'text': text,
             'chunk_index': chunk_index,
             'emotion': emotion,
             'personality': personality,
-            'session_id': session_id
+            'session_id': session_id,
+            'turn': turn
         }
         
-        print(f"[DEBUG] Adding TTS request to queue for chunk {chunk_index}")
         await self.queue.put(task_data)
-        print(f"[DEBUG] Queue size after adding chunk {chunk_index}: {self.queue.qsize()}")
+        tts_log.debug("Queue size after adding chunk %d: %d", chunk_index, self.queue.qsize())
     
     def get_queue_size(self):
         """現在のキューサイズを取得"""
@@ -644,39 +814,34 @@ class TTSManager:
     @staticmethod
     def get_available_voices() -> List[Dict]:
         """利用可能な音声一覧を取得"""
-        global AVAILABLE_VOICES
-        
-        if not elevenlabs_client:
+        if not get_elevenlabs_client():
             logger.error("ElevenLabs client not initialized. Check API key.")
             return []
         
-        try:
-            if not AVAILABLE_VOICES:  # キャッシュがない場合のみAPI呼び出し
-                voices = elevenlabs_client.voices.get_all()
-                AVAILABLE_VOICES = [
-                    {
-                        'id': voice.voice_id,
-                        'name': voice.name,
-                        'category': voice.category if hasattr(voice, 'category') else 'general',
-                        'description': voice.description if hasattr(voice, 'description') else voice.name
-                    }
-                    for voice in voices.voices
-                ]
-                logger.info(f"Successfully cached {len(AVAILABLE_VOICES)} ElevenLabs voices.")
-            
-            return AVAILABLE_VOICES
-        except Exception as e:
-            logger.error(f"Failed to get ElevenLabs voices: {e}")
-            return []
+        return voice_catalog.get()
+    
+    @staticmethod
+    def fetch_voices() -> List[Dict]:
+        """ElevenLabs APIから音声一覧を取得（キャッシュなし・失敗時は例外）"""
+        voices = get_elevenlabs_client().voices.get_all()
+        return [
+            {
+                'id': voice.voice_id,
+                'name': voice.name,
+                'category': voice.category if hasattr(voice, 'category') else 'general',
+                'description': voice.description if hasattr(voice, 'description') else voice.name
+            }
+            for voice in voices.voices
+        ]
     
     @staticmethod
     def get_default_voice_id() -> Optional[str]:
-        """デフォルトの音声IDを取得"""
-        voices = TTSManager.get_available_voices()
+        """デフォルトの音声IDを取得（ターン処理をブロックしないようキャッシュのみ参照）"""
+        voices = voice_catalog.get(block=False) if get_elevenlabs_client() else []
         
         if not voices:
-            # フォールバック: ユイの音声ID
-            return "vGQNBgLaiM3EdZtxIiuY"
+            # フォールバック: 設定のデフォルト音声ID
+            return runtime_config.current.tts.default_voice_id
         
         # 最初の利用可能な音声を返す
         return voices[0]['id']
@@ -684,17 +849,22 @@ class TTSManager:
     @staticmethod
     def get_character_voice_id(personality: str) -> Optional[str]:
         """キャラクター別の音声IDを取得"""
-        character_voices = {
-            'yui_natural': 'vGQNBgLaiM3EdZtxIiuY',  # kawaii
-            'rei_engineer': 'gARvXPexe5VF3cKZBian',  # mitsuki
-        }
+        config = runtime_config.current
+        if personality in config.personalities and config.personalities[personality].voice_id:
+            return config.personalities[personality].voice_id
         
-        return character_voices.get(personality, TTSManager.get_default_voice_id())
+        return TTSManager.get_default_voice_id()
     
     @staticmethod
-    def synthesize_speech_optimized(text: str, voice_id: str = None, personality: str = None) -> Optional[str]:
-        """ElevenLabs APIで音声合成（エラーハンドリング強化版）"""
-        if not elevenlabs_client:
+    def synthesize_speech_optimized(text: str, voice_id: str = None, personality: str = None,
+                                    output_format: str = None, turn: Optional[Turn] = None) -> Optional[str]:
+        """ElevenLabs APIで音声合成（エラーハンドリング強化版）
+
+        output_format を省略すると設定のデフォルト形式を使う。結果は形式ごとにキャッシュする。
+        turn がキャンセルされた場合は合成を始めない、または受信中のストリームを打ち切って None を返す。
+        """
+        elevenlabs_client = get_elevenlabs_client()
+        if not elevenlabs_client and not cassette.replaying:
             logger.error("ElevenLabs client not initialized. Check API key.")
             return None
         
@@ -714,51 +884,118 @@ class TTSManager:
                 logger.error("No valid voice ID available")
                 return None
         
+        model_id = None
         try:
-            print(f"[DEBUG] Starting TTS for text: '{text[:50]}...' with voice: {voice_id}")
+            tts_log.debug("Starting TTS for text: '%.50s...' with voice: %s", text, voice_id)
             
-            # 短いテキストの場合はより高速な設定を使用
-            model_id = "eleven_turbo_v2_5" if len(text) <= 100 else "eleven_multilingual_v2"
+            tts_config = runtime_config.current.tts
+            audio_format = get_audio_format(output_format or tts_config.output_format)
+            # 品質の高い順。どちらのモデルで合成済みでもキャッシュを使う
+            candidate_models = list(dict.fromkeys([tts_config.quality_model, tts_config.fast_model]))
+            for candidate in candidate_models:
+                cached = audio_cache.get((voice_id, candidate, audio_format.format_id, text))
+                if cached:
+                    tts_log.debug("TTS cache hit (%s, %s)", candidate, audio_format.format_id)
+                    return cached
+            
+            if turn and turn.is_cancelled:
+                turn_registry.record('tts_requests_skipped')
+                return None
+            
+            # ターンの残り時間に収まる範囲で品質の高いモデルを選ぶ（無効時は文字数で切り替え）
+            max_response_time_ms = runtime_config.current.performance.max_response_time_ms
+            elapsed_ms = (time.time() - turn.started_at) * 1000 if turn else 0.0
+            model_id = tts_model_router.choose(
+                candidate_models, len(text), voice_id, max_response_time_ms - elapsed_ms,
+                fallback_model=tts_config.fast_model if len(text) <= tts_config.fast_model_max_chars else tts_config.quality_model
+            )
+            cache_key = (voice_id, model_id, audio_format.format_id, text)
+            synthesis_start = time.perf_counter()
             
             # ElevenLabs APIで音声合成
-            audio_generator = elevenlabs_client.text_to_speech.convert(
-                text=text,
-                voice_id=voice_id,
-                model_id=model_id,
-                output_format="mp3_22050_32"  # 低品質だが高速
+            audio_generator = cassette.stream(
+                'elevenlabs', fingerprint(text, voice_id, model_id, audio_format.format_id),
+                lambda: elevenlabs_client.text_to_speech.convert(
+                    text=text,
+                    voice_id=voice_id,
+                    model_id=model_id,
+                    output_format=audio_format.format_id
+                ),
+                turn=turn
             )
             
             # 音声データを収集
             audio_data = b""
             chunk_count = 0
             for chunk in audio_generator:
+                if turn and turn.is_cancelled:
+                    # 受信中のストリームを閉じ、残りの音声は受け取らない
+                    turn_registry.record('tts_streams_aborted')
+                    close_stream = getattr(audio_generator, 'close', None)
+                    if close_stream:
+                        close_stream()
+                    tts_log.debug("TTS stream aborted for superseded turn %s", turn.turn_id)
+                    return None
                 audio_data += chunk
                 chunk_count += 1
             
-            print(f"[DEBUG] TTS completed: {chunk_count} chunks, {len(audio_data)} bytes")
+            tts_log.debug("TTS completed: %d chunks, %d bytes (%s)", chunk_count, len(audio_data), audio_format.format_id)
             
             if not audio_data:
                 logger.error("No audio data received from ElevenLabs")
+                tts_model_router.record(model_id, len(text), voice_id, None)
                 return None
+            tts_model_router.record(model_id, len(text), voice_id, (time.perf_counter() - synthesis_start) * 1000)
             
             # Base64エンコードして返す
             audio_b64 = base64.b64encode(audio_data).decode('utf-8')
-            result = f"data:audio/mpeg;base64,{audio_b64}"
+            result = f"data:{audio_format.mime_type};base64,{audio_b64}"
+            audio_cache.put(cache_key, result)
             
-            print(f"[DEBUG] TTS successful: {len(result)} characters in base64")
+            tts_log.debug("TTS successful: %d characters in base64", len(result))
             return result
             
         except Exception as e:
             logger.error(f"ElevenLabs synthesis error: {e}")
-            print(f"[DEBUG] TTS failed for text: '{text[:50]}...'")
+            if model_id:
+                tts_model_router.record(model_id, len(text), voice_id, None)
+            tts_log.debug("TTS failed for text: '%.50s...'", text)
             return None
 
 class STTManager:
     """音声認識システムの管理クラス"""
     
     @staticmethod
-    async def transcribe_audio(audio_data: bytes) -> Optional[str]:
-        """AssemblyAI APIで音声認識 (aiohttp版)"""
+    async def transcribe_audio(audio_data: bytes, turn: Optional[Turn] = None) -> Optional[str]:
+        """AssemblyAI APIで音声認識。turn がキャンセルされたらポーリングをやめて None を返す
+
+        カセットの記録・再生モードでは、音声データごとの認識結果を記録・再生する。
+        """
+        return await cassette.acall(
+            'assemblyai', fingerprint(audio_data),
+            lambda: STTManager._transcribe_remote(audio_data, turn), turn=turn
+        )
+
+    @staticmethod
+    async def _fetch_for_turn(turn: Optional[Turn], method: str, url: str, **kwargs):
+        """共有HTTPクライアントでリクエストし、ターンがキャンセルされたら通信中でも打ち切る（CancelledError）"""
+        task = asyncio.ensure_future(http_clients.fetch_json(method, url, **kwargs))
+        if turn is None:
+            return await task
+        loop = asyncio.get_running_loop()
+
+        def abort():
+            loop.call_soon_threadsafe(task.cancel)
+
+        turn.add_cancel_callback(abort)
+        try:
+            return await task
+        finally:
+            turn.remove_cancel_callback(abort)
+
+    @staticmethod
+    async def _transcribe_remote(audio_data: bytes, turn: Optional[Turn] = None) -> Optional[str]:
+        """AssemblyAI APIで音声認識（共有HTTPクライアント経由。ターンがキャンセルされたら通信を打ち切って None）"""
         upload_url = 'https://api.assemblyai.com/v2/upload'
         transcript_url = 'https://api.assemblyai.com/v2/transcript'
         
@@ -767,45 +1004,46 @@ class STTManager:
         }
 
         try:
-            connector = TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                # 1. 音声データをアップロード
-                async with session.post(upload_url, headers=headers, data=audio_data) as response:
-                    if response.status != 200:
-                        logger.error(f"AssemblyAI upload failed: {response.status}")
-                        return None
-                    upload_response_json = await response.json()
-                    audio_url = upload_response_json['upload_url']
-
-                # 2. 転写リクエスト
-                transcript_request = {'audio_url': audio_url, 'language_code': 'ja'}
-                async with session.post(transcript_url, headers=headers, json=transcript_request) as response:
-                    if response.status != 200:
-                        logger.error(f"AssemblyAI transcription request failed: {response.status}")
-                        return None
-                    transcript_response_json = await response.json()
-                    transcript_id = transcript_response_json['id']
-
-                # 3. 結果ポーリング
-                polling_endpoint = f"{transcript_url}/{transcript_id}"
-                while True:
-                    async with session.get(polling_endpoint, headers=headers) as response:
-                        if response.status != 200:
-                            logger.error(f"AssemblyAI polling failed: {response.status}")
-                            return None
-                        
-                        result_json = await response.json()
-                        status = result_json['status']
-
-                        if status == 'completed':
-                            return result_json['text']
-                        elif status == 'error':
-                            logger.error(f"AssemblyAI transcription error: {result_json.get('error')}")
-                            return None
-                        
-                        # 次のポーリングまで待機
-                        await asyncio.sleep(3)
+            # 1. 音声データをアップロード
+            status, body = await STTManager._fetch_for_turn(turn, 'POST', upload_url, headers=headers, data=audio_data)
+            if status != 200:
+                logger.error(f"AssemblyAI upload failed: {status}")
+                return None
+            audio_url = body['upload_url']
 
+            # 2. 転写リクエスト
+            transcript_request = {'audio_url': audio_url, 'language_code': 'ja'}
+            status, body = await STTManager._fetch_for_turn(turn, 'POST', transcript_url, headers=headers, json=transcript_request)
+            if status != 200:
+                logger.error(f"AssemblyAI transcription request failed: {status}")
+                return None
+            transcript_id = body['id']
+
+            # 3. 結果ポーリング（同じホストへの接続はプールで使い回される）
+            polling_endpoint = f"{transcript_url}/{transcript_id}"
+            while True:
+                if turn and turn.is_cancelled:
+                    return None
+                status, result_json = await STTManager._fetch_for_turn(turn, 'GET', polling_endpoint, headers=headers)
+                if status != 200:
+                    logger.error(f"AssemblyAI polling failed: {status}")
+                    return None
+
+                transcript_status = result_json['status']
+                if transcript_status == 'completed':
+                    return result_json['text']
+                elif transcript_status == 'error':
+                    logger.error(f"AssemblyAI transcription error: {result_json.get('error')}")
+                    return None
+
+                # 次のポーリングまで待機
+                await asyncio.sleep(runtime_config.current.stt.poll_interval_ms / 1000)
+
+        except asyncio.CancelledError:
+            if turn and turn.is_cancelled:
+                stream_log.debug("AssemblyAI request aborted for superseded turn %s", turn.turn_id)
+                return None
+            raise
         except Exception as e:
             logger.error(f"STT error: {e}")
             return None
@@ -813,9 +1051,121 @@ class STTManager:
 # --- ここから下をすべて書き換える ---
 
 # Initialize managers
-memory_manager = MemoryManager(DATABASE_PATH)
+memory_manager = MemoryManager(DATABASE_PATH, lazy=True,
+                               shard_count_provider=lambda: runtime_config.current.memory.shard_count)
 tts_manager = TTSManager()
+voice_catalog = VoiceCatalog(TTSManager.fetch_voices, snapshot_path=VOICE_CATALOG_SNAPSHOT_PATH)
+memory_maintenance = ShardedMaintenance(
+    memory_manager.all_paths,
+    lambda: runtime_config.current.memory.maintenance,
+    on_profile_changed=memory_manager.invalidate_profile
+)
 stt_manager = STTManager()
+stt_preprocess_stats = PreprocessStats()
+turn_registry = TurnRegistry()
+turn_scheduler = TurnScheduler(lambda: runtime_config.current.performance.turn_scheduler)
+loop_monitor = LoopLagMonitor(lambda: runtime_config.current.performance.loop_monitor)
+client_audio_profiles = ClientAudioProfiles()
+audio_cache = AudioCache(lambda: runtime_config.current.tts.audio_cache_entries)
+tts_model_router = TTSModelRouter(lambda: runtime_config.current.tts.routing)
+cassette = Cassette(lambda: runtime_config.current.performance.cassette)
+http_clients = HttpClientManager(lambda: runtime_config.current.performance.http_client)
+message_dedupe = MessageDeduplicator(lambda: runtime_config.current.performance.message_dedupe)
+sampling_profiler = SamplingProfiler(lambda: runtime_config.current.performance.profiler)
+filler_bank = FillerBank(FILLER_AUDIO_DIR, lambda: runtime_config.current.tts.fillers)
+# 管理API（/api/admin/tuning）のトークンは環境変数 ADMIN_API_TOKEN（未設定なら無効）
+runtime_tuner = RuntimeTuner(runtime_config, TUNING_AUDIT_LOG_PATH, lambda: os.getenv('ADMIN_API_TOKEN'))
+
+def on_turn_scheduler_config_reload(old_config: RuntimeConfig, new_config: RuntimeConfig):
+    """ワーカー数の変更を反映する（待機中のターンはそのまま）"""
+    if old_config.performance.turn_scheduler != new_config.performance.turn_scheduler:
+        turn_scheduler.resize()
+
+runtime_config.add_listener(on_turn_scheduler_config_reload)
+asset_manifest_builder = AssetManifestBuilder(MODELS_DIR, BACKGROUNDS_DIR)
+
+def warmup_database():
+    """スキーマを作成し、DBファイルとページキャッシュを温める"""
+    memory_manager.ensure_initialized()
+    memory_manager.get_conversation_history('__warmup__', limit=1)
+
+def warmup_gemini():
+    """モデルを生成し、モデル情報の取得で上流への接続（DNS・TLS）を確立しておく"""
+    primary_model_name = runtime_config.current.gemini.primary_model
+    get_gemini_models()
+    genai.get_model(f"models/{primary_model_name}")
+
+def warmup_elevenlabs():
+    """クライアントを生成し、音声一覧の取得で接続と音声キャッシュを温める"""
+    if not get_elevenlabs_client():
+        raise RuntimeError("ElevenLabs API key not configured")
+    if not TTSManager.get_available_voices():
+        raise RuntimeError("Voice list could not be loaded")
+
+def warmup_assemblyai():
+    """AssemblyAIのDNS解決を済ませておく"""
+    socket.getaddrinfo('api.assemblyai.com', 443)
+
+def synthesize_filler(text: str, voice_id: str, model_id: str, output_format: str) -> bytes:
+    """フィラー音声を合成（保存済みでないフレーズの準備時のみ。ターンの処理中には呼ばない）"""
+    elevenlabs_client = get_elevenlabs_client()
+    if elevenlabs_client is None:
+        raise RuntimeError("ElevenLabs API key not configured")
+    return b''.join(elevenlabs_client.text_to_speech.convert(
+        text=text, voice_id=voice_id, model_id=model_id, output_format=output_format
+    ))
+
+def warmup_fillers(config: Optional[RuntimeConfig] = None):
+    """キャラクターごとのフィラー音声を読み込む（保存されていないものだけ合成して保存する）"""
+    config = config or runtime_config.current
+    settings = filler_bank.settings()
+    filler_bank.prepare(
+        {key: personality.fillers for key, personality in config.personalities.items()},
+        TTSManager.get_character_voice_id,
+        synthesize_filler if get_elevenlabs_client() else None,
+        settings['model'] or config.tts.quality_model,
+        get_audio_format(settings['output_format'] or config.tts.output_format),
+    )
+
+def on_filler_config_reload(old_config: RuntimeConfig, new_config: RuntimeConfig):
+    """フレーズや音声が変わったら、フィラーを読み込み直す（初回はウォームアップで行う）"""
+    if filler_bank.last_prepare is None:
+        return
+    if old_config.tts.fillers == new_config.tts.fillers and all(
+        old_config.personality(key).fillers == personality.fillers
+        and old_config.personality(key).voice_id == personality.voice_id
+        for key, personality in new_config.personalities.items()
+    ):
+        return
+    threading.Thread(target=warmup_fillers, args=(new_config,), name='filler-reload', daemon=True).start()
+
+runtime_config.add_listener(on_filler_config_reload)
+
+def warmup_asset_manifest():
+    """アセットのハッシュを事前計算しておく"""
+    asset_manifest_builder.build(runtime_config.current.raw)
+
+warmup_manager.add_step('runtime_config', runtime_config.ensure_loaded)
+warmup_manager.add_step('database', warmup_database)
+warmup_manager.add_step('gemini', warmup_gemini)
+warmup_manager.add_step('elevenlabs', warmup_elevenlabs)
+warmup_manager.add_step('fillers', warmup_fillers)
+warmup_manager.add_step('assemblyai', warmup_assemblyai)
+warmup_manager.add_step('asset_manifest', warmup_asset_manifest)
+
+def start_background_services():
+    """ログの書き出しスレッド・設定ファイル監視・ウォームアップを開始（何度呼んでも一度だけ実行される）"""
+    log_pipeline.configure()
+    runtime_config.start_watcher()
+    warmup_manager.start()
+    memory_maintenance.start()
+    turn_scheduler.start()
+
+@app.before_request
+def before_request():
+    """最初のリクエスト時刻を記録し、未開始ならバックグラウンド処理を開始"""
+    warmup_manager.mark_request()
+    start_background_services()
 
 @app.route('/')
 def index():
@@ -825,7 +1175,9 @@ def index():
 @app.route('/models/<path:filename>')
 def serve_models(filename):
     """VRM/VRMAモデルファイルを提供"""
-    return send_from_directory('../models', filename)
+    # フィンガープリント付きURLは内容が変わらないため長期キャッシュさせる
+    max_age = IMMUTABLE_MAX_AGE if request.args.get('v') else None
+    return send_from_directory('../models', filename, max_age=max_age)
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
@@ -840,13 +1192,32 @@ def serve_js(filename):
 @app.route('/backgrounds/<path:filename>')
 def serve_backgrounds(filename):
     """背景画像ファイルを提供"""
-    return send_from_directory('../frontend/backgrounds', filename)
+    max_age = IMMUTABLE_MAX_AGE if request.args.get('v') else None
+    return send_from_directory('../frontend/backgrounds', filename, max_age=max_age)
+
+@app.route('/api/assets/manifest')
+def get_asset_manifest():
+    """キャラクター・アニメーション・背景のプリロード用マニフェストを取得"""
+    try:
+        manifest = asset_manifest_builder.build(runtime_config.current.raw)
+        etag = f'"{manifest["version"]}"'
+        if request.headers.get('If-None-Match') == etag:
+            return '', 304, {'ETag': etag}
+
+        response = jsonify(manifest)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        logger.error(f"Exception in get_asset_manifest: {e}")
+        return jsonify({"error": "An internal error occurred"}), 500
 
 
 @app.route('/api/voices')
 def get_voices():
     """ElevenLabsの音声一覧を取得"""
-    if not elevenlabs_client:
+    if not get_elevenlabs_client():
         return jsonify({"error": "ElevenLabs API key not configured"}), 500
 
     try:
@@ -859,8 +1230,8 @@ def get_voices():
             "voices": voices,
             "default_voice_id": TTSManager.get_default_voice_id(),
             "character_voices": {
-                'yui_natural': TTSManager.get_character_voice_id('yui_natural'),
-                'rei_engineer': TTSManager.get_character_voice_id('rei_engineer')
+                personality: TTSManager.get_character_voice_id(personality)
+                for personality in runtime_config.current.personalities
             }
         })
 
@@ -868,6 +1239,154 @@ def get_voices():
         logger.error(f"Exception in get_voices: {e}")
         return jsonify({"error": "An internal error occurred"}), 500
 
+@app.route('/api/audio/formats')
+def get_audio_formats():
+    """セッションごとの音声出力形式の内訳と、音声キャッシュの状況を取得"""
+    return jsonify({
+        'default_format': runtime_config.current.tts.output_format,
+        'sessions': client_audio_profiles.stats(),
+        'cache': audio_cache.stats(),
+    })
+
+@app.route('/api/turns')
+def get_turn_stats():
+    """ターンの開始・置き換え数、キャンセルで省略した処理の件数と、スケジューラの待ち時間を取得"""
+    return jsonify(dict(turn_registry.snapshot(), scheduler=turn_scheduler.stats()))
+
+@app.route('/api/metrics/loop-lag')
+def get_loop_lag():
+    """イベントループのスケジューリング遅延の分布と、直近にループをブロックしたスタックを取得"""
+    return jsonify(loop_monitor.report())
+
+@app.route('/api/cassette')
+def get_cassette_status():
+    """カセット（上流APIの記録・再生）のモードと、サービスごとの呼び出し回数・所要時間を取得"""
+    return jsonify(cassette.report())
+
+def _admin_actor() -> str:
+    return request.headers.get('X-Admin-Actor', '')
+
+def _require_admin():
+    """管理APIの認証（Authorization: Bearer <ADMIN_API_TOKEN>）。失敗時はエラー応答を返す"""
+    if not runtime_tuner.enabled:
+        return jsonify({"error": "Admin API is disabled (ADMIN_API_TOKEN not set)"}), 503
+    token = request.headers.get('Authorization', '')
+    token = token[len('Bearer '):] if token.startswith('Bearer ') else request.headers.get('X-Admin-Token')
+    if not runtime_tuner.authorize(token):
+        if request.method != 'GET':
+            runtime_tuner.record_denied(_admin_actor(), request.remote_addr)
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@app.route('/api/admin/tuning', methods=['GET', 'PATCH'])
+def admin_tuning():
+    """実行中の性能設定を参照・変更（PATCH {"set": {パス: 値}, "reset": [パス], "reason": "..."}）
+
+    変更はまとめて1回で反映し、監査ログに記録する。プロセスの再起動で元に戻るため、
+    恒久的な変更は app_config.yml に反映すること。
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    if request.method == 'GET':
+        return jsonify(runtime_tuner.snapshot())
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('set', {}), dict) or not isinstance(body.get('reset', []), list):
+        return jsonify({"error": "Expected a JSON object with 'set' and/or 'reset'"}), 400
+    try:
+        entry = runtime_tuner.apply(
+            body.get('set') or {}, body.get('reset') or [],
+            actor=_admin_actor() or str(body.get('actor', '')), remote_addr=request.remote_addr,
+            reason=str(body.get('reason', ''))
+        )
+    except TuningError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(dict(entry, settings=runtime_tuner.snapshot()['settings']))
+
+@app.route('/api/admin/profile')
+def admin_profile():
+    """稼働中のサーバーを seconds 秒間サンプリングし、フレームグラフ用のプロファイルを返す
+
+    ?seconds=10&interval_ms=10&format=collapsed|speedscope&idle=0|1
+    collapsed は flamegraph.pl 等の入力形式（テキスト）、speedscope は https://www.speedscope.app で開ける JSON。
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    output_format = request.args.get('format', 'collapsed')
+    if output_format not in ('collapsed', 'speedscope'):
+        return jsonify({"error": "format must be 'collapsed' or 'speedscope'"}), 400
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args['interval_ms']) if request.args.get('interval_ms') else None
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    include_idle = request.args.get('idle') in ('1', 'true') if request.args.get('idle') else None
+
+    try:
+        profile = sampling_profiler.profile(seconds, interval_ms, include_idle)
+    except ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+
+    logger.info(f"Profile captured by {_admin_actor() or request.remote_addr}: {profile.summary()}")
+    stamp = datetime.fromtimestamp(profile.started_at).strftime('%Y%m%d-%H%M%S')
+    if output_format == 'speedscope':
+        response = Response(json.dumps(profile.to_speedscope()), mimetype='application/json')
+        response.headers['Content-Disposition'] = f'attachment; filename=profile-{stamp}.speedscope.json'
+    else:
+        response = Response(profile.to_collapsed(), mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename=profile-{stamp}.collapsed.txt'
+    response.headers['X-Profile-Samples'] = str(profile.samples)
+    return response
+
+@app.route('/api/admin/tuning/audit')
+def admin_tuning_audit():
+    """設定変更の監査ログ（新しい順、?limit=件数）"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({'entries': runtime_tuner.audit_log(min(max(limit, 1), 1000))})
+
+@app.route('/api/metrics/dedupe')
+def get_message_dedupe_stats():
+    """メッセージIDによる重複排除の件数（新規・処理中の再送・完了後の再送・期限切れ）を取得"""
+    return jsonify(message_dedupe.report())
+
+@app.route('/api/metrics/logging')
+def get_logging_stats():
+    """ログパイプラインの状態（キューの滞留・破棄・サンプリングで間引いた件数、サブシステム別のレベル）を取得"""
+    return jsonify(log_pipeline.stats())
+
+@app.route('/api/metrics/http')
+def get_http_client_metrics():
+    """上流ホストごとの接続プール使用状況（同時リクエスト数・接続の新規作成/再利用・プール待ち）を取得"""
+    return jsonify(http_clients.report())
+
+@app.route('/api/metrics/voices')
+def get_voice_catalog_stats():
+    """音声一覧キャッシュの状態（ヒット・期限切れでのヒット・取得と失敗の回数、連続失敗数、次の再試行まで）を取得"""
+    return jsonify(voice_catalog.stats())
+
+@app.route('/api/tts/fillers')
+def get_filler_stats():
+    """キャラクター・感情ごとのフィラー音声の数と、送信回数を取得"""
+    return jsonify(filler_bank.report())
+
+@app.route('/api/tts/routing')
+def get_tts_routing_stats():
+    """TTSモデルの選択回数（理由別）と、モデル・長さ・音声ごとのレイテンシ推定を取得"""
+    return jsonify(tts_model_router.report())
+
+@app.route('/api/stt/preprocessing')
+def get_stt_preprocessing_stats():
+    """STT前処理で削減したバイト数・音声長と、STTの平均レイテンシを取得"""
+    return jsonify(stt_preprocess_stats.summary())
+
 def analyze_emotion_simple(text: str) -> str:
     """テキストから感情を分析（簡易版）"""
     positive_words = ['嬉しい', '楽しい', '幸せ', '好き', 'ありがとう', '素晴らしい', 'わくわく']
@@ -884,12 +1403,40 @@ def analyze_emotion_simple(text: str) -> str:
         return 'neutral'
 
 def build_prompt(personality: str, user_input: str) -> str:
-    """キャラクターに応じたプロンプトを構築"""
-    prompts = {
-        'rei_engineer': f"あなたはレイという名前のクールな女性エンジニアです。常に簡潔かつ的確に答えます。技術的な話題には特に情熱的になります。  \nユーザー: {user_input}\nレイ:",
-        'yui_natural': f"あなたはユイという名前の、少し天然で心優しい女の子です。「〜だよ」「〜だね♪」といった親しみやすい口調で話します。   \nユーザー: {user_input}\nユイ:",
-    }
-    return prompts.get(personality, prompts['yui_natural'])
+    """キャラクターに応じたプロンプトを構築（事前コンパイル済みテンプレートを使用）"""
+    return runtime_config.current.personality(personality).full_template.render(user_input)
+
+def begin_turn(session_id: str) -> Turn:
+    """新しいターンを開始し、置き換えた旧ターンがあればクライアントに通知（再生中の音声を止めさせる）"""
+    turn, previous = turn_registry.begin(session_id)
+    if previous is not None:
+        emit('turn_superseded', {
+            'session_id': session_id,
+            'turn_id': previous.turn_id,
+            'superseded_by': turn.turn_id,
+        })
+    return turn
+
+def generate_text_for_turn(model, prompt: str, turn: Turn) -> Optional[str]:
+    """Gemini の応答をストリーミングで受け取り、ターンがキャンセルされたら読み出しを打ち切る（None を返す）
+
+    ターンスケジューラのワーカースレッドで実行するため、同期 API のまま呼ぶ（待つ間に止まるのはこのワーカーだけで、
+    イベントループは止めない。同時実行数は turn_scheduler.max_workers で決まる）。
+    非同期 API（generate_content_async）を使うのは AIConversationManager のストリーミング経路のみ。
+    """
+    response_text = ""
+    chunks = cassette.stream(
+        'gemini', fingerprint(getattr(model, 'model_name', ''), prompt),
+        lambda: model.generate_content(prompt, stream=True),
+        encode=lambda chunk: chunk.text or "", decode=ReplayedChunk, turn=turn
+    )
+    for chunk in chunks:
+        if turn.is_cancelled:
+            turn_registry.record('gemini_streams_aborted')
+            chunks.close()
+            return None
+        response_text += chunk.text or ""
+    return response_text
 
 @socketio.on('connect')
 def handle_connect():
@@ -897,14 +1444,125 @@ def handle_connect():
     logger.info('Client connected')
     emit('connected', {'status': 'Connected to AI Wife server'})
 
+@socketio.on('client_capabilities')
+def handle_client_capabilities(data):
+    """クライアントの対応コーデックから、セッションの音声出力形式を決める"""
+    session_id = data.get('session_id', 'default')
+    codecs = [str(codec) for codec in (data.get('codecs') or [])]
+    
+    tts_config = runtime_config.current.tts
+    format_id = negotiate_audio_format(codecs, tts_config.codec_preferences, tts_config.output_format)
+    client_audio_profiles.set(session_id, format_id, codecs)
+    logger.info(f"Audio format for session {session_id}: {format_id} (codecs={codecs})")
+    emit('audio_format', {'format': format_id, 'mime_type': get_audio_format(format_id).mime_type})
+
 @socketio.on('disconnect')
 def handle_disconnect():
     """WebSocket切断時の処理"""
     logger.info('Client disconnected')
 
+def emit_filler(session_id: str, personality: str, user_emotion: str, turn: Turn):
+    """ユーザーの感情に合うフィラー音声（相づち）をクライアントに送る"""
+    clip = filler_bank.pick(personality, user_emotion, session_id)
+    if clip is None:
+        return
+    emit('filler_audio', {
+        'text': clip.text,
+        'emotion': clip.emotion,
+        'audio_data': clip.audio_data,
+        'personality': personality,
+        'session_id': session_id,
+        'turn_id': turn.turn_id,
+    })
+    turn_log.debug("Filler '%s' sent for turn %s", clip.text, turn.turn_id)
+
+def send_turn_result(data, event: str, payload: Dict, broadcast: bool = False):
+    """ターンの最終結果をクライアントに送り、再送されたときに返せるよう記録する"""
+    message_id = data.get('message_id')
+    if message_id:
+        payload = dict(payload, message_id=message_id)
+        message_dedupe.record_result(data.get('session_id', 'default'), message_id, event, payload, broadcast)
+    if broadcast:
+        socketio.emit(event, payload)
+    else:
+        emit(event, payload)
+
+def answer_duplicate(message_id: str, state: str, result):
+    """再送されたメッセージに、処理中であることか記録済みの結果を返す（ターンは実行しない）"""
+    if state == STATE_COMPLETED and result is not None:
+        event, payload, _ = result
+        emit(event, dict(payload, duplicate=True))
+    else:
+        # 処理中なら完了時に結果が届く
+        emit('message_ack', {'message_id': message_id, 'status': state})
+    turn_log.debug("Duplicate message %s (%s); turn not re-run", message_id, state)
+
+def deliver_to_waiters(entry, message_id: str):
+    """処理中に再送してきたクライアント（再接続で sid が変わった場合）にも結果を届ける"""
+    waiters, result = message_dedupe.complete(entry)
+    if result is not None and result[0] == 'error':
+        # 失敗は記録しない（以降の再送では処理をやり直す）
+        message_dedupe.discard(entry)
+    for sid in waiters:
+        if result is None:
+            socketio.emit('message_ack', {'message_id': message_id, 'status': STATE_COMPLETED}, to=sid)
+        elif not result[2]:
+            # 全クライアントに送った結果は既に届いている
+            socketio.emit(result[0], dict(result[1], duplicate=True), to=sid)
+
+def schedule_turn(data, handler, lane: str):
+    """ターンを開始してスケジューラに投入（ソケットのスレッドはすぐに返す）
+
+    message_id 付きのイベントは重複排除する。ネットワークの瞬断で再送された同じメッセージは
+    新しいターンを開始せず（処理中のターンを置き換えない）、処理中の結果か記録済みの結果を返す。
+    """
+    session_id = data.get('session_id', 'default')
+    message_id = str(data['message_id']) if data.get('message_id') else None
+    if message_id:
+        data = dict(data, message_id=message_id)
+    entry, duplicate_state, result = message_dedupe.begin(session_id, message_id, request.sid)
+    if duplicate_state:
+        answer_duplicate(message_id, duplicate_state, result)
+        return
+
+    turn = begin_turn(session_id)
+    cassette.start_turn(turn, lane, data)
+
+    def run_turn():
+        try:
+            handler(data, turn)
+        finally:
+            cassette.finish_turn(turn)
+            deliver_to_waiters(entry, message_id)
+
+    try:
+        # ワーカースレッドからも emit でこのクライアントに返信できるようリクエストコンテキストを引き継ぐ
+        turn_scheduler.submit(session_id, copy_current_request_context(run_turn), lane)
+    except SchedulerFullError as e:
+        logger.warning(str(e))
+        turn_registry.finish(turn)
+        message_dedupe.discard(entry)
+        emit('error', {'message': 'ただいま混み合っています。少し待ってからもう一度話しかけてね。'})
+
 @socketio.on('send_message')
-def handle_message(data):
-    """テキストメッセージ受信時の処理 - 超シンプル版"""
+def receive_message(data):
+    """テキストメッセージ受信時の処理（セッションの順序を保ってスケジューラで実行）"""
+    if not (data.get('message') or '').strip():
+        return
+    schedule_turn(data, handle_message, LANE_TEXT)
+
+@socketio.on('send_audio')
+def receive_audio(data):
+    """音声メッセージ受信時の処理（音声ターンは優先レーンで実行）"""
+    if not data.get('audio_data'):
+        return
+    schedule_turn(data, handle_audio, LANE_VOICE)
+
+def handle_message(data, turn: Optional[Turn] = None):
+    """テキストメッセージ受信時の処理 - 超シンプル版
+
+    同じセッションで処理中の応答があれば、新しいターンを開始してキャンセルする（バージイン）。
+    """
     start_time = time.time()
     try:
         session_id = data.get('session_id', 'default')
@@ -914,33 +1572,47 @@ def handle_message(data):
         
         if not message.strip():
             return
+        
+        if turn is None:
+            turn = begin_turn(session_id)
+        if turn.is_cancelled:
+            # 待ち行列にいる間に次の発話が届いた場合は、生成せずに発話だけ記録する
+            memory_manager.save_message(session_id, 'user', message, analyze_emotion_simple(message))
+            return
 
-        logger.info(f"Received message: '{message}' for personality: {personality}")
+        turn_log.info("Received message (%d chars) for personality: %s", len(message), personality)
+        turn_log.debug("Message: %s", message)
+
+        # 0. 応答を待つ間の無音を埋めるため、事前に合成したフィラーをすぐに送る（上流 API は呼ばない）
+        user_emotion = analyze_emotion_simple(message)
+        emit_filler(session_id, personality, user_emotion, turn)
 
         # 1. プロンプト構築
         prompt = build_prompt(personality, message)
-        logger.info(f"Generated prompt: {prompt}")
+        turn_log.debug("Generated prompt: %s", prompt)
 
         # 2. Gemini API 呼び出し
         try:
             ai_start_time = time.time()
-            response = primary_model.generate_content(prompt)
-            response_text = response.text
-            logger.info(f"Gemini response received: '{response_text}'")
-            logger.info(f"[PERF] Gemini response time: {time.time() - ai_start_time:.2f}s")
+            response_text = generate_text_for_turn(get_primary_model(), prompt, turn)
+            turn_log.debug("Gemini response received: '%s'", response_text)
+            perf_log.info("[PERF] Gemini response time: %.2fs", time.time() - ai_start_time)
         except Exception as e:
             logger.error(f"Gemini API call failed: {e}")
             # フォールバックモデルを試行
             try:
                 logger.warning("Attempting to use fallback model.")
-                response = fallback_model.generate_content(prompt)
-                response_text = response.text
+                response_text = generate_text_for_turn(get_fallback_model(), prompt, turn)
             except Exception as fallback_e:
                 logger.error(f"Fallback model also failed: {fallback_e}")
                 response_text = "ごめんなさい、今ちょっと考えがまとまらないみたい…。"
 
-        # 3. 感情分析
-        user_emotion = analyze_emotion_simple(message)
+        # 3. 感情分析（ユーザーの感情は 0. で判定済み）
+        if turn.is_cancelled:
+            # 置き換えられたターンは音声合成も送信もしない（ユーザーの発話だけ記録する）
+            memory_manager.save_message(session_id, 'user', message, user_emotion)
+            turn_log.info("Turn %s of session %s superseded by turn %s; reply dropped", turn.turn_id, session_id, turn.superseded_by)
+            return
         response_emotion = analyze_emotion_simple(response_text)
 
         # 4. 音声合成 (TTS)
@@ -953,39 +1625,51 @@ def handle_message(data):
                 audio_data = tts_manager.synthesize_speech_optimized(
                     response_text, 
                     voice_id=effective_voice_id, 
-                    personality=personality
+                    personality=personality,
+                    output_format=client_audio_profiles.format_for(session_id),
+                    turn=turn
                 )
-                logger.info(f"[PERF] TTS synthesis time: {time.time() - tts_start_time:.2f}s")
-                logger.info(f"[DEBUG] Used voice ID: {effective_voice_id} for personality: {personality}")
+                perf_log.info("[PERF] TTS synthesis time: %.2fs", time.time() - tts_start_time)
+                tts_log.debug("Used voice ID: %s for personality: %s", effective_voice_id, personality)
             except Exception as e:
                 logger.error(f"TTS synthesis failed: {e}")
         
         # 5. 会話履歴の保存
         try:
             memory_manager.save_message(session_id, 'user', message, user_emotion)
-            memory_manager.save_message(session_id, 'assistant', response_text, response_emotion)
+            if not turn.is_cancelled:
+                memory_manager.save_message(session_id, 'assistant', response_text, response_emotion)
         except Exception as e:
             logger.error(f"Failed to save conversation history: {e}")
+        
+        if turn.is_cancelled:
+            turn_log.info("Turn %s of session %s superseded by turn %s; reply dropped", turn.turn_id, session_id, turn.superseded_by)
+            return
 
         # 6. クライアントに応答を送信
-        socketio.emit('message_response', {
+        send_turn_result(data, 'message_response', {
             'text': response_text,
             'emotion': response_emotion,
             'user_emotion': user_emotion,
             'audio_data': audio_data,
             'timestamp': datetime.now().isoformat(),
             'personality': personality,
-        })
+            'session_id': session_id,
+            'turn_id': turn.turn_id,
+        }, broadcast=True)
 
-        logger.info(f"[PERF] Total processing time: {time.time() - start_time:.2f}s")
+        perf_log.info("[PERF] Total processing time: %.2fs", time.time() - start_time)
+        warmup_manager.mark_turn(time.time() - start_time)
 
     except Exception as e:
         logger.error(f"An error occurred in handle_message: {e}")
-        emit('error', {'message': 'メッセージの処理中に予期せぬエラーが発生しました。'})
+        send_turn_result(data, 'error', {'message': 'メッセージの処理中に予期せぬエラーが発生しました。'})
+    finally:
+        if turn is not None:
+            turn_registry.finish(turn)
 
-@socketio.on('send_audio')
-def handle_audio(data):
-    """音声メッセージ受信時の処理 - シンプル版"""
+def handle_audio(data, turn: Optional[Turn] = None):
+    """音声メッセージの処理 - シンプル版"""
     try:
         session_id = data.get('session_id', 'default')
         # フロントエンドから送られてくるのは16進数文字列なので、バイナリに戻す
@@ -998,29 +1682,99 @@ def handle_audio(data):
 
         audio_data = bytes.fromhex(audio_hex)
         
+        # 話し始めた時点で前の応答を止める（通常は受信時に schedule_turn で開始済み）
+        if turn is None:
+            turn = begin_turn(session_id)
+        if turn.is_cancelled:
+            return
+        
+        # 前処理: 前後の無音を除去し、モノラル16kHzに変換してアップロード量を減らす
+        preprocessed = preprocess_for_stt(audio_data, runtime_config.current.stt.preprocessing)
+        perf_log.info(
+            "[PERF] STT preprocessing: %d -> %d bytes, trimmed %dms of audio in %.1fms%s",
+            preprocessed.original_bytes, preprocessed.processed_bytes, preprocessed.trimmed_ms,
+            preprocessed.processing_ms, "" if preprocessed.applied else f" (skipped: {preprocessed.reason})"
+        )
+        
         # 音声認識 (STT)
-        transcribed_text = asyncio.run(stt_manager.transcribe_audio(audio_data))
+        stt_start_time = time.time()
+        transcribed_text = loop_monitor.run(stt_manager.transcribe_audio(preprocessed.audio, turn))
+        stt_preprocess_stats.record(preprocessed, (time.time() - stt_start_time) * 1000)
+        perf_log.info("[PERF] STT time: %.2fs", time.time() - stt_start_time)
         
+        if turn.is_cancelled:
+            return
         if not transcribed_text:
-            emit('error', {'message': 'ごめんなさい、うまく聞き取れませんでした。'})
+            send_turn_result(data, 'error', {'message': 'ごめんなさい、うまく聞き取れませんでした。'})
             return
 
-        # テキストが認識されたら、通常のメッセージ処理に渡す
+        # テキストが認識されたら、同じターンのまま通常のメッセージ処理に渡す
         handle_message({
             'session_id': session_id,
             'message': transcribed_text,
-            'personality': personality
-        })
+            'personality': personality,
+            'message_id': data.get('message_id'),
+        }, turn)
 
     except Exception as e:
         logger.error(f"Error handling audio: {e}")
-        emit('error', {'message': '音声の処理中にエラーが発生しました。'})
+        send_turn_result(data, 'error', {'message': '音声の処理中にエラーが発生しました。'})
+    finally:
+        if turn is not None:
+            turn_registry.finish(turn)
 
 @app.route('/api/health')
 def health_check():
     """ヘルスチェックエンドポイント"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/sessions/<session_id>/history')
+def export_session_history(session_id):
+    """セッションの会話履歴を NDJSON でストリーミング出力（cursor で再開可能。管理APIの認証が必要）
+
+    セッションIDはクライアントが生成してログにも出るため、アクセス権の代わりにはしない。
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        after_id = decode_cursor(request.args['cursor'], session_id) if request.args.get('cursor') else 0
+        since = normalize_timestamp(request.args.get('since'))
+        until = normalize_timestamp(request.args.get('until'))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        if limit is not None and limit <= 0:
+            raise CursorError("limit must be positive")
+    except (CursorError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    body = iter_ndjson(memory_manager.path_for(session_id), session_id, after_id, since, until, limit)
+    headers = {'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    if request.args.get('gzip') in ('1', 'true'):
+        body = gzip_stream(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(body), mimetype='application/x-ndjson', headers=headers)
+
+@app.route('/api/memory/shards')
+def memory_shard_status():
+    """シャードごとのセッション数・メッセージ数・ファイルサイズと書き込み接続の統計を取得"""
+    memory_manager.ensure_initialized()
+    return jsonify({
+        'shards': shard_status(memory_manager.all_paths()),
+        'writers': memory_manager.writer_stats(),
+    })
+
+@app.route('/api/maintenance/memory')
+def memory_maintenance_report():
+    """会話DBのメンテナンス結果とサイズ・クエリレイテンシの推移を取得"""
+    return jsonify(memory_maintenance.report())
+
+@app.route('/api/ready')
+def readiness_check():
+    """レディネスチェックエンドポイント（ウォームアップ完了で200を返す）"""
+    status = warmup_manager.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
 if __name__ == '__main__':
     # 起動前の初期化処理
     print("AI Wife Application Starting...")
@@ -1047,6 +1801,16 @@ if __name__ == '__main__':
         else:
             print("Warning: Database initialization script not found.")
     
+    # シャード構成が DB ファイルと食い違っていれば起動しない（既存の履歴が見えなくなるのを防ぐ）
+    layout_problems = check_shard_layout(os.path.abspath(DATABASE_PATH), runtime_config.current.memory.shard_count)
+    if layout_problems:
+        for problem in layout_problems:
+            print(f"Error: {problem}")
+        raise SystemExit("Run tools/memory_shards.py reshard before changing memory_settings.shard_count.")
+    
+    # 設定ファイルの変更監視とウォームアップを開始（再起動なしでチューニング可能）
+    start_background_services()
+    
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting server on port {port}")
     socketio.run(app, host='0.0.0.0', port=port, debug=True, use_reloader=False, allow_unsafe_werkzeug=True)
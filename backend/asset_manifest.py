@@ -0,0 +1,153 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# プリロード優先度（数値が小さいほど先に読み込む）
+PRIORITY_CRITICAL = 0   # 初期表示に必須（デフォルトキャラクター・登場アニメーション・デフォルト背景）
+PRIORITY_HIGH = 1       # 初期表示直後に使う（待機アニメーション）
+PRIORITY_NORMAL = 2     # アイドルローテーションなど
+PRIORITY_LOW = 3        # 選択されるまで不要（他キャラクター・他背景）
+
+PRIORITY_LABELS = {
+    PRIORITY_CRITICAL: 'critical',
+    PRIORITY_HIGH: 'high',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_LOW: 'low',
+}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class AssetManifestBuilder:
+    """クライアントのプリロード用アセットマニフェストを生成するクラス
+
+    app_config.yml のキャラクター・アニメーション・背景一覧と実ファイルから
+    サイズ・コンテンツハッシュ・フィンガープリント付きURL・優先度を算出する。
+    ハッシュは (mtime, size) が変わったファイルのみ再計算する。
+    """
+
+    def __init__(self, models_dir: str, backgrounds_dir: str):
+        self.models_dir = os.path.abspath(models_dir)
+        self.backgrounds_dir = os.path.abspath(backgrounds_dir)
+        self._hash_cache: Dict[str, Tuple[Tuple[float, int], str]] = {}
+        self._lock = threading.Lock()
+
+    def file_hash(self, path: str) -> Optional[Tuple[int, str]]:
+        """ファイルのサイズとSHA-256ハッシュを取得（変更がなければキャッシュを利用）"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        signature = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._hash_cache.get(path)
+            if cached and cached[0] == signature:
+                return stat.st_size, cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+
+        with self._lock:
+            self._hash_cache[path] = (signature, content_hash)
+        return stat.st_size, content_hash
+
+    def build_entry(self, kind: str, url_prefix: str, base_dir: str, relative_path: str,
+                    priority: int, **extra) -> Dict:
+        """マニフェストの1エントリを生成"""
+        relative_path = relative_path.replace('\\', '/').lstrip('/')
+        path = os.path.abspath(os.path.join(base_dir, relative_path))
+        url = f"{url_prefix}/{relative_path}"
+
+        entry = {
+            'type': kind,
+            'path': relative_path,
+            'url': url,
+            'priority': PRIORITY_LABELS[priority],
+            'priority_rank': priority,
+        }
+        entry.update(extra)
+
+        # ベースディレクトリ外を指す設定は無視する
+        info = self.file_hash(path) if path.startswith(base_dir + os.sep) else None
+        if info is None:
+            entry.update({'available': False, 'size': None, 'hash': None, 'fingerprinted_url': None})
+            return entry
+
+        size, content_hash = info
+        entry.update({
+            'available': True,
+            'size': size,
+            'hash': f"sha256-{content_hash}",
+            'fingerprinted_url': f"{url}?v={content_hash[:16]}",
+        })
+        return entry
+
+    def build(self, config: Dict) -> Dict:
+        """設定とファイルシステムからマニフェストを生成"""
+        character_config = config.get('character_config') or {}
+        animation_config = config.get('animation_config') or {}
+        background_config = config.get('background_config') or {}
+
+        assets: List[Dict] = []
+
+        default_character = character_config.get('default_character')
+        for key, character in (character_config.get('available_characters') or {}).items():
+            file_name = character.get('file')
+            if not file_name:
+                continue
+            priority = PRIORITY_CRITICAL if file_name == default_character else PRIORITY_LOW
+            assets.append(self.build_entry(
+                'character', '/models', self.models_dir, file_name, priority,
+                name=key,
+                personality=character.get('personality'),
+                display_name=character.get('display_name'),
+            ))
+
+        for animation in animation_config.get('available_animations') or []:
+            name = os.path.splitext(os.path.basename(animation))[0]
+            if name == 'appearing':
+                priority = PRIORITY_CRITICAL
+            elif name == 'waiting':
+                priority = PRIORITY_HIGH
+            else:
+                priority = PRIORITY_NORMAL
+            assets.append(self.build_entry(
+                'animation', '/models', self.models_dir, animation, priority, name=name,
+            ))
+
+        default_background = background_config.get('default_background')
+        for background in background_config.get('available_backgrounds') or []:
+            file_name = background.get('file')
+            if not file_name:
+                continue
+            priority = PRIORITY_CRITICAL if file_name == default_background else PRIORITY_LOW
+            assets.append(self.build_entry(
+                'background', '/backgrounds', self.backgrounds_dir, file_name, priority,
+                name=background.get('name'),
+            ))
+
+        # 優先度順に並べる（同順位は宣言順を維持）
+        assets.sort(key=lambda a: a['priority_rank'])
+
+        version = hashlib.sha256(
+            '|'.join(f"{a['url']}:{a['hash']}" for a in assets).encode('utf-8')
+        ).hexdigest()[:16]
+
+        return {
+            'version': version,
+            'defaults': {
+                'character': default_character,
+                'personality': character_config.get('default_personality'),
+                'background': default_background,
+            },
+            'assets': assets,
+            'total_bytes': sum(a['size'] or 0 for a in assets),
+        }
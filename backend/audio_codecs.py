@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """ElevenLabs の output_format と、クライアントで再生するための情報"""
+    format_id: str
+    codec: str
+    mime_type: str
+    bitrate_kbps: int
+
+
+# ElevenLabs が返す形式のうち、ブラウザの <audio> でそのまま再生できるもの
+AUDIO_FORMATS: Dict[str, AudioFormat] = {
+    fmt.format_id: fmt for fmt in (
+        AudioFormat('mp3_22050_32', 'mp3', 'audio/mpeg', 32),
+        AudioFormat('mp3_44100_64', 'mp3', 'audio/mpeg', 64),
+        AudioFormat('mp3_44100_128', 'mp3', 'audio/mpeg', 128),
+        AudioFormat('opus_48000_32', 'opus', 'audio/ogg', 32),
+        AudioFormat('opus_48000_64', 'opus', 'audio/ogg', 64),
+        AudioFormat('opus_48000_96', 'opus', 'audio/ogg', 96),
+    )
+}
+
+# 対応コーデックを申告しない（従来の）クライアントは MP3 のみ再生できるものとして扱う
+LEGACY_CODECS = ('mp3',)
+
+
+def get_audio_format(format_id: str) -> AudioFormat:
+    """形式IDから AudioFormat を取得（未知の形式は MP3 として扱う）"""
+    return AUDIO_FORMATS.get(format_id) or AudioFormat(format_id, 'mp3', 'audio/mpeg', 0)
+
+
+def negotiate_audio_format(codecs: Optional[List[str]], preferences: List[str], default_format: str) -> str:
+    """クライアントの対応コーデックから、使用する出力形式を決める
+
+    preferences の順に、クライアントが再生できる最初の形式を選ぶ。
+    """
+    supported = {codec.lower() for codec in (codecs or LEGACY_CODECS)}
+    candidates = list(preferences) + [default_format]
+    for format_id in candidates:
+        if format_id in AUDIO_FORMATS and AUDIO_FORMATS[format_id].codec in supported:
+            return format_id
+    return default_format
+
+
+class ClientAudioProfiles:
+    """セッションごとに交渉済みの出力形式を保持するクラス（LRUで上限を設ける）"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._profiles: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, session_id: str, format_id: str, codecs: List[str]):
+        with self._lock:
+            self._profiles[session_id] = {
+                'format': format_id,
+                'codecs': list(codecs),
+            }
+            self._profiles.move_to_end(session_id)
+            while len(self._profiles) > self.capacity:
+                self._profiles.popitem(last=False)
+
+    def format_for(self, session_id: Optional[str]) -> Optional[str]:
+        """交渉済みの形式を返す（未交渉なら None = 設定のデフォルト）"""
+        with self._lock:
+            profile = self._profiles.get(session_id)
+            return profile['format'] if profile else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            formats: Dict[str, int] = {}
+            for profile in self._profiles.values():
+                formats[profile['format']] = formats.get(profile['format'], 0) + 1
+            return {'sessions': len(self._profiles), 'formats': formats}
+
+
+class AudioCache:
+    """合成済み音声の LRU キャッシュ（出力形式ごとに別エントリ）"""
+
+    def __init__(self, max_entries_provider: Callable[[], int]):
+        self.max_entries_provider = max_entries_provider
+        self._entries: 'OrderedDict[Tuple[str, str, str, str], str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple[str, str, str, str], value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            max_entries = self.max_entries_provider()
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_format: Dict[str, int] = {}
+            for key, value in self._entries.items():
+                by_format[key[2]] = by_format.get(key[2], 0) + len(value)
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries_provider(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes_by_format': by_format,
+            }
@@ -0,0 +1,230 @@
+import io
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'sample_rate': 16000,
+    'frame_ms': 20,
+    # ノイズフロア（フレームエネルギーの下位パーセンタイル）からこの dB 以上大きいフレームを発話とみなす
+    'noise_percentile': 10,
+    'threshold_db': 12,
+    # ノイズフロアの上限（途切れない発話では下位パーセンタイルも発話になるため、推定値をここで頭打ちにする）
+    'max_noise_floor_dbfs': -45,
+    # 絶対的な下限（これより静かなフレームは常に無音）
+    'min_speech_dbfs': -50,
+    # 発話区間の前後に残す余白（語頭・語尾の子音を切らないため）
+    'padding_ms': 200,
+    'export_format': 'ogg',
+    'export_codec': 'libopus',
+    'export_bitrate': '24k',
+}
+
+
+@dataclass
+class PreprocessResult:
+    """前処理の結果と計測値"""
+    audio: bytes
+    applied: bool
+    original_bytes: int
+    processed_bytes: int
+    original_duration_ms: int
+    processed_duration_ms: int
+    processing_ms: float
+    reason: str = ''
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+    @property
+    def trimmed_ms(self) -> int:
+        return self.original_duration_ms - self.processed_duration_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            'applied': self.applied,
+            'reason': self.reason,
+            'original_bytes': self.original_bytes,
+            'processed_bytes': self.processed_bytes,
+            'bytes_saved': self.bytes_saved,
+            'original_duration_ms': self.original_duration_ms,
+            'processed_duration_ms': self.processed_duration_ms,
+            'trimmed_ms': self.trimmed_ms,
+            'processing_ms': round(self.processing_ms, 1),
+        }
+
+
+def frame_energies_db(samples: np.ndarray, sample_rate: int, frame_ms: int) -> np.ndarray:
+    """フレームごとの RMS エネルギー（dBFS）を計算"""
+    frame_length = max(1, sample_rate * frame_ms // 1000)
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.empty(0)
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def detect_speech_bounds(samples: np.ndarray, sample_rate: int, settings: Dict) -> Optional[Tuple[int, int]]:
+    """エネルギーベースの VAD で発話区間（サンプル位置の開始・終了）を検出
+
+    samples は -1.0〜1.0 に正規化したモノラル波形。発話が見つからなければ None。
+    """
+    frame_ms = settings['frame_ms']
+    energies = frame_energies_db(samples, sample_rate, frame_ms)
+    if energies.size == 0:
+        return None
+
+    noise_floor = min(np.percentile(energies, settings['noise_percentile']), settings['max_noise_floor_dbfs'])
+    threshold = max(noise_floor + settings['threshold_db'], settings['min_speech_dbfs'])
+    voiced = np.flatnonzero(energies > threshold)
+    if voiced.size == 0:
+        return None
+
+    frame_length = sample_rate * frame_ms // 1000
+    padding = sample_rate * settings['padding_ms'] // 1000
+    start = max(0, voiced[0] * frame_length - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame_length + padding)
+    return int(start), int(end)
+
+
+def to_mono_samples(segment: AudioSegment) -> np.ndarray:
+    """AudioSegment を -1.0〜1.0 の float32 モノラル波形に変換"""
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+    if segment.channels > 1:
+        samples = samples.reshape(-1, segment.channels).mean(axis=1)
+    return samples / float(1 << (8 * segment.sample_width - 1))
+
+
+def preprocess_for_stt(audio_data: bytes, settings: Optional[Dict] = None) -> PreprocessResult:
+    """録音を STT 向けに前処理（デコード → モノラル・16kHz化 → 前後の無音除去 → 再エンコード）
+
+    失敗した場合や、再エンコード結果が元より大きい場合は元の録音をそのまま返す。
+    """
+    config = dict(DEFAULT_SETTINGS)
+    config.update(settings or {})
+    started = time.perf_counter()
+
+    def passthrough(reason: str, duration_ms: int = 0) -> PreprocessResult:
+        return PreprocessResult(
+            audio=audio_data, applied=False,
+            original_bytes=len(audio_data), processed_bytes=len(audio_data),
+            original_duration_ms=duration_ms, processed_duration_ms=duration_ms,
+            processing_ms=(time.perf_counter() - started) * 1000, reason=reason,
+        )
+
+    if not config['enabled']:
+        return passthrough('disabled')
+
+    try:
+        # コンテナ（webm/ogg/wav 等）は ffmpeg に判別させる
+        segment = AudioSegment.from_file(io.BytesIO(audio_data))
+    except Exception as e:
+        logger.warning(f"Audio preprocessing skipped (decode failed): {e}")
+        return passthrough('decode_failed')
+
+    original_duration_ms = len(segment)
+    segment = segment.set_channels(1).set_frame_rate(config['sample_rate']).set_sample_width(2)
+
+    # 発話区間が分からない場合も、無音除去だけ省いてモノラル・16kHz化は行う
+    bounds = detect_speech_bounds(to_mono_samples(segment), config['sample_rate'], config)
+    if bounds is not None:
+        start_ms = bounds[0] * 1000 // config['sample_rate']
+        end_ms = bounds[1] * 1000 // config['sample_rate']
+        segment = segment[start_ms:end_ms]
+
+    try:
+        buffer = io.BytesIO()
+        export_args = {'format': config['export_format']}
+        if config['export_format'] != 'wav':
+            if config.get('export_codec'):
+                export_args['codec'] = config['export_codec']
+            if config.get('export_bitrate'):
+                export_args['bitrate'] = config['export_bitrate']
+        segment.export(buffer, **export_args)
+        processed = buffer.getvalue()
+    except Exception as e:
+        logger.warning(f"Audio preprocessing skipped (encode failed): {e}")
+        return passthrough('encode_failed', original_duration_ms)
+
+    if len(processed) >= len(audio_data):
+        return passthrough('not_smaller', original_duration_ms)
+
+    return PreprocessResult(
+        audio=processed, applied=True,
+        original_bytes=len(audio_data), processed_bytes=len(processed),
+        original_duration_ms=original_duration_ms, processed_duration_ms=len(segment),
+        processing_ms=(time.perf_counter() - started) * 1000,
+        reason='' if bounds is not None else 'no_speech',
+    )
+
+
+class PreprocessStats:
+    """前処理による削減量（バイト数・音声長）と STT レイテンシの累計
+
+    STT レイテンシは前処理を適用したターンとしなかったターン（無効・失敗・縮まなかった場合）に分けて集計し、
+    前処理で短くなった時間を比較できるようにする。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.applied = 0
+        self.original_bytes = 0
+        self.bytes_saved = 0
+        self.trimmed_ms = 0
+        self.processing_ms = 0.0
+        self.stt_ms = 0.0
+        # 前処理の有無ごとの、前処理と STT にかかった時間の累計
+        self.stt_ms_by_mode = {'preprocessed': 0.0, 'passthrough': 0.0}
+        self.last: Optional[Dict] = None
+
+    def record(self, result: PreprocessResult, stt_ms: float):
+        with self._lock:
+            self.turns += 1
+            self.applied += int(result.applied)
+            self.original_bytes += result.original_bytes
+            self.bytes_saved += result.bytes_saved
+            self.trimmed_ms += result.trimmed_ms
+            self.processing_ms += result.processing_ms
+            self.stt_ms += stt_ms
+            self.stt_ms_by_mode['preprocessed' if result.applied else 'passthrough'] += result.processing_ms + stt_ms
+            self.last = dict(result.to_dict(), stt_ms=round(stt_ms, 1))
+
+    def summary(self) -> Dict:
+        with self._lock:
+            turns = self.turns or 1
+            return {
+                'turns': self.turns,
+                'applied': self.applied,
+                'bytes_saved_total': self.bytes_saved,
+                'bytes_saved_ratio': round(self.bytes_saved / self.original_bytes, 3) if self.original_bytes else 0.0,
+                'audio_trimmed_ms_total': self.trimmed_ms,
+                'avg_processing_ms': round(self.processing_ms / turns, 1),
+                'avg_stt_ms': round(self.stt_ms / turns, 1),
+                'stt_comparison': self._stt_comparison(),
+                'last': self.last,
+            }
+
+    def _stt_comparison(self) -> Dict:
+        """前処理あり・なしの平均 STT レイテンシと差（ロック内で呼ぶこと。前処理にかかった時間も含めて比べる）"""
+        passthrough_turns = self.turns - self.applied
+        with_preprocessing = self.stt_ms_by_mode['preprocessed'] / self.applied if self.applied else None
+        without_preprocessing = self.stt_ms_by_mode['passthrough'] / passthrough_turns if passthrough_turns else None
+        return {
+            'preprocessed_turns': self.applied,
+            'passthrough_turns': passthrough_turns,
+            'avg_stt_ms_preprocessed': round(with_preprocessing, 1) if with_preprocessing is not None else None,
+            'avg_stt_ms_passthrough': round(without_preprocessing, 1) if without_preprocessing is not None else None,
+            'avg_ms_saved': round(without_preprocessing - with_preprocessing, 1)
+            if with_preprocessing is not None and without_preprocessing is not None else None,
+        }
@@ -0,0 +1,409 @@
+import json
+import gzip
+import atexit
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = 'off'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+# 書き込み中のカセットを flush する間隔（秒）
+FLUSH_INTERVAL = 2.0
+
+DEFAULT_SETTINGS = {
+    'mode': MODE_OFF,
+    # record: 書き込み先 / replay: 読み込み元
+    'path': None,
+    # replay 時に、再生したやり取りとターンの所要時間を書き出す先（比較用。未指定なら書かない）
+    'output_path': None,
+    # replay の再生速度（1.0 で記録どおり、2.0 で2倍速、0 で待ち時間なし）
+    'speed': 1.0,
+    # 内容が一致するやり取りがない場合の扱い
+    # sequential: 同じサービスの未再生のやり取りを記録順に使う / strict: CassetteMissError
+    'match': 'sequential',
+}
+
+
+class CassetteMissError(LookupError):
+    """replay 中に、記録にないリクエストが来た場合の例外"""
+
+
+class CassetteReplayError(Exception):
+    """記録時に上流がエラーを返したやり取りを再生した場合の例外"""
+
+
+class ReplayedChunk:
+    """再生した Gemini の応答（.text だけを持つ）"""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def fingerprint(*parts: Any) -> str:
+    """リクエスト内容からやり取りのキーを作る"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()[:24]
+
+
+def encode_payload(value: Any) -> Any:
+    """JSON に書ける形に変換（bytes は base64）"""
+    if isinstance(value, (bytes, bytearray)):
+        return {'b64': base64.b64encode(bytes(value)).decode('ascii')}
+    return value
+
+
+def decode_payload(value: Any) -> Any:
+    if isinstance(value, dict) and set(value) == {'b64'}:
+        return base64.b64decode(value['b64'])
+    return value
+
+
+def read_cassette(path: str) -> List[Dict]:
+    """カセットファイル（gzip 圧縮した JSON Lines）を読み込む"""
+    entries = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+class Cassette:
+    """上流 API（Gemini / ElevenLabs / AssemblyAI）とのやり取りを記録・再生するクラス
+
+    record: 各やり取りの応答をチャンク単位で、開始からの経過時間付きで記録する。
+    replay: 記録した応答をネットワークを使わずに返す（speed に応じて記録どおりの間隔で）。
+    やり取りはサービス名とリクエスト内容のハッシュで照合し、同じキーは記録順に再生する。
+    ターンの入力と所要時間も記録し、tools/replay_cassette.py で再送・比較に使う。
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict]):
+        self.settings_provider = settings_provider
+        self._lock = threading.Lock()
+        self._replay_index: Optional[Dict[Tuple[str, str], Deque[Dict]]] = None
+        self._replay_order: Dict[str, Deque[Dict]] = {}
+        self._played = set()
+        self._last_played: Dict[Tuple[str, str], Dict] = {}
+        self._turn_started: Dict[Tuple[str, int], float] = {}
+        # 書き込み中のカセット（1つの gzip ストリームを開いたまま追記する）
+        self._writer = None
+        self._writer_path: Optional[str] = None
+        self._writer_flushed_at = 0.0
+        self._close_registered = False
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    @property
+    def mode(self) -> str:
+        settings = self.settings()
+        return settings['mode'] if settings['path'] else MODE_OFF
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    def _output_path(self) -> Optional[str]:
+        settings = self.settings()
+        if self.mode == MODE_RECORD:
+            return settings['path']
+        if self.mode == MODE_REPLAY:
+            return settings['output_path']
+        return None
+
+    # ---- 書き込み ----
+
+    def _write(self, entry: Dict):
+        path = self._output_path()
+        if not path:
+            if self._writer is not None:
+                self.close()
+            return
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        try:
+            with self._lock:
+                if path != self._writer_path:
+                    self._close_writer()
+                    # 既存のカセットには新しい gzip メンバーとして続ける（連結したまま読める）
+                    if not self._close_registered:
+                        atexit.register(self.close)
+                        self._close_registered = True
+                    self._writer = gzip.open(path, 'at', encoding='utf-8')
+                    self._writer_path = path
+                    self._writer_flushed_at = time.monotonic()
+                self._writer.write(line)
+                # 行ごとに flush すると圧縮が効かないので、落ちたときに失うのは直近の数秒分だけにとどめる
+                now = time.monotonic()
+                if now - self._writer_flushed_at >= FLUSH_INTERVAL:
+                    self._writer.flush()
+                    self._writer_flushed_at = now
+        except OSError as e:
+            logger.error(f"Failed to write cassette entry: {e}")
+
+    def _close_writer(self):
+        if self._writer is None:
+            return
+        try:
+            self._writer.close()
+        except OSError as e:
+            logger.error(f"Failed to close cassette {self._writer_path}: {e}")
+        self._writer = None
+        self._writer_path = None
+
+    def close(self):
+        """書き込み中のカセットを閉じる（gzip のトレーラーを書く）"""
+        with self._lock:
+            self._close_writer()
+
+    def _record_stat(self, service: str, duration_ms: float, key: str = 'calls'):
+        with self._lock:
+            stats = self.stats.setdefault(service, {'calls': 0, 'misses': 0, 'total_ms': 0.0})
+            stats[key] = stats.get(key, 0) + 1
+            if key == 'calls':
+                stats['total_ms'] += duration_ms
+
+    @staticmethod
+    def _entry(service: str, key: str, turn, started_at: float, chunks: List, error: Optional[str]) -> Dict:
+        return {
+            'type': 'call',
+            'service': service,
+            'key': key,
+            'session_id': getattr(turn, 'session_id', None),
+            'turn_id': getattr(turn, 'turn_id', None),
+            'recorded_at': time.time(),
+            'duration_ms': round((time.perf_counter() - started_at) * 1000, 2),
+            'chunks': chunks,
+            'error': error,
+        }
+
+    # ---- 再生 ----
+
+    def _take(self, service: str, key: str) -> Dict:
+        """記録からやり取りを1件取り出す
+
+        同じ内容のやり取りを記録順に使い、使い切ったら最後のものを繰り返す。
+        内容が一致しない場合（会話履歴の違いでプロンプトが変わった等）は match の設定に従う。
+        """
+        settings = self.settings()
+        with self._lock:
+            if self._replay_index is None:
+                self._replay_index = {}
+                for entry in read_cassette(settings['path']):
+                    if entry.get('type') == 'call':
+                        self._replay_index.setdefault((entry['service'], entry['key']), deque()).append(entry)
+                        self._replay_order.setdefault(entry['service'], deque()).append(entry)
+            entry = self._next_unplayed(self._replay_index.get((service, key)))
+            if entry is None:
+                entry = self._last_played.get((service, key))
+            if entry is None and settings['match'] == 'sequential':
+                entry = self._next_unplayed(self._replay_order.get(service))
+            if entry is not None:
+                self._played.add(id(entry))
+                self._last_played[(service, key)] = entry
+                return entry
+        self._record_stat(service, 0, 'misses')
+        raise CassetteMissError(f"No recorded {service} interaction for key {key}")
+
+    def _next_unplayed(self, queue: Optional[Deque[Dict]]) -> Optional[Dict]:
+        while queue:
+            entry = queue.popleft()
+            if id(entry) not in self._played:
+                return entry
+        return None
+
+    def reload(self):
+        """次の再生で記録を読み直す"""
+        with self._lock:
+            self._replay_index = None
+            self._replay_order.clear()
+            self._played.clear()
+            self._last_played.clear()
+
+    def _delay(self, started_at: float, offset_ms: float) -> float:
+        speed = float(self.settings()['speed'] or 0)
+        if speed <= 0:
+            return 0.0
+        return max(0.0, started_at + offset_ms / 1000 / speed - time.perf_counter())
+
+    # ---- ラッパー ----
+
+    def stream(self, service: str, key: str, factory: Callable[[], Iterable], encode: Callable[[Any], Any] = None,
+               decode: Callable[[Any], Any] = None, turn=None) -> Iterator:
+        """同期ストリーム（チャンクを順に返す上流呼び出し）を記録・再生する"""
+        mode = self.mode
+        encode = encode or (lambda item: item)
+        decode = decode or (lambda item: item)
+        started_at = time.perf_counter()
+
+        if mode == MODE_REPLAY:
+            entry = self._take(service, key)
+            for offset_ms, payload in entry['chunks']:
+                time.sleep(self._delay(started_at, offset_ms))
+                yield decode(decode_payload(payload))
+            self._finish_replay(service, key, turn, started_at, entry)
+            return
+
+        source = factory()
+        if mode != MODE_RECORD:
+            yield from source
+            return
+
+        chunks, error = [], None
+        try:
+            for item in source:
+                chunks.append([round((time.perf_counter() - started_at) * 1000, 2), encode_payload(encode(item))])
+                yield item
+        except GeneratorExit:
+            # 呼び出し側が途中でやめた（キャンセル等）。上流のストリームも閉じる
+            error = 'aborted'
+            close = getattr(source, 'close', None)
+            if close:
+                close()
+            raise
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._finish_record(service, key, turn, started_at, chunks, error)
+
+    async def astream(self, service: str, key: str, factory: Callable[[], Awaitable[Any]],
+                      encode: Callable[[Any], Any] = None, decode: Callable[[Any], Any] = None,
+                      turn=None) -> AsyncIterator:
+        """非同期ストリーム（factory は async iterable を返すコルーチン）を記録・再生する"""
+        mode = self.mode
+        encode = encode or (lambda item: item)
+        decode = decode or (lambda item: item)
+        started_at = time.perf_counter()
+
+        if mode == MODE_REPLAY:
+            entry = self._take(service, key)
+            for offset_ms, payload in entry['chunks']:
+                await asyncio.sleep(self._delay(started_at, offset_ms))
+                yield decode(decode_payload(payload))
+            self._finish_replay(service, key, turn, started_at, entry)
+            return
+
+        source = await factory()
+        chunks, error = [], None
+        try:
+            async for item in source:
+                if mode == MODE_RECORD:
+                    chunks.append([round((time.perf_counter() - started_at) * 1000, 2), encode_payload(encode(item))])
+                yield item
+        except GeneratorExit:
+            error = 'aborted'
+            close = getattr(source, 'aclose', None)
+            if close:
+                await close()
+            raise
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            if mode == MODE_RECORD:
+                self._finish_record(service, key, turn, started_at, chunks, error)
+
+    async def acall(self, service: str, key: str, factory: Callable[[], Awaitable[Any]], turn=None) -> Any:
+        """1回で結果が返る非同期の上流呼び出しを記録・再生する"""
+        mode = self.mode
+        started_at = time.perf_counter()
+
+        if mode == MODE_REPLAY:
+            entry = self._take(service, key)
+            offset_ms, payload = entry['chunks'][-1] if entry['chunks'] else (entry['duration_ms'], None)
+            await asyncio.sleep(self._delay(started_at, offset_ms))
+            self._finish_replay(service, key, turn, started_at, entry)
+            return decode_payload(payload)
+
+        if mode != MODE_RECORD:
+            return await factory()
+
+        try:
+            result = await factory()
+        except Exception as e:
+            self._finish_record(service, key, turn, started_at, [], str(e))
+            raise
+        if turn is not None and turn.is_cancelled:
+            # 途中でやめた結果は再生に使えないので記録しない
+            return result
+        elapsed_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        self._finish_record(service, key, turn, started_at, [[elapsed_ms, encode_payload(result)]], None)
+        return result
+
+    def _finish_record(self, service: str, key: str, turn, started_at: float, chunks: List, error: Optional[str]):
+        if error == 'aborted':
+            return
+        entry = self._entry(service, key, turn, started_at, chunks, error)
+        self._record_stat(service, entry['duration_ms'])
+        self._write(entry)
+
+    def _finish_replay(self, service: str, key: str, turn, started_at: float, recorded: Dict):
+        entry = self._entry(service, key, turn, started_at, [], recorded.get('error'))
+        entry['recorded_ms'] = recorded['duration_ms']
+        self._record_stat(service, entry['duration_ms'])
+        self._write(entry)
+        if recorded.get('error'):
+            raise CassetteReplayError(recorded['error'])
+
+    # ---- ターン ----
+
+    def start_turn(self, turn, lane: str, data: Dict):
+        """ターンの入力を記録（再送用）"""
+        if self.mode == MODE_OFF:
+            return
+        with self._lock:
+            self._turn_started[(turn.session_id, turn.turn_id)] = time.perf_counter()
+        self._write({
+            'type': 'turn_input',
+            'session_id': turn.session_id,
+            'turn_id': turn.turn_id,
+            'lane': lane,
+            'received_at': time.time(),
+            'data': data,
+        })
+
+    def finish_turn(self, turn):
+        """ターンの所要時間を記録"""
+        with self._lock:
+            started_at = self._turn_started.pop((turn.session_id, turn.turn_id), None)
+        if started_at is None:
+            return
+        self._write({
+            'type': 'turn',
+            'session_id': turn.session_id,
+            'turn_id': turn.turn_id,
+            'duration_ms': round((time.perf_counter() - started_at) * 1000, 2),
+            'cancelled': turn.is_cancelled,
+        })
+
+    def report(self) -> Dict:
+        settings = self.settings()
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'path': settings['path'],
+                'output_path': settings['output_path'],
+                'speed': settings['speed'],
+                'services': {
+                    service: dict(stats, avg_ms=round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else None)
+                    for service, stats in self.stats.items()
+                },
+            }
@@ -0,0 +1,237 @@
+import sqlite3
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# セッションキーを Unicode 私用領域（U+E000 から 6400 文字）の3文字に符号化するSQL式。
+# memory_search.session_tag と同じ符号化であること。
+SESSION_TAG_BASE = 0xE000
+SESSION_TAG_RADIX = 6400
+SESSION_TAG_SQL = (
+    f"char({SESSION_TAG_BASE} + (session_key / {SESSION_TAG_RADIX * SESSION_TAG_RADIX}) % {SESSION_TAG_RADIX}) || "
+    f"char({SESSION_TAG_BASE} + (session_key / {SESSION_TAG_RADIX}) % {SESSION_TAG_RADIX}) || "
+    f"char({SESSION_TAG_BASE} + session_key % {SESSION_TAG_RADIX})"
+)
+
+# (バージョン, 名前, SQL文のリスト) - 追加のみ行い、既存のマイグレーションは変更しないこと
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'initial_schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            emotion TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_info (
+            session_id TEXT PRIMARY KEY,
+            name TEXT,
+            preferences TEXT,
+            context_data TEXT,
+            last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 保持期間を過ぎた会話の退避先（メンテナンスジョブが移動する）
+        '''
+        CREATE TABLE IF NOT EXISTS conversations_archive (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            emotion TEXT,
+            timestamp DATETIME,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, 'covering_history_index', [
+        # 秒単位の timestamp ではなく id で順序付けし、履歴読み出しをインデックスのみで完結させる
+        'DROP INDEX IF EXISTS idx_session_timestamp',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversations_session_history
+        ON conversations (session_id, id DESC, role, emotion, timestamp, content)
+        ''',
+    ]),
+    (3, 'conversations_fulltext_index', [
+        # セッションごとに一意な整数キーとメッセージ数を持つ（全文検索の絞り込みと検索方式の選択用）
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_sessions (
+            session_key INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL UNIQUE,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # 日本語は分かち書きしないため trigram トークナイザで部分一致検索する。
+        # session_tag はセッションキーを私用領域の3文字（= trigram 1個）に符号化した列で、
+        # MATCH 内でセッションを絞り込むことで他セッションのヒットを走査しない。
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+            content,
+            session_tag,
+            content='',
+            tokenize='trigram'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversation_sessions (session_id, message_count) VALUES (new.session_id, 1)
+            ON CONFLICT(session_id) DO UPDATE SET message_count = message_count + 1;
+            INSERT INTO conversations_fts (rowid, content, session_tag)
+            SELECT new.id, new.content, {SESSION_TAG_SQL}
+            FROM conversation_sessions WHERE session_id = new.session_id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content, session_tag)
+            SELECT 'delete', old.id, old.content, {SESSION_TAG_SQL}
+            FROM conversation_sessions WHERE session_id = old.session_id;
+            UPDATE conversation_sessions SET message_count = message_count - 1 WHERE session_id = old.session_id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF session_id, content ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content, session_tag)
+            SELECT 'delete', old.id, old.content, {SESSION_TAG_SQL}
+            FROM conversation_sessions WHERE session_id = old.session_id;
+            UPDATE conversation_sessions SET message_count = message_count - 1 WHERE session_id = old.session_id;
+            INSERT INTO conversation_sessions (session_id, message_count) VALUES (new.session_id, 1)
+            ON CONFLICT(session_id) DO UPDATE SET message_count = message_count + 1;
+            INSERT INTO conversations_fts (rowid, content, session_tag)
+            SELECT new.id, new.content, {SESSION_TAG_SQL}
+            FROM conversation_sessions WHERE session_id = new.session_id;
+        END
+        ''',
+        # 既存の会話をインデックスに取り込む
+        '''
+        INSERT OR IGNORE INTO conversation_sessions (session_id, message_count)
+        SELECT session_id, COUNT(*) FROM conversations GROUP BY session_id
+        ''',
+        f'''
+        INSERT INTO conversations_fts (rowid, content, session_tag)
+        SELECT c.id, c.content, {SESSION_TAG_SQL}
+        FROM conversations c JOIN conversation_sessions USING (session_id)
+        ''',
+    ]),
+    (4, 'shard_layout', [
+        # このファイルがどのシャード構成の何番目か（再シャーディングせずに shard_count を変えたことの検出用）
+        '''
+        CREATE TABLE IF NOT EXISTS shard_layout (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            shard_count INTEGER NOT NULL,
+            shard_index INTEGER NOT NULL
+        )
+        ''',
+    ]),
+    (5, 'archive_history_index', [
+        # 履歴エクスポートでアーカイブもセッション単位に id 順で読む
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversations_archive_session
+        ON conversations_archive (session_id, id)
+        ''',
+    ]),
+    (6, 'archive_fulltext_index', [
+        # アーカイブに移したメッセージも検索できるよう、全文検索インデックスに残す。
+        # message_count は conversations の件数、archived_count はアーカイブの件数
+        'ALTER TABLE conversation_sessions ADD COLUMN archived_count INTEGER NOT NULL DEFAULT 0',
+        'DROP TRIGGER IF EXISTS conversations_fts_delete',
+        # アーカイブへの移動（先にアーカイブへ書いてから削除する）ではインデックスから消さず、件数だけ移す
+        f'''
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content, session_tag)
+            SELECT 'delete', old.id, old.content, {SESSION_TAG_SQL}
+            FROM conversation_sessions
+            WHERE session_id = old.session_id
+              AND NOT EXISTS (SELECT 1 FROM conversations_archive WHERE id = old.id);
+            UPDATE conversation_sessions SET
+                message_count = message_count - 1,
+                archived_count = archived_count + EXISTS (SELECT 1 FROM conversations_archive WHERE id = old.id)
+            WHERE session_id = old.session_id;
+        END
+        ''',
+        # 会話を経由せずにアーカイブへ直接書いた行（再シャーディングなど）はここで索引する
+        f'''
+        CREATE TRIGGER IF NOT EXISTS conversations_archive_fts_insert AFTER INSERT ON conversations_archive
+        WHEN NOT EXISTS (SELECT 1 FROM conversations WHERE id = new.id) BEGIN
+            INSERT INTO conversation_sessions (session_id, message_count, archived_count) VALUES (new.session_id, 0, 1)
+            ON CONFLICT(session_id) DO UPDATE SET archived_count = archived_count + 1;
+            INSERT INTO conversations_fts (rowid, content, session_tag)
+            SELECT new.id, new.content, {SESSION_TAG_SQL}
+            FROM conversation_sessions WHERE session_id = new.session_id;
+        END
+        ''',
+        # 既にアーカイブにある行を取り込む（これまでの削除トリガーでインデックスから外れている）
+        '''
+        INSERT OR IGNORE INTO conversation_sessions (session_id, message_count)
+        SELECT DISTINCT session_id, 0 FROM conversations_archive
+        ''',
+        '''
+        UPDATE conversation_sessions SET archived_count = (
+            SELECT COUNT(*) FROM conversations_archive a WHERE a.session_id = conversation_sessions.session_id
+        )
+        ''',
+        f'''
+        INSERT INTO conversations_fts (rowid, content, session_tag)
+        SELECT a.id, a.content, {SESSION_TAG_SQL}
+        FROM conversations_archive a JOIN conversation_sessions USING (session_id)
+        ''',
+    ]),
+    (7, 'conversations_timestamp_index', [
+        # 保持期間（retention_days）を過ぎたメッセージを持つセッションを、全件走査せずに探す
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversations_timestamp
+        ON conversations (timestamp, session_id)
+        ''',
+    ]),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """適用済みの最新スキーマバージョンを取得"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(db_path: str) -> int:
+    """未適用のマイグレーションを順に適用し、適用後のバージョンを返す"""
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    try:
+        # 新規DBでは空きページを少しずつ解放できるようにする（テーブル作成前のみ有効）
+        if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+        current = get_schema_version(conn)
+        for version, name, statements in MIGRATIONS:
+            if version <= current:
+                continue
+
+            # 複数プロセスから同時に起動しても二重適用しないよう書き込みロックを取ってから再確認
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.execute('COMMIT')
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            logger.info(f"Applied schema migration {version}: {name}")
+
+        return get_schema_version(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,159 @@
+import os
+import base64
+import random
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from audio_codecs import AudioFormat
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    # 合成に使うモデル（null で tts_settings の quality モデル）
+    'model': None,
+    # 保存する形式（null で tts_settings の output_format）
+    'output_format': None,
+}
+
+FALLBACK_EMOTION = 'neutral'
+# 直前のフィラーを覚えておくセッション数の上限（古いものから忘れる）
+MAX_TRACKED_SESSIONS = 10000
+
+# (テキスト, 音声ID, モデルID, 形式ID) -> 音声データ
+Synthesizer = Callable[[str, str, str, str], bytes]
+
+
+@dataclass(frozen=True)
+class FillerClip:
+    """事前に合成したフィラー（相づち）音声"""
+    text: str
+    emotion: str
+    audio_data: str  # data URL
+
+
+def clip_file_name(text: str, voice_id: str, model_id: str, audio_format: AudioFormat) -> str:
+    """テキスト・音声・モデル・形式が同じなら同じファイル名（どれかが変われば合成し直す）"""
+    digest = hashlib.sha1('\0'.join((text, voice_id, model_id, audio_format.format_id)).encode('utf-8')).hexdigest()[:16]
+    return f"{digest}.{audio_format.codec}"
+
+
+class FillerBank:
+    """キャラクターごとのフィラー音声を保持し、ターン開始時に1つ選ぶクラス
+
+    フレーズはキャラクターの音声で一度だけ合成してローカルに保存し、以降は保存済みのファイルを
+    読み込むだけにする（ターンごとの上流 API 呼び出しは発生しない）。
+    選ぶときはユーザーの感情に合うフレーズから、同じセッションで直前と同じものを避けてランダムに選ぶ。
+    """
+
+    def __init__(self, cache_dir: str, settings_provider: Callable[[], Dict]):
+        self.cache_dir = cache_dir
+        self.settings_provider = settings_provider
+        self._clips: Dict[str, Dict[str, List[FillerClip]]] = {}
+        self._last_text: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._prepare_lock = threading.Lock()
+        self.emitted = 0
+        self.missed = 0
+        self.last_prepare: Optional[Dict] = None
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    # ---- 準備 ----
+
+    def prepare(self, phrases: Dict[str, Dict[str, List[str]]], voice_for: Callable[[str], Optional[str]],
+                synthesize: Optional[Synthesizer], model_id: str, audio_format: AudioFormat) -> Dict:
+        """全キャラクターのフレーズを読み込む（保存されていないものだけ synthesize で合成して保存する）
+
+        phrases は { personality: { emotion: [テキスト] } }。synthesize が None なら保存済みのものだけを使う。
+        """
+        with self._prepare_lock:
+            clips: Dict[str, Dict[str, List[FillerClip]]] = {}
+            result = {'loaded': 0, 'synthesized': 0, 'failed': 0, 'missing': 0}
+            for personality, by_emotion in phrases.items():
+                voice_id = voice_for(personality)
+                if not voice_id:
+                    continue
+                directory = os.path.join(self.cache_dir, personality)
+                for emotion, texts in (by_emotion or {}).items():
+                    for text in dict.fromkeys(texts or []):
+                        path = os.path.join(directory, clip_file_name(text, voice_id, model_id, audio_format))
+                        audio = self._load_or_synthesize(path, text, voice_id, model_id, audio_format, synthesize, result)
+                        if audio is None:
+                            continue
+                        data_url = f"data:{audio_format.mime_type};base64,{base64.b64encode(audio).decode('ascii')}"
+                        clips.setdefault(personality, {}).setdefault(emotion, []).append(FillerClip(text, emotion, data_url))
+            with self._lock:
+                self._clips = clips
+            self.last_prepare = result
+            logger.info(f"Filler audio ready: {result}")
+            return result
+
+    @staticmethod
+    def _load_or_synthesize(path: str, text: str, voice_id: str, model_id: str, audio_format: AudioFormat,
+                            synthesize: Optional[Synthesizer], result: Dict) -> Optional[bytes]:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                result['loaded'] += 1
+                return f.read()
+        if synthesize is None:
+            result['missing'] += 1
+            return None
+        try:
+            audio = synthesize(text, voice_id, model_id, audio_format.format_id)
+            if not audio:
+                raise RuntimeError('empty audio')
+        except Exception as e:
+            result['failed'] += 1
+            logger.warning(f"Failed to synthesize filler '{text}': {e}")
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書き込み途中のファイルを読まないよう、一時ファイルから置き換える
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(temp_path, path)
+        result['synthesized'] += 1
+        return audio
+
+    # ---- 選択 ----
+
+    def pick(self, personality: str, emotion: str, session_id: str) -> Optional[FillerClip]:
+        """ユーザーの感情に合うフィラーを選ぶ（同じセッションで直前と同じものは避ける。無ければ None）"""
+        if not self.settings()['enabled']:
+            return None
+        with self._lock:
+            by_emotion = self._clips.get(personality) or {}
+            candidates = by_emotion.get(emotion) or by_emotion.get(FALLBACK_EMOTION) or []
+            if not candidates:
+                self.missed += 1
+                return None
+            last_text = self._last_text.get(session_id)
+            if len(candidates) > 1:
+                candidates = [clip for clip in candidates if clip.text != last_text]
+            clip = random.choice(candidates)
+            self._last_text.pop(session_id, None)
+            self._last_text[session_id] = clip.text
+            if len(self._last_text) > MAX_TRACKED_SESSIONS:
+                self._last_text.pop(next(iter(self._last_text)))
+            self.emitted += 1
+            return clip
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.settings()['enabled'],
+                'clips': {
+                    personality: {emotion: len(clips) for emotion, clips in by_emotion.items()}
+                    for personality, by_emotion in self._clips.items()
+                },
+                'emitted': self.emitted,
+                'missed': self.missed,
+                'last_prepare': self.last_prepare,
+            }
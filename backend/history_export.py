@@ -0,0 +1,137 @@
+import json
+import zlib
+import base64
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+# 1回のクエリで読み出す行数（メモリ使用量はこの件数分で一定）
+EXPORT_BATCH_SIZE = 500
+# gzip 時にこの行数ごとにフラッシュして、クライアントへ早くバイトを届ける
+GZIP_FLUSH_ROWS = 200
+
+
+class CursorError(ValueError):
+    """カーソルトークンや範囲指定が不正な場合の例外"""
+
+
+def encode_cursor(session_id: str, after_id: int) -> str:
+    """再開用カーソルトークンを生成"""
+    payload = json.dumps({'s': session_id, 'a': after_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, session_id: str) -> int:
+    """カーソルトークンを検証し、再開位置（最後に出力したID）を返す"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        after_id = int(payload['a'])
+        token_session = payload['s']
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorError(f"Invalid cursor: {e}")
+    if token_session != session_id:
+        raise CursorError("Cursor belongs to a different session")
+    return after_id
+
+
+def normalize_timestamp(value: Optional[str]) -> Optional[str]:
+    """ISO形式の日時を SQLite の timestamp 形式（UTC, 'YYYY-MM-DD HH:MM:SS'）に変換"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise CursorError(f"Invalid timestamp: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def iter_history_rows(db_path: str, session_id: str, after_id: int = 0,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      limit: Optional[int] = None) -> Iterator[Tuple]:
+    """セッションの履歴を古い順に逐次取得するジェネレータ
+
+    長時間の読み取りトランザクションで書き込みをブロックしないよう、
+    (session_id, id) のキーセットで短いクエリを繰り返す。
+    保持期間を過ぎて conversations_archive に移したメッセージも id を引き継いでいるので、
+    両方を id 順に合わせて返す（各行の末尾が出どころ: 'live' / 'archive'）。
+    """
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch_size = EXPORT_BATCH_SIZE if remaining is None else min(EXPORT_BATCH_SIZE, remaining)
+            rows = conn.execute(
+                '''
+                SELECT id, role, content, emotion, timestamp, 'live' AS source
+                FROM conversations
+                WHERE session_id = ? AND id > ?
+                  AND (? IS NULL OR timestamp >= ?)
+                  AND (? IS NULL OR timestamp < ?)
+                UNION ALL
+                SELECT id, role, content, emotion, timestamp, 'archive' AS source
+                FROM conversations_archive
+                WHERE session_id = ? AND id > ?
+                  AND (? IS NULL OR timestamp >= ?)
+                  AND (? IS NULL OR timestamp < ?)
+                ORDER BY id
+                LIMIT ?
+                ''',
+                (session_id, after_id, since, since, until, until) * 2 + (batch_size,)
+            ).fetchall()
+            if not rows:
+                return
+
+            for row in rows:
+                yield row
+            after_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < batch_size:
+                return
+    finally:
+        conn.close()
+
+
+def iter_ndjson(db_path: str, session_id: str, after_id: int = 0,
+                since: Optional[str] = None, until: Optional[str] = None,
+                limit: Optional[int] = None) -> Iterator[bytes]:
+    """履歴を NDJSON 行として出力し、最後に再開用カーソル行を付ける"""
+    count = 0
+    last_id = after_id
+    for row in iter_history_rows(db_path, session_id, after_id, since, until, limit):
+        message: Dict = {
+            'id': row[0],
+            'role': row[1],
+            'content': row[2],
+            'emotion': row[3],
+            'timestamp': row[4],
+            'source': row[5],
+        }
+        yield (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        count += 1
+        last_id = row[0]
+
+    trailer = {
+        'type': 'cursor',
+        'count': count,
+        'cursor': encode_cursor(session_id, last_id),
+        # limit で打ち切った場合は続きがある可能性がある
+        'complete': limit is None or count < limit,
+    }
+    yield (json.dumps(trailer) + '\n').encode('utf-8')
+
+
+def gzip_stream(chunks: Iterator[bytes], flush_every: int = GZIP_FLUSH_ROWS) -> Iterator[bytes]:
+    """バイト列のストリームを逐次 gzip 圧縮する"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for index, chunk in enumerate(chunks, 1):
+        data = compressor.compress(chunk)
+        # 最初の行は即座に送り出し、以降は一定行数ごとにフラッシュ
+        if index == 1 or index % flush_every == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,302 @@
+import ssl
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'connect_timeout_s': 5,
+    'read_timeout_s': 30,
+    'total_timeout_s': 60,
+    # アイドル接続を保持する時間（この間に次のリクエストが来れば TCP/TLS ハンドシェイクを省ける）
+    'keepalive_s': 60,
+    'dns_cache_ttl_s': 300,
+    # ホストごとの最大接続数（未指定のホストは default_pool_size）
+    'default_pool_size': 10,
+    'pools': {},
+    # 社内プロキシ等で独自の CA を使う場合のみ指定（検証は常に有効）
+    'ca_bundle': None,
+}
+
+
+class _HostStats:
+    __slots__ = ('requests', 'errors', 'in_flight', 'peak_in_flight', 'connections_created',
+                 'connections_reused', 'connect_ms_total', 'queued', 'queue_ms_total')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connect_ms_total = 0.0
+        self.queued = 0
+        self.queue_ms_total = 0.0
+
+
+class _CountingTransport(httpx.BaseTransport):
+    """httpx のトランスポートを包み、リクエスト数・実行中の数・エラーを数える
+
+    接続エラー・タイムアウト・TLS の失敗は応答フックに届かないため、try/finally で必ず数える。
+    実行中の数はヘッダーを受信した時点で減らす（ストリーミング応答の本文の受信中は含まない）。
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, stats: _HostStats, lock: threading.Lock, trace: Callable):
+        self._transport = transport
+        self._stats = stats
+        self._lock = lock
+        self._trace = trace
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions['trace'] = self._trace
+        stats = self._stats
+        with self._lock:
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        failed = True
+        try:
+            response = self._transport.handle_request(request)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            with self._lock:
+                stats.in_flight -= 1
+                if failed:
+                    stats.errors += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class HttpClientManager:
+    """外部APIへの HTTP 接続を一元管理するクラス
+
+    ホストごとに接続プールを持ち、keep-alive で接続を使い回す（定常状態では TCP/TLS の
+    ハンドシェイクが発生しない）。TLS 証明書の検証は常に有効で、SSL コンテキストは全接続で共有する。
+
+    - 非同期（aiohttp）: 専用のイベントループスレッドでセッションを保持し、どのループからの
+      呼び出しもそのループで実行する（asyncio.run のたびにセッションを作り直さない）
+    - 同期（httpx）: SDK に渡すクライアントをホストごとに1つ保持する
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict]):
+        self.settings_provider = settings_provider
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._stats: Dict[str, _HostStats] = {}
+        atexit.register(self.close)
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    def pool_size(self, host: str, settings: Optional[Dict] = None) -> int:
+        settings = settings or self.settings()
+        return int((settings['pools'] or {}).get(host, settings['default_pool_size']))
+
+    def ssl_context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            with self._lock:
+                if self._ssl_context is None:
+                    self._ssl_context = ssl.create_default_context(cafile=self.settings()['ca_bundle'])
+        return self._ssl_context
+
+    def _host_stats(self, host: str) -> _HostStats:
+        with self._lock:
+            stats = self._stats.get(host)
+            if stats is None:
+                stats = self._stats[host] = _HostStats()
+            return stats
+
+    # ---- 非同期（aiohttp） ----
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name='http-client-loop', daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    def _trace_config(self, stats: _HostStats) -> aiohttp.TraceConfig:
+        """接続の新規作成・再利用・プール待ちを計測する"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_create_start(session, context, params):
+            context.connect_started = time.perf_counter()
+
+        async def on_create_end(session, context, params):
+            stats.connections_created += 1
+            stats.connect_ms_total += (time.perf_counter() - context.connect_started) * 1000
+
+        async def on_reuse(session, context, params):
+            stats.connections_reused += 1
+
+        async def on_queued_start(session, context, params):
+            context.queue_started = time.perf_counter()
+
+        async def on_queued_end(session, context, params):
+            stats.queued += 1
+            stats.queue_ms_total += (time.perf_counter() - context.queue_started) * 1000
+
+        trace.on_connection_create_start.append(on_create_start)
+        trace.on_connection_create_end.append(on_create_end)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        return trace
+
+    def _session_for(self, host: str) -> aiohttp.ClientSession:
+        """ホストのセッション（専用ループ上で呼ぶこと）"""
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            settings = self.settings()
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size(host, settings),
+                ttl_dns_cache=settings['dns_cache_ttl_s'],
+                keepalive_timeout=settings['keepalive_s'],
+                ssl=self.ssl_context(),
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=settings['total_timeout_s'],
+                connect=settings['connect_timeout_s'],
+                sock_read=settings['read_timeout_s'],
+            )
+            session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout,
+                trace_configs=[self._trace_config(self._host_stats(host))]
+            )
+            self._sessions[host] = session
+        return session
+
+    async def _fetch_json(self, method: str, url: str, **kwargs) -> Tuple[int, Any]:
+        host = urlsplit(url).hostname or ''
+        stats = self._host_stats(host)
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            async with self._session_for(host).request(method, url, **kwargs) as response:
+                body = await response.json(content_type=None) if response.status < 500 else None
+                return response.status, body
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    async def fetch_json(self, method: str, url: str, **kwargs) -> Tuple[int, Any]:
+        """リクエストを送り、(ステータス, JSON 本文) を返す（どのイベントループからでも呼べる）"""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._fetch_json(method, url, **kwargs), loop)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    # ---- 同期（httpx） ----
+
+    def sync_client(self, host: str) -> httpx.Client:
+        """SDK（ElevenLabs 等）に渡す、ホストごとの共有クライアント"""
+        with self._lock:
+            client = self._sync_clients.get(host)
+            if client is not None:
+                return client
+        settings = self.settings()
+        stats = self._host_stats(host)
+        size = self.pool_size(host, settings)
+
+        connect_started: Dict[int, float] = {}
+
+        def trace(event_name: str, info: Dict):
+            # httpcore のトレース: 新規接続（TCP 接続〜TLS ハンドシェイク）の回数と所要時間
+            if event_name == 'connection.connect_tcp.started':
+                connect_started[threading.get_ident()] = time.perf_counter()
+            elif event_name == 'connection.start_tls.complete':
+                started = connect_started.pop(threading.get_ident(), None)
+                if started is not None:
+                    with self._lock:
+                        stats.connections_created += 1
+                        stats.connect_ms_total += (time.perf_counter() - started) * 1000
+            elif event_name.endswith('.failed'):
+                connect_started.pop(threading.get_ident(), None)
+
+        transport = httpx.HTTPTransport(
+            verify=self.ssl_context(),
+            limits=httpx.Limits(
+                max_connections=size,
+                max_keepalive_connections=size,
+                keepalive_expiry=settings['keepalive_s'],
+            ),
+        )
+        client = httpx.Client(
+            transport=_CountingTransport(transport, stats, self._lock, trace),
+            timeout=httpx.Timeout(
+                settings['total_timeout_s'],
+                connect=settings['connect_timeout_s'],
+                read=settings['read_timeout_s'],
+            ),
+        )
+        with self._lock:
+            existing = self._sync_clients.setdefault(host, client)
+        if existing is not client:
+            # 同時に作られた場合は先に登録された方を使う
+            client.close()
+        return existing
+
+    # ---- 終了・計測 ----
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+            clients, self._sync_clients = list(self._sync_clients.values()), {}
+            loop = self._loop
+        for client in clients:
+            client.close()
+        if loop is not None and loop.is_running():
+            for session in sessions:
+                try:
+                    asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=2)
+                except Exception as e:
+                    logger.debug(f"Failed to close HTTP session: {e}")
+
+    def report(self) -> Dict:
+        settings = self.settings()
+        with self._lock:
+            hosts = {}
+            for host, stats in self._stats.items():
+                size = self.pool_size(host, settings)
+                connections = stats.connections_created + stats.connections_reused
+                hosts[host] = {
+                    'pool_size': size,
+                    'in_flight': stats.in_flight,
+                    'peak_in_flight': stats.peak_in_flight,
+                    'utilization': round(stats.in_flight / size, 2) if size else None,
+                    'requests': stats.requests,
+                    'errors': stats.errors,
+                    'connections_created': stats.connections_created,
+                    # 非同期側のみ計測（httpx は再利用を通知しないため、作成数と要求数の差で見る）
+                    'connections_reused': stats.connections_reused,
+                    'reuse_ratio': round(stats.connections_reused / connections, 3) if connections else None,
+                    'avg_connect_ms': round(stats.connect_ms_total / stats.connections_created, 1)
+                    if stats.connections_created else None,
+                    'pool_waits': stats.queued,
+                    'avg_pool_wait_ms': round(stats.queue_ms_total / stats.queued, 1) if stats.queued else None,
+                }
+            return {'hosts': hosts}
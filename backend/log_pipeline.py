@@ -0,0 +1,200 @@
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+DEFAULT_SETTINGS = {
+    # text: 従来どおりの1行テキスト / json: 1行1レコードの JSON（構造化ログ）
+    'format': 'text',
+    'root_level': 'INFO',
+    # サブシステム（ロガー名）ごとのレベル { 'app.tts': 'DEBUG', 'werkzeug': 'WARNING' }
+    'levels': {},
+    # DEBUG レコードを呼び出し箇所ごとに N 件に1件だけ残す { ロガー名の前方一致: N }
+    'sampling': {},
+    'queue_size': 10000,
+}
+
+TEXT_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+# JSON に含める extra（logger.debug(..., extra={...}) で渡されたもの）
+STRUCTURED_FIELDS = ('session_id', 'turn_id', 'chunk_index', 'message_id', 'duration_ms')
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコードを1行の JSON にする"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """高頻度の DEBUG レコードを、呼び出し箇所（ロガー名とメッセージのテンプレート）ごとに間引く"""
+
+    def __init__(self, rates: Optional[Dict[str, int]] = None, max_keys: int = 10000):
+        super().__init__()
+        self.max_keys = max_keys
+        self.set_rates(rates or {})
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+
+    def set_rates(self, rates: Dict[str, int]):
+        # 長い接頭辞ほど優先
+        self._rates = sorted(((prefix, max(1, int(every))) for prefix, every in rates.items()),
+                             key=lambda item: len(item[0]), reverse=True)
+
+    def _rate_for(self, name: str) -> int:
+        for prefix, every in self._rates:
+            if name == prefix or name.startswith(prefix + '.') or prefix == '*':
+                return every
+        return 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not self._rates:
+            return True
+        every = self._rate_for(record.name)
+        if every <= 1:
+            return True
+        # メッセージは未フォーマットのテンプレートなので、呼び出し箇所ごとに数えられる
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        with self._lock:
+            if len(self._counts) >= self.max_keys and key not in self._counts:
+                self._counts.clear()
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+            if count % every == 0:
+                return True
+            self.sampled_out += 1
+            return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """レコードをフォーマットせずにキューへ入れるハンドラ（呼び出し元のスレッドでは I/O も文字列化もしない）
+
+    標準の QueueHandler.prepare はここでメッセージを組み立てるが、同じプロセス内のキューなので
+    引数付きのまま渡し、書き込みスレッドでフォーマットする。キューが満杯なら待たずに捨てて数える。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.enqueued = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """ログをメモリ上のキュー経由でバックグラウンドのスレッドから書き出すパイプライン
+
+    ルートロガーのハンドラを QueueHandler に置き換え、元のハンドラ（無ければ標準エラー出力）は
+    QueueListener のスレッドで実行する。レベルとサンプリングは設定のリロードで変更できる。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listener: Optional[QueueListener] = None
+        self._handler: Optional[NonBlockingQueueHandler] = None
+        self._sampling = SamplingFilter()
+        self._output_handlers: List[logging.Handler] = []
+        self._original_handlers: List[logging.Handler] = []
+        self._configured_levels: Dict[str, str] = {}
+        self.settings: Dict = dict(DEFAULT_SETTINGS)
+
+    def configure(self, settings: Optional[Dict] = None):
+        """パイプラインを開始する（2回目以降は何もしない）
+
+        settings を省略すると、開始前に apply_settings で受け取った設定（無ければデフォルト）を使う。
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            merged = dict(self.settings)
+            merged.update(settings or {})
+            root = logging.getLogger()
+            self._original_handlers = list(root.handlers)
+            self._output_handlers = self._original_handlers or [logging.StreamHandler(sys.stderr)]
+            log_queue: queue.Queue = queue.Queue(maxsize=int(merged['queue_size']))
+            self._handler = NonBlockingQueueHandler(log_queue)
+            self._handler.addFilter(self._sampling)
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            root.addHandler(self._handler)
+            self._listener = QueueListener(log_queue, *self._output_handlers, respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self.stop)
+        self.apply_settings(merged)
+        logging.getLogger(__name__).info('Logging pipeline started (queue-based, non-blocking)')
+
+    def apply_settings(self, settings: Optional[Dict]):
+        """フォーマット・レベル・サンプリングを反映（キューと書き込みスレッドはそのまま）"""
+        merged = dict(DEFAULT_SETTINGS)
+        merged.update(settings or {})
+        with self._lock:
+            formatter = JsonFormatter() if merged['format'] == 'json' else logging.Formatter(TEXT_FORMAT)
+            for handler in self._output_handlers:
+                handler.setFormatter(formatter)
+            logging.getLogger().setLevel(str(merged['root_level']).upper())
+            levels = {name: str(level).upper() for name, level in (merged['levels'] or {}).items()}
+            # 設定から消えたロガーは親のレベルに戻す
+            for name in set(self._configured_levels) - set(levels):
+                logging.getLogger(name).setLevel(logging.NOTSET)
+            for name, level in levels.items():
+                logging.getLogger(name).setLevel(level)
+            self._configured_levels = levels
+            self._sampling.set_rates(merged['sampling'] or {})
+            self.settings = merged
+
+    def stop(self):
+        """キューに残ったレコードを書き出して停止し、ルートロガーのハンドラを元に戻す
+
+        停止後のログ（atexit の後に出るものなど）はキューに入れず、元のハンドラで直接書き出す。
+        """
+        with self._lock:
+            listener, self._listener = self._listener, None
+            if listener is None:
+                return
+            root = logging.getLogger()
+            root.removeHandler(self._handler)
+            for handler in self._original_handlers:
+                root.addHandler(handler)
+        listener.stop()
+
+    def stats(self) -> Dict:
+        handler = self._handler
+        return {
+            'running': self._listener is not None,
+            'queued': handler.queue.qsize() if handler else 0,
+            'enqueued': handler.enqueued if handler else 0,
+            'dropped': handler.dropped if handler else 0,
+            'sampled_out': self._sampling.sampled_out,
+            'format': self.settings['format'],
+            'levels': dict(self._configured_levels),
+            'sampling': dict(self.settings['sampling'] or {}),
+        }
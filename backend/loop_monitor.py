@@ -0,0 +1,148 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'interval_ms': 100,
+    'warn_ms': 100,
+}
+
+
+class LoopLagMonitor:
+    """asyncio イベントループのスケジューリング遅延（ループラグ）を計測するクラス
+
+    監視対象のループで一定間隔の sleep を繰り返し、予定より遅れて再開した時間をラグとして記録する。
+    別スレッドのウォッチドッグがハートビートの途絶を検出すると、その時点でループのスレッドが
+    実行しているスタックをログに出す（ループをブロックした呼び出しを特定するため）。
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict], history_size: int = 3000):
+        self.settings_provider = settings_provider
+        self.samples = deque(maxlen=history_size)
+        self.over_threshold = 0
+        self.max_lag_ms = 0.0
+        self.last_block: Optional[Dict] = None
+        # ループのスレッドID -> (最後のハートビート時刻, 警告済みか)
+        self._heartbeats: Dict[int, list] = {}
+        self._watched_loops = set()
+        self._lock = threading.Lock()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    # ---- ループ側 ----
+
+    def watch_current_loop(self):
+        """実行中のループに計測タスクを追加（ループごとに一度だけ）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if id(loop) in self._watched_loops:
+                return
+            self._watched_loops.add(id(loop))
+        loop.create_task(self._sample_loop(loop))
+        self._ensure_watchdog()
+
+    def run(self, coro):
+        """asyncio.run の代わりに使う（コルーチンの実行中のループラグを計測する）"""
+        async def monitored():
+            self.watch_current_loop()
+            return await coro
+        return asyncio.run(monitored())
+
+    async def _sample_loop(self, loop: asyncio.AbstractEventLoop):
+        thread_id = threading.get_ident()
+        try:
+            while True:
+                interval = self.settings()['interval_ms'] / 1000
+                with self._lock:
+                    self._heartbeats[thread_id] = [time.perf_counter() + interval, False]
+                expected = loop.time() + interval
+                await asyncio.sleep(interval)
+                self.record((loop.time() - expected) * 1000)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            with self._lock:
+                self._heartbeats.pop(thread_id, None)
+                self._watched_loops.discard(id(loop))
+
+    def record(self, lag_ms: float):
+        lag_ms = max(0.0, lag_ms)
+        warn_ms = self.settings()['warn_ms']
+        with self._lock:
+            self.samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= warn_ms:
+                self.over_threshold += 1
+        if lag_ms >= warn_ms:
+            logger.warning(f"[PERF] Event loop lag {lag_ms:.1f}ms (threshold {warn_ms}ms)")
+
+    # ---- ウォッチドッグ ----
+
+    def _ensure_watchdog(self):
+        with self._lock:
+            if self._watchdog and self._watchdog.is_alive():
+                return
+            self._watchdog = threading.Thread(target=self._watchdog_loop, name='loop-lag-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def _watchdog_loop(self):
+        while True:
+            settings = self.settings()
+            time.sleep(settings['interval_ms'] / 1000)
+            now = time.perf_counter()
+            with self._lock:
+                stalled = [
+                    (thread_id, (now - due) * 1000)
+                    for thread_id, (due, reported) in self._heartbeats.items()
+                    if not reported and (now - due) * 1000 >= settings['warn_ms']
+                ]
+                for thread_id, _ in stalled:
+                    self._heartbeats[thread_id][1] = True
+            for thread_id, blocked_ms in stalled:
+                self._report_block(thread_id, blocked_ms)
+
+    def _report_block(self, thread_id: int, blocked_ms: float):
+        """ループをブロックしているスタックを記録"""
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            return
+        stack = ''.join(traceback.format_stack(frame, limit=12))
+        self.last_block = {
+            'timestamp': time.time(),
+            'blocked_ms': round(blocked_ms, 1),
+            'stack': stack,
+        }
+        logger.warning(f"[PERF] Event loop blocked for {blocked_ms:.0f}ms+, current stack:\n{stack}")
+
+    # ---- 計測結果 ----
+
+    def report(self) -> Dict:
+        with self._lock:
+            ordered = sorted(self.samples)
+            count = len(ordered)
+
+            def percentile(ratio: float) -> Optional[float]:
+                return round(ordered[min(count - 1, int(count * ratio))], 2) if count else None
+
+            return {
+                'samples': count,
+                'p50_ms': percentile(0.5),
+                'p95_ms': percentile(0.95),
+                'p99_ms': percentile(0.99),
+                'max_ms': round(self.max_lag_ms, 2),
+                'over_threshold': self.over_threshold,
+                'warn_ms': self.settings()['warn_ms'],
+                'watched_loops': len(self._watched_loops),
+                'last_block': self.last_block,
+            }
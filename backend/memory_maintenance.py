@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from profile_cache import ROLLUP_CONTEXT_KEY, parse_context_data
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'interval_seconds': 600,
+    'retention_messages_per_session': 500,
+    'retention_days': 90,
+    'session_overrides': {},
+    'batch_size': 200,
+    'run_time_budget_ms': 200,
+    'step_pause_ms': 20,
+    'vacuum_pages_per_step': 64,
+}
+
+# ロールアップ要約に残す直近のユーザー発話数と1件あたりの文字数
+SUMMARY_RECENT_UTTERANCES = 5
+SUMMARY_UTTERANCE_CHARS = 40
+
+
+class MemoryMaintenance:
+    """conversations テーブルの保持・ロールアップ・コンパクションを行うクラス
+
+    古いメッセージを conversations_archive に移し、user_info.context_data に要約を残す。
+    すべての処理は小さなトランザクションに分割し、1回の実行時間を上限で打ち切るため
+    通常の書き込みを長時間ブロックしない。
+    """
+
+    def __init__(self, db_path_provider: Callable[[], str],
+                 settings_provider: Callable[[], Dict], history_size: int = 288,
+                 on_profile_changed: Optional[Callable[[str], None]] = None):
+        self.db_path_provider = db_path_provider
+        self.settings_provider = settings_provider
+        # user_info を書き換えたセッションを通知する（プロフィールキャッシュの無効化用）
+        self.on_profile_changed = on_profile_changed
+        self.history = deque(maxlen=history_size)
+        self.last_run: Optional[Dict] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._run_lock = threading.Lock()
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    def connect(self) -> sqlite3.Connection:
+        # 手動でトランザクションを制御する
+        conn = sqlite3.connect(self.db_path_provider(), timeout=5, isolation_level=None)
+        conn.execute('PRAGMA busy_timeout = 5000')
+        return conn
+
+    # ---- スケジューラ ----
+
+    def start(self):
+        """バックグラウンドのメンテナンススレッドを開始"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='memory-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _loop(self):
+        while True:
+            settings = self.settings()
+            if settings['enabled']:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Memory maintenance failed: {e}")
+            if self._stop_event.wait(settings['interval_seconds']):
+                break
+
+    # ---- 1回分の実行 ----
+
+    def run_once(self) -> Dict:
+        """時間予算内でロールアップ・バキューム・統計更新を行い、結果を返す"""
+        db_path = self.db_path_provider()
+        if db_path == ':memory:':
+            return {}
+
+        with self._run_lock:
+            settings = self.settings()
+            started = time.time()
+            deadline = started + settings['run_time_budget_ms'] / 1000
+            conn = self.connect()
+            try:
+                archived = self.rollup(conn, settings, deadline)
+                freed_pages = self.incremental_vacuum(conn, settings, deadline)
+                analyzed = self.analyze(conn, deadline)
+                sample = self.measure(conn)
+            finally:
+                conn.close()
+
+            result = dict(
+                sample,
+                archived_messages=archived,
+                freed_pages=freed_pages,
+                analyzed=analyzed,
+                duration_ms=round((time.time() - started) * 1000, 1),
+            )
+            self.history.append(sample)
+            self.last_run = result
+            logger.info(
+                f"[PERF] Memory maintenance: archived={archived} freed_pages={freed_pages} "
+                f"db_bytes={sample['db_bytes']} history_query_ms={sample['history_query_ms']}"
+            )
+            return result
+
+    def rollup(self, conn: sqlite3.Connection, settings: Dict, deadline: float) -> int:
+        """保持ポリシーを超えたメッセージをアーカイブし、要約を user_info に残す"""
+        archived = 0
+        for session_id in self.sessions_over_retention(conn, settings):
+            while time.time() < deadline:
+                moved = self.rollup_session_batch(conn, session_id, settings)
+                archived += moved
+                if moved < settings['batch_size']:
+                    break
+                # 次のバッチの前に他の書き込みへロックを譲る
+                time.sleep(settings['step_pause_ms'] / 1000)
+            if time.time() >= deadline:
+                break
+        return archived
+
+    def sessions_over_retention(self, conn: sqlite3.Connection, settings: Dict) -> List[str]:
+        """保持件数または保持期間を超えたセッション一覧"""
+        min_keep = min([settings['retention_messages_per_session']]
+                       + list((settings['session_overrides'] or {}).values()))
+        # 件数はトリガーが保つ conversation_sessions.message_count を使う（conversations を集計しない）
+        sessions = {row[0] for row in conn.execute(
+            'SELECT session_id FROM conversation_sessions WHERE message_count > ?',
+            (min_keep,)
+        )}
+        if settings['retention_days']:
+            # 期限切れの行は毎回アーカイブされて少ないので、timestamp のインデックスを範囲走査する
+            # （指定しないとプランナーは DISTINCT のためにセッション順のインデックスを全走査する）
+            sessions.update(row[0] for row in conn.execute(
+                'SELECT DISTINCT session_id FROM conversations INDEXED BY idx_conversations_timestamp '
+                "WHERE timestamp < datetime('now', ?)",
+                (f"-{int(settings['retention_days'])} days",)
+            ))
+        return sorted(sessions)
+
+    def rollup_session_batch(self, conn: sqlite3.Connection, session_id: str, settings: Dict) -> int:
+        """1セッション分の古いメッセージを最大 batch_size 件アーカイブ"""
+        keep = (settings['session_overrides'] or {}).get(session_id, settings['retention_messages_per_session'])
+        boundary = conn.execute(
+            'SELECT id FROM conversations WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?',
+            (session_id, keep)
+        ).fetchone()
+        boundary_id = boundary[0] if boundary else 0
+        cutoff = f"-{int(settings['retention_days'])} days" if settings['retention_days'] else None
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                '''
+                SELECT id, role, content, emotion, timestamp
+                FROM conversations
+                WHERE session_id = ?
+                  AND (id <= ? OR (? IS NOT NULL AND timestamp < datetime('now', ?)))
+                ORDER BY id
+                LIMIT ?
+                ''',
+                (session_id, boundary_id, cutoff, cutoff, settings['batch_size'])
+            ).fetchall()
+            if not rows:
+                conn.execute('COMMIT')
+                return 0
+
+            ids = [row[0] for row in rows]
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(
+                f'''
+                INSERT OR IGNORE INTO conversations_archive (id, session_id, role, content, emotion, timestamp)
+                SELECT id, session_id, role, content, emotion, timestamp
+                FROM conversations WHERE id IN ({placeholders})
+                ''',
+                ids
+            )
+            conn.execute(f'DELETE FROM conversations WHERE id IN ({placeholders})', ids)
+            self.update_rollup_summary(conn, session_id, rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        # コミット後にキャッシュを破棄する（その前後にキャッシュから書き込まれる context_data は、
+        # ProfileCache.flush が同じトランザクション内で要約を引き継ぐ）
+        if self.on_profile_changed:
+            self.on_profile_changed(session_id)
+        return len(rows)
+
+    def update_rollup_summary(self, conn: sqlite3.Connection, session_id: str, rows: List[tuple]):
+        """アーカイブしたメッセージの要約を user_info.context_data にマージ"""
+        existing = conn.execute(
+            'SELECT context_data FROM user_info WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        context = self.parse_context_data(existing[0] if existing else None)
+
+        rollup = context.get(ROLLUP_CONTEXT_KEY) or {}
+        emotions = Counter(rollup.get('emotions') or {})
+        emotions.update(row[3] or 'neutral' for row in rows)
+        recent = list(rollup.get('recent_user_utterances') or [])
+        recent.extend(row[2][:SUMMARY_UTTERANCE_CHARS] for row in rows if row[1] == 'user' and row[2])
+
+        context[ROLLUP_CONTEXT_KEY] = {
+            'archived_messages': int(rollup.get('archived_messages', 0)) + len(rows),
+            'first_timestamp': rollup.get('first_timestamp') or rows[0][4],
+            'last_timestamp': rows[-1][4],
+            'emotions': dict(emotions),
+            'recent_user_utterances': recent[-SUMMARY_RECENT_UTTERANCES:],
+        }
+
+        conn.execute(
+            '''
+            INSERT INTO user_info (session_id, context_data) VALUES (?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET context_data = excluded.context_data
+            ''',
+            (session_id, json.dumps(context, ensure_ascii=False))
+        )
+
+    @staticmethod
+    def parse_context_data(context_data: Optional[str]) -> Dict:
+        """context_data をJSON辞書として解釈（プレーンテキストは note として保持）"""
+        return parse_context_data(context_data)
+
+    def incremental_vacuum(self, conn: sqlite3.Connection, settings: Dict, deadline: float) -> int:
+        """空きページを少しずつ解放（auto_vacuum=INCREMENTAL のDBのみ有効）"""
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        freed = 0
+        while time.time() < deadline:
+            freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if freelist == 0:
+                break
+            pages = min(freelist, settings['vacuum_pages_per_step'])
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            freed += pages
+            time.sleep(settings['step_pause_ms'] / 1000)
+        return freed
+
+    def analyze(self, conn: sqlite3.Connection, deadline: float) -> bool:
+        """サンプリング上限付きで統計を更新（必要な場合のみ ANALYZE される）"""
+        if time.time() >= deadline:
+            return False
+        conn.execute('PRAGMA analysis_limit = 400')
+        conn.execute('PRAGMA optimize')
+        return True
+
+    def measure(self, conn: sqlite3.Connection) -> Dict:
+        """DBサイズと履歴クエリのレイテンシを計測"""
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        # 全件の COUNT(*) は毎回テーブルを走査するので、セッションごとの件数の合計を使う
+        conversations, archived = conn.execute(
+            'SELECT COALESCE(SUM(message_count), 0), COALESCE(SUM(archived_count), 0) FROM conversation_sessions'
+        ).fetchone()
+
+        # 最新メッセージのセッションで、実際のターンと同じ履歴クエリを計測
+        latest = conn.execute('SELECT session_id FROM conversations ORDER BY id DESC LIMIT 1').fetchone()
+        query_ms = None
+        if latest:
+            query_start = time.perf_counter()
+            conn.execute(
+                'SELECT role, content, emotion, timestamp FROM conversations '
+                'WHERE session_id = ? ORDER BY id DESC LIMIT 20',
+                (latest[0],)
+            ).fetchall()
+            query_ms = round((time.perf_counter() - query_start) * 1000, 3)
+
+        db_path = self.db_path_provider()
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'db_bytes': page_size * page_count,
+            'file_bytes': os.path.getsize(db_path) if os.path.exists(db_path) else None,
+            'free_pages': freelist,
+            'conversations': conversations,
+            'archived_conversations': archived,
+            'history_query_ms': query_ms,
+        }
+
+    def report(self) -> Dict:
+        """直近の実行結果とDBサイズ・クエリレイテンシの推移"""
+        samples = list(self.history)
+        trend = {}
+        if len(samples) >= 2:
+            first, last = samples[0], samples[-1]
+            trend['db_bytes_change'] = last['db_bytes'] - first['db_bytes']
+            if first['history_query_ms'] is not None and last['history_query_ms'] is not None:
+                trend['history_query_ms_change'] = round(last['history_query_ms'] - first['history_query_ms'], 3)
+        return {
+            'last_run': self.last_run,
+            'trend': trend,
+            'samples': samples,
+        }
@@ -0,0 +1,150 @@
+import re
+import time
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+from db_migrations import SESSION_TAG_BASE, SESSION_TAG_RADIX
+
+logger = logging.getLogger(__name__)
+
+# trigram トークナイザは3文字未満の語を検索できない
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 8
+# 漢字・カタカナ・英数字の連続を検索語とする（ひらがなは助詞・語尾が多いため除外）
+TERM_PATTERN = re.compile(r'[一-鿿々゠-ヿｦ-ﾟA-Za-z0-9０-９Ａ-Ｚａ-ｚ]+')
+# この件数以下のセッションは全文検索より範囲走査の方が速い。
+# 会話の保持件数（maintenance.retention_messages_per_session の既定値）に合わせ、
+# アーカイブを含めてそれを超えたセッションは全文検索を使う
+SCAN_THRESHOLD = 500
+# 進捗ハンドラを呼ぶ間隔（SQLite VM 命令数）
+PROGRESS_INTERVAL = 1000
+
+
+def extract_terms(text: str) -> List[str]:
+    """ユーザー入力から検索語を抽出（長い語ほど識別力が高いので優先）"""
+    terms = []
+    for term in TERM_PATTERN.findall(text or ''):
+        if len(term) >= MIN_TERM_LENGTH and term not in terms:
+            terms.append(term)
+    terms.sort(key=len, reverse=True)
+    return terms[:MAX_TERMS]
+
+
+def build_match_query(terms: List[str]) -> str:
+    """検索語から FTS5 の MATCH 式（語の OR）を組み立てる"""
+    return ' OR '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def session_tag(session_key: int) -> str:
+    """セッションキーを FTS の session_tag 列と同じ3文字に符号化"""
+    return ''.join(
+        chr(SESSION_TAG_BASE + (session_key // divisor) % SESSION_TAG_RADIX)
+        for divisor in (SESSION_TAG_RADIX * SESSION_TAG_RADIX, SESSION_TAG_RADIX, 1)
+    )
+
+
+def search_conversations(conn: sqlite3.Connection, session_id: str, query: str,
+                         top_k: int = 5, budget_ms: float = 50,
+                         before_id: Optional[int] = None, strategy: str = 'auto') -> List[Dict]:
+    """セッション内の過去メッセージ（アーカイブ済みを含む）を関連度順に top_k 件検索
+
+    メッセージ数（アーカイブ済みを含む）が SCAN_THRESHOLD 以下のセッションはインデックスの範囲走査、
+    それより大きいセッションは FTS5 インデックスを使う（strategy で固定も可能）。
+    budget_ms を超えたクエリは中断し、空の結果を返す（ターン処理を遅らせない）。
+    before_id を指定すると、それより前のメッセージのみを対象にする。
+    """
+    terms = extract_terms(query)
+    if not terms:
+        return []
+
+    session = conn.execute(
+        'SELECT session_key, message_count + archived_count FROM conversation_sessions WHERE session_id = ?',
+        (session_id,)
+    ).fetchone()
+    if not session:
+        return []
+    session_key, message_count = session
+    if strategy == 'auto':
+        strategy = 'scan' if message_count <= SCAN_THRESHOLD else 'fts'
+
+    deadline = time.perf_counter() + budget_ms / 1000
+    conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, PROGRESS_INTERVAL)
+    try:
+        if strategy == 'scan':
+            return scan_session(conn, session_id, terms, top_k, before_id)
+        return search_fts(conn, session_id, session_key, terms, top_k, before_id)
+    except sqlite3.OperationalError as e:
+        if 'interrupted' in str(e):
+            logger.warning(f"Memory search exceeded {budget_ms}ms budget for session {session_id}")
+            return []
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def search_fts(conn: sqlite3.Connection, session_id: str, session_key: int, terms: List[str],
+               top_k: int, before_id: Optional[int]) -> List[Dict]:
+    """FTS5 インデックスで検索し、bm25 の関連度順に返す
+
+    アーカイブに移した行も同じ id のままインデックスに残っているので、両方のテーブルから本文を引く。
+    """
+    # セッションの絞り込みを MATCH 内で行い、そのセッションの行だけを評価する
+    match_query = f'session_tag : "{session_tag(session_key)}" AND content : ({build_match_query(terms)})'
+    rows = conn.execute(
+        '''
+        SELECT conversations_fts.rowid,
+               COALESCE(c.role, a.role), COALESCE(c.content, a.content), COALESCE(c.emotion, a.emotion),
+               COALESCE(c.timestamp, a.timestamp), bm25(conversations_fts, 1.0, 0.0) AS score
+        FROM conversations_fts
+        LEFT JOIN conversations c ON c.id = conversations_fts.rowid
+        LEFT JOIN conversations_archive a ON a.id = conversations_fts.rowid AND c.id IS NULL
+        WHERE conversations_fts MATCH ?
+          AND COALESCE(c.session_id, a.session_id) = ?
+          AND (? IS NULL OR conversations_fts.rowid < ?)
+        ORDER BY score
+        LIMIT ?
+        ''',
+        (match_query, session_id, before_id, before_id, top_k)
+    ).fetchall()
+    # bm25 は小さいほど関連度が高いので符号を反転
+    return [to_result(row[:5], -row[5]) for row in rows]
+
+
+def scan_session(conn: sqlite3.Connection, session_id: str, terms: List[str],
+                 top_k: int, before_id: Optional[int]) -> List[Dict]:
+    """小さいセッションをインデックス範囲走査で検索し、一致した語の長さの合計でスコア付け"""
+    conditions = ' OR '.join(['instr(lower(content), ?) > 0'] * len(terms))
+    lowered = [term.lower() for term in terms]
+    rows = conn.execute(
+        f'''
+        SELECT id, role, content, emotion, timestamp
+        FROM conversations
+        WHERE session_id = ? AND (? IS NULL OR id < ?) AND ({conditions})
+        UNION ALL
+        SELECT id, role, content, emotion, timestamp
+        FROM conversations_archive
+        WHERE session_id = ? AND (? IS NULL OR id < ?) AND ({conditions})
+        ''',
+        ([session_id, before_id, before_id] + lowered) * 2
+    ).fetchall()
+
+    scored = []
+    for row in rows:
+        content = row[2].lower()
+        score = sum(len(term) for term in lowered if term in content)
+        scored.append((score, row[0], row))
+    # スコアが同じなら新しいメッセージを優先
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [to_result(row, score) for score, _, row in scored[:top_k]]
+
+
+def to_result(row: tuple, score: float) -> Dict:
+    return {
+        'id': row[0],
+        'role': row[1],
+        'content': row[2],
+        'emotion': row[3],
+        'timestamp': row[4],
+        'score': round(score, 4),
+    }
@@ -0,0 +1,411 @@
+import os
+import glob
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from db_migrations import apply_migrations
+from memory_maintenance import MemoryMaintenance
+
+logger = logging.getLogger(__name__)
+
+# 再シャーディングで1トランザクションに書き込む最大行数
+RESHARD_BATCH_SIZE = 2000
+
+
+def shard_index(session_id: str, shard_count: int) -> int:
+    """session_id からシャード番号を決める（プロセスや Python のバージョンによらず安定）"""
+    if shard_count <= 1:
+        return 0
+    digest = hashlib.blake2b(session_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+
+def shard_paths(base_path: str, shard_count: int) -> List[str]:
+    """シャードのファイルパス一覧（1シャードなら base_path そのもの）
+
+    memory.db を 4 シャードにすると memory.shard00.db 〜 memory.shard03.db になる。
+    """
+    if shard_count <= 1:
+        return [base_path]
+    root, ext = os.path.splitext(base_path)
+    return [f"{root}.shard{index:02d}{ext or '.db'}" for index in range(shard_count)]
+
+
+class ShardLayoutError(RuntimeError):
+    """DBファイルのシャード構成が shard_count と合わない場合の例外（再シャーディングが必要）"""
+
+
+def _stored_rows(path: str) -> int:
+    """会話とユーザー情報の行数（テーブルが無ければ 0）"""
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        total = 0
+        for table in ('conversations', 'user_info'):
+            try:
+                total += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            except sqlite3.OperationalError:
+                pass
+        return total
+    finally:
+        conn.close()
+
+
+def read_shard_layout(path: str) -> Optional[Tuple[int, int]]:
+    """ファイルに記録された (シャード数, シャード番号)。未記録なら None"""
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        row = conn.execute('SELECT shard_count, shard_index FROM shard_layout WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return (row[0], row[1]) if row else None
+
+
+def record_shard_layout(path: str, shard_count: int, index: int):
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO shard_layout (id, shard_count, shard_index) VALUES (1, ?, ?)',
+                (shard_count, index)
+            )
+    finally:
+        conn.close()
+
+
+def check_shard_layout(base_path: str, shard_count: int) -> List[str]:
+    """shard_count と既存のDBファイルが食い違っていれば、その内容を返す（問題なければ空）
+
+    再シャーディングせずに shard_count を変えると、既存のセッションは読まれない別のファイルに残り、
+    新しい（空の）ファイルに書き込まれてしまう。次の場合を検出する。
+    - 現在の構成のファイルに、別の構成（シャード数・番号）が記録されている
+    - 現在の構成に含まれないファイル（単一DB や別のシャード数のファイル）に会話が残っている
+    """
+    shard_count = max(1, shard_count)
+    paths = shard_paths(base_path, shard_count)
+    problems = []
+    for index, path in enumerate(paths):
+        if not os.path.exists(path):
+            continue
+        layout = read_shard_layout(path)
+        if layout is not None and layout != (shard_count, index):
+            problems.append(f"{path} belongs to shard {layout[1]} of {layout[0]}, not {index} of {shard_count}")
+
+    root, ext = os.path.splitext(base_path)
+    others = set(glob.glob(f"{glob.escape(root)}.shard[0-9][0-9]{ext or '.db'}"))
+    if shard_count > 1:
+        others.add(base_path)
+    for path in sorted(others - set(paths)):
+        if os.path.exists(path) and _stored_rows(path):
+            problems.append(f"{path} holds conversation data outside the configured {shard_count}-shard layout")
+    return problems
+
+
+class ShardWriter:
+    """シャードごとの書き込み用接続
+
+    プロセス内の書き込みをシャードごとに1本の接続・ロックに直列化し、
+    SQLite のロック待ち（database is locked）が起きるのは他プロセスと競合した場合だけにする。
+    シャードが別ファイルなので、異なるシャードへの書き込みは並行して進む。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.writes = 0
+        self.wait_ms_total = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            self._conn.execute('PRAGMA busy_timeout = 5000')
+        return self._conn
+
+    def insert_message(self, session_id: str, role: str, content: str, emotion: Optional[str] = None):
+        wait_start = time.perf_counter()
+        with self._lock:
+            self.wait_ms_total += (time.perf_counter() - wait_start) * 1000
+            conn = self._connection()
+            try:
+                conn.execute(
+                    'INSERT INTO conversations (session_id, role, content, emotion) VALUES (?, ?, ?, ?)',
+                    (session_id, role, content, emotion)
+                )
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            self.writes += 1
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'path': self.db_path,
+                'writes': self.writes,
+                'avg_lock_wait_ms': round(self.wait_ms_total / self.writes, 3) if self.writes else None,
+            }
+
+
+class ShardedMaintenance:
+    """全シャードのメンテナンスを1本のスレッドで順に実行するクラス
+
+    シャードごとの処理は MemoryMaintenance（時間予算・バッチ分割）に任せ、
+    結果はシャード別と合計の両方で返す。
+    """
+
+    def __init__(self, paths_provider: Callable[[], List[str]], settings_provider: Callable[[], Dict],
+                 on_profile_changed: Optional[Callable[[str], None]] = None):
+        self.paths_provider = paths_provider
+        self.settings_provider = settings_provider
+        self.on_profile_changed = on_profile_changed
+        self._shards: Dict[str, MemoryMaintenance] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def settings(self) -> Dict:
+        return self._maintenance_for(self.paths_provider()[0]).settings()
+
+    def _maintenance_for(self, path: str) -> MemoryMaintenance:
+        with self._lock:
+            maintenance = self._shards.get(path)
+            if maintenance is None:
+                maintenance = self._shards[path] = MemoryMaintenance(
+                    lambda path=path: path, self.settings_provider, on_profile_changed=self.on_profile_changed
+                )
+            return maintenance
+
+    def start(self):
+        """バックグラウンドのメンテナンススレッドを開始"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='memory-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _loop(self):
+        while True:
+            settings = self.settings()
+            if settings['enabled']:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Memory maintenance failed: {e}")
+            if self._stop_event.wait(settings['interval_seconds']):
+                break
+
+    def run_once(self) -> Dict:
+        """各シャードを順にメンテナンスし、シャード別の結果を返す（シャードごとに時間予算を使う）"""
+        results = {}
+        for path in self.paths_provider():
+            try:
+                results[path] = self._maintenance_for(path).run_once()
+            except sqlite3.Error as e:
+                logger.error(f"Memory maintenance failed for shard {path}: {e}")
+                results[path] = {'error': str(e)}
+        return results
+
+    def report(self) -> Dict:
+        """シャードが1つなら従来どおりの形式、複数ならシャード別の結果と合計"""
+        paths = self.paths_provider()
+        if len(paths) == 1:
+            return self._maintenance_for(paths[0]).report()
+
+        shards = []
+        totals = {'db_bytes': 0, 'conversations': 0, 'archived_conversations': 0, 'archived_messages': 0}
+        for index, path in enumerate(paths):
+            report = self._maintenance_for(path).report()
+            last_run = report['last_run'] or {}
+            for key in totals:
+                totals[key] += last_run.get(key) or 0
+            shards.append(dict(report, shard=index, path=path))
+        return {'shard_count': len(paths), 'totals': totals, 'shards': shards}
+
+
+# ---- シャードをまたぐツール ----
+
+def iter_sessions(db_path: str) -> Iterator[str]:
+    """シャード内のセッション一覧（アーカイブにしか残っていないセッションも含む）"""
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        for (session_id,) in conn.execute(
+            'SELECT session_id FROM conversation_sessions '
+            'UNION SELECT session_id FROM conversations_archive ORDER BY session_id'
+        ):
+            yield session_id
+    finally:
+        conn.close()
+
+
+def shard_status(paths: List[str]) -> List[Dict]:
+    """シャードごとのセッション数・メッセージ数・ファイルサイズ"""
+    status = []
+    for index, path in enumerate(paths):
+        if not os.path.exists(path):
+            status.append({'shard': index, 'path': path, 'exists': False})
+            continue
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            sessions, messages, archived = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(archived_count), 0) '
+                'FROM conversation_sessions'
+            ).fetchone()
+        finally:
+            conn.close()
+        status.append({
+            'shard': index, 'path': path, 'exists': True,
+            'sessions': sessions, 'messages': messages, 'archived': archived,
+            'file_bytes': os.path.getsize(path),
+        })
+    return status
+
+
+def iter_export(paths: List[str]) -> Iterator[bytes]:
+    """全シャードの会話履歴を NDJSON で出力（セッションごとに古い順）
+
+    conversations_archive に移したメッセージも id 順に合わせて出力し、source で出どころを示す。
+    """
+    for index, path in enumerate(paths):
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            for session_id in iter_sessions(path):
+                rows = conn.execute(
+                    "SELECT id, role, content, emotion, timestamp, 'live' FROM conversations WHERE session_id = ? "
+                    "UNION ALL "
+                    "SELECT id, role, content, emotion, timestamp, 'archive' FROM conversations_archive WHERE session_id = ? "
+                    "ORDER BY id",
+                    (session_id, session_id)
+                )
+                for row in rows:
+                    message = {
+                        'shard': index,
+                        'session_id': session_id,
+                        'id': row[0],
+                        'role': row[1],
+                        'content': row[2],
+                        'emotion': row[3],
+                        'timestamp': row[4],
+                        'source': row[5],
+                    }
+                    yield (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        finally:
+            conn.close()
+
+
+def reshard(source_paths: List[str], base_path: str, target_count: int) -> Dict:
+    """既存のシャード（または単一DB）を target_count 個のシャードに振り分け直す（アプリ停止中に実行）
+
+    新しいシャードは一時ファイルに作ってから置き換え、元のファイルは .pre-reshard として残す。
+    メッセージの id はシャードごとに採番し直すため、再シャーディング前の履歴カーソルは使えなくなる。
+    セッション内の順序と timestamp、アーカイブ、ユーザー情報は保持する。
+    アーカイブと会話は元の id 順のまま同じ id 空間で採番し直す（合わせて id 順に並べれば元の順序になる）。
+    """
+    targets = shard_paths(base_path, target_count)
+    temp_paths = [f"{path}.reshard-tmp" for path in targets]
+    for index, path in enumerate(temp_paths):
+        if os.path.exists(path):
+            os.remove(path)
+        apply_migrations(path)
+        record_shard_layout(path, target_count, index)
+
+    started = time.time()
+    connections = [sqlite3.connect(path, isolation_level=None) for path in temp_paths]
+    counts = {'sessions': 0, 'messages': 0, 'archived': 0, 'profiles': 0}
+    try:
+        for conn in connections:
+            conn.execute('BEGIN')
+        pending = [0] * target_count
+        next_ids = [0] * target_count
+
+        def write(target: int, sql: str, params: tuple):
+            conn = connections[target]
+            conn.execute(sql, params)
+            pending[target] += 1
+            if pending[target] >= RESHARD_BATCH_SIZE:
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                pending[target] = 0
+
+        def allocate_id(target: int) -> int:
+            next_ids[target] += 1
+            return next_ids[target]
+
+        for source in source_paths:
+            if not os.path.exists(source):
+                continue
+            src = sqlite3.connect(source, timeout=5)
+            try:
+                for session_id in list(iter_sessions(source)):
+                    target = shard_index(session_id, target_count)
+                    counts['sessions'] += 1
+                    # 会話とアーカイブを元の id 順に合わせて読み、それぞれのテーブルに書き戻す
+                    for row in src.execute(
+                        "SELECT id, role, content, emotion, timestamp, NULL, 0 FROM conversations WHERE session_id = ? "
+                        "UNION ALL "
+                        "SELECT id, role, content, emotion, timestamp, archived_at, 1 FROM conversations_archive "
+                        "WHERE session_id = ? ORDER BY id",
+                        (session_id, session_id)
+                    ):
+                        role, content, emotion, timestamp, archived_at, archived = row[1:]
+                        if archived:
+                            write(target, 'INSERT INTO conversations_archive '
+                                          '(id, session_id, role, content, emotion, timestamp, archived_at) '
+                                          'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                  (allocate_id(target), session_id, role, content, emotion, timestamp, archived_at))
+                            counts['archived'] += 1
+                        else:
+                            write(target, 'INSERT INTO conversations (id, session_id, role, content, emotion, timestamp) '
+                                          'VALUES (?, ?, ?, ?, ?, ?)',
+                                  (allocate_id(target), session_id, role, content, emotion, timestamp))
+                            counts['messages'] += 1
+                for row in src.execute(
+                    'SELECT session_id, name, preferences, context_data, last_interaction FROM user_info'
+                ):
+                    write(shard_index(row[0], target_count),
+                          'INSERT OR REPLACE INTO user_info (session_id, name, preferences, context_data, last_interaction) '
+                          'VALUES (?, ?, ?, ?, ?)', row)
+                    counts['profiles'] += 1
+            finally:
+                src.close()
+
+        # 以降の会話がアーカイブの id と重ならないよう、採番をアーカイブを含めた最大値から続ける
+        for conn, last_id in zip(connections, next_ids):
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'conversations'")
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('conversations', ?)", (last_id,))
+            conn.execute('COMMIT')
+    except Exception:
+        for conn in connections:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+        raise
+    finally:
+        for conn in connections:
+            conn.close()
+
+    # 元のファイルを退避してから新しいシャードに置き換える
+    for source in source_paths:
+        if os.path.exists(source):
+            os.replace(source, f"{source}.pre-reshard")
+    for temp_path, target in zip(temp_paths, targets):
+        os.replace(temp_path, target)
+
+    counts['duration_s'] = round(time.time() - started, 2)
+    counts['targets'] = targets
+    logger.info(f"Resharded {len(source_paths)} -> {target_count} shards: {counts}")
+    return counts
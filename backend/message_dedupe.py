@@ -0,0 +1,132 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    # 同じメッセージIDの再送を重複とみなす期間（完了後もこの間は結果を返す）
+    'ttl_seconds': 300,
+    'max_entries': 10000,
+}
+
+STATE_IN_FLIGHT = 'in_flight'
+STATE_COMPLETED = 'completed'
+
+
+class _Entry:
+    __slots__ = ('key', 'state', 'created_at', 'completed_at', 'origin_sid', 'waiters', 'result')
+
+    def __init__(self, key: Tuple[str, str], origin_sid: Optional[str]):
+        self.key = key
+        self.state = STATE_IN_FLIGHT
+        self.created_at = time.monotonic()
+        self.completed_at: Optional[float] = None
+        self.origin_sid = origin_sid
+        self.waiters: Set[str] = set()
+        # (イベント名, ペイロード, 全クライアントに送信したか)
+        self.result: Optional[Tuple[str, Dict, bool]] = None
+
+
+class MessageDeduplicator:
+    """クライアントが付けたメッセージIDで、再送された send_message / send_audio を重複排除するクラス
+
+    - 初回: 処理中として登録し、ターンを実行する
+    - 処理中の再送: 再送したクライアントを待ち手として登録し、完了時に結果を届ける
+    - 完了後の再送: 記録した結果をそのまま返す（Gemini / TTS の再実行も履歴の重複保存もしない）
+    エントリは TTL で期限切れになり、件数が上限を超えたら古いものから捨てる。
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict]):
+        self.settings_provider = settings_provider
+        self._entries: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'new': 0, 'duplicate_in_flight': 0, 'duplicate_completed': 0, 'expired': 0, 'evicted': 0}
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    def _purge(self, settings: Dict, now: float):
+        """期限切れのエントリを捨てる（ロック内で呼ぶこと。登録順に並んでいるので先頭から見ればよい）"""
+        ttl = float(settings['ttl_seconds'])
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            # 処理中のエントリは完了まで残す（TTL は完了時刻から数える）
+            if entry.state != STATE_COMPLETED or now - entry.completed_at < ttl:
+                break
+            self._entries.popitem(last=False)
+            self._counts['expired'] += 1
+        # これから1件追加するので、上限の1件手前まで減らす
+        while self._entries and len(self._entries) >= int(settings['max_entries']):
+            self._entries.popitem(last=False)
+            self._counts['evicted'] += 1
+
+    def begin(self, session_id: str, message_id: str, sid: Optional[str] = None
+              ) -> Tuple[Optional[_Entry], Optional[str], Optional[Tuple[str, Dict, bool]]]:
+        """メッセージの受信を登録し、(エントリ, 重複時の状態, 完了済みなら結果) を返す
+
+        初回は (エントリ, None, None)。処理中の重複は sid を待ち手に加えて (エントリ, 'in_flight', None)、
+        完了済みの重複は (エントリ, 'completed', 結果)。無効時は (None, None, None)。
+        """
+        settings = self.settings()
+        if not settings['enabled'] or not message_id:
+            return None, None, None
+        key = (session_id, message_id)
+        now = time.monotonic()
+        with self._lock:
+            self._purge(settings, now)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, sid)
+                self._counts['new'] += 1
+                return entry, None, None
+            if entry.state == STATE_IN_FLIGHT:
+                if sid:
+                    entry.waiters.add(sid)
+                self._counts['duplicate_in_flight'] += 1
+                return entry, STATE_IN_FLIGHT, None
+            self._counts['duplicate_completed'] += 1
+            return entry, STATE_COMPLETED, entry.result
+
+    def record_result(self, session_id: str, message_id: Optional[str], event: str, payload: Dict, broadcast: bool = False):
+        """ターンの最終結果（クライアントに送ったイベント）を記録する"""
+        if not message_id:
+            return
+        with self._lock:
+            entry = self._entries.get((session_id, message_id))
+            if entry is not None and entry.state == STATE_IN_FLIGHT:
+                entry.result = (event, payload, broadcast)
+
+    def complete(self, entry: Optional[_Entry]) -> Tuple[List[str], Optional[Tuple[str, Dict, bool]]]:
+        """処理を完了にして、(結果を届けるべき待ち手の sid, 結果) を返す"""
+        if entry is None:
+            return [], None
+        with self._lock:
+            entry.state = STATE_COMPLETED
+            entry.completed_at = time.monotonic()
+            waiters = [sid for sid in entry.waiters if sid != entry.origin_sid]
+            entry.waiters = set()
+            return waiters, entry.result
+
+    def discard(self, entry: Optional[_Entry]):
+        """受け付けられなかったメッセージの登録を取り消す（同じIDで再送できるようにする）"""
+        if entry is None:
+            return
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+
+    def report(self) -> Dict:
+        with self._lock:
+            in_flight = sum(1 for entry in self._entries.values() if entry.state == STATE_IN_FLIGHT)
+            return {
+                'entries': len(self._entries),
+                'in_flight': in_flight,
+                'ttl_seconds': self.settings()['ttl_seconds'],
+                **self._counts,
+            }
@@ -0,0 +1,231 @@
+import json
+import atexit
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ('name', 'preferences', 'context_data')
+# context_data のうちメモリメンテナンスが書き込むキー（キャッシュからの書き込みでは DB の値を残す）
+ROLLUP_CONTEXT_KEY = 'conversation_rollup'
+
+
+def parse_context_data(context_data: Optional[str]) -> Dict:
+    """context_data をJSON辞書として解釈（プレーンテキストは note として保持）"""
+    if not context_data:
+        return {}
+    try:
+        parsed = json.loads(context_data)
+        if isinstance(parsed, dict):
+            return parsed
+    except ValueError:
+        pass
+    return {'note': context_data}
+
+
+def merge_rollup(context_data: str, stored_context_data: Optional[str]) -> str:
+    """書き込む context_data に、DB に保存済みのロールアップ要約を引き継ぐ"""
+    rollup = parse_context_data(stored_context_data).get(ROLLUP_CONTEXT_KEY)
+    if rollup is None:
+        return context_data
+    merged = parse_context_data(context_data)
+    merged[ROLLUP_CONTEXT_KEY] = rollup
+    return json.dumps(merged, ensure_ascii=False)
+
+
+class ProfileCache:
+    """user_info の LRU キャッシュ（ライトスルー・部分更新）
+
+    読み出しはメモリから返し、ミス時のみ SQLite を読む。更新は変更された列だけを
+    キャッシュに即時反映し、未書き込みの列（dirty）をセッションごとにまとめて
+    INSERT ... ON CONFLICT DO UPDATE で一括書き込みする。別々の経路から同じセッションの
+    異なる列を更新しても、互いの値を上書きしない。
+    """
+
+    def __init__(self, db_path_provider: Callable[[], str], capacity: int = 1024,
+                 flush_interval: float = 0.5, max_batch: int = 64):
+        self.db_path_provider = db_path_provider
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._dirty: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        # 書き込みは1本に直列化し、接続を使い回す
+        self._flush_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.flushed_rows = 0
+
+    # ---- 読み出し ----
+
+    def get(self, session_id: str) -> Dict:
+        """プロフィールを取得（存在しない場合は空の辞書）"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return self._public(entry)
+            self.misses += 1
+
+        # 読み込みと未書き込み分の重ね合わせの間に flush が割り込まないよう、書き込みロックを保持する
+        with self._flush_lock:
+            row = self._connection().execute(
+                'SELECT name, preferences, context_data, last_interaction FROM user_info WHERE session_id = ?',
+                (session_id,)
+            ).fetchone()
+            with self._lock:
+                entry = self._entries.get(session_id)
+                if entry is None:
+                    entry = self._from_row(row)
+                    pending = self._dirty.get(session_id)
+                    if pending:
+                        entry.update(pending, _exists=True)
+                    self._store(session_id, entry)
+                return self._public(entry)
+
+    @staticmethod
+    def _public(entry: Dict) -> Dict:
+        if not entry.get('_exists'):
+            return {}
+        return {k: v for k, v in entry.items() if k != '_exists'}
+
+    @staticmethod
+    def _from_row(row: Optional[tuple]) -> Dict:
+        if not row:
+            return {'_exists': False}
+        return {
+            'name': row[0],
+            'preferences': row[1],
+            'context_data': row[2],
+            'last_interaction': row[3],
+            '_exists': True,
+        }
+
+    # ---- 更新 ----
+
+    def update(self, session_id: str, **fields):
+        """指定された列だけを更新（None の列は変更しない）"""
+        changes = {k: v for k, v in fields.items() if k in PROFILE_FIELDS and v is not None}
+        if not changes:
+            return
+        # SQLite の CURRENT_TIMESTAMP と同じ形式（UTC）
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.update(changes, last_interaction=now, _exists=True)
+                self._entries.move_to_end(session_id)
+            self._dirty.setdefault(session_id, {}).update(changes)
+            pending = len(self._dirty)
+
+        self._ensure_flusher()
+        if pending >= self.max_batch:
+            self._wakeup.set()
+
+    def invalidate(self, session_id: str):
+        """外部で user_info が書き換えられたときにキャッシュを破棄（未書き込み分は先に書き込む）"""
+        self.flush()
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def _store(self, session_id: str, entry: Dict):
+        self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        # dirty なエントリは dirty 側に変更が残っているため、追い出しても失われない
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    # ---- 書き込み ----
+
+    def flush(self) -> int:
+        """未書き込みの変更を1トランザクションで書き込み、書き込んだ行数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+            if not batch:
+                return 0
+
+            conn = None
+            try:
+                conn = self._connection()
+                conn.execute('BEGIN IMMEDIATE')
+                for session_id, changes in batch.items():
+                    if 'context_data' in changes:
+                        # メンテナンスが書いたロールアップ要約は、キャッシュ側の古い値で上書きしない
+                        stored = conn.execute(
+                            'SELECT context_data FROM user_info WHERE session_id = ?', (session_id,)
+                        ).fetchone()
+                        changes = dict(changes, context_data=merge_rollup(
+                            changes['context_data'], stored[0] if stored else None
+                        ))
+                    columns = list(changes)
+                    conn.execute(
+                        f'''
+                        INSERT INTO user_info (session_id, {', '.join(columns)}, last_interaction)
+                        VALUES (?, {', '.join('?' * len(columns))}, CURRENT_TIMESTAMP)
+                        ON CONFLICT(session_id) DO UPDATE SET
+                            {', '.join(f'{column} = excluded.{column}' for column in columns)},
+                            last_interaction = CURRENT_TIMESTAMP
+                        ''',
+                        [session_id] + [changes[column] for column in columns]
+                    )
+                conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                if conn is not None and conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                # 失敗した変更は戻す（その間に入った新しい値を優先）
+                with self._lock:
+                    for session_id, changes in batch.items():
+                        self._dirty[session_id] = dict(changes, **self._dirty.get(session_id, {}))
+                logger.error(f"Failed to flush user profiles: {e}")
+                return 0
+
+            self.flushed_rows += len(batch)
+            return len(batch)
+
+    def _connection(self) -> sqlite3.Connection:
+        """_flush_lock を保持した状態で呼ぶこと"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path_provider(), timeout=5,
+                                         isolation_level=None, check_same_thread=False)
+        return self._conn
+
+    def _ensure_flusher(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='profile-cache-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Profile cache flusher error: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'capacity': self.capacity,
+                'dirty': len(self._dirty),
+                'hits': self.hits,
+                'misses': self.misses,
+                'flushed_rows': self.flushed_rows,
+            }
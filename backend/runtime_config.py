@@ -0,0 +1,395 @@
+import os
+import copy
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERSONALITY = 'yui_natural'
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """事前に組み立てたプロンプトテンプレート（ユーザー入力を挟んで連結するだけ）"""
+    prefix: str
+    suffix: str = ''
+
+    def render(self, user_input: str) -> str:
+        return self.prefix + user_input + self.suffix
+
+
+@dataclass(frozen=True)
+class PersonalityConfig:
+    """キャラクター（性格）ごとの設定"""
+    key: str
+    name: str
+    description: str
+    voice_id: Optional[str]
+    speech_speed: float
+    system_prompt: str
+    full_template: PromptTemplate
+    streaming_template: PromptTemplate
+    # ターン開始時に流すフィラー（相づち）のフレーズ { 感情: [テキスト] }
+    fillers: Dict[str, List[str]] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class GeminiConfig:
+    primary_model: str
+    fallback_model: str
+
+
+@dataclass(frozen=True)
+class TTSConfig:
+    fast_model: str
+    quality_model: str
+    fast_model_max_chars: int
+    output_format: str
+    chunk_size: int
+    default_voice_id: str
+    codec_preferences: List[str]
+    audio_cache_entries: int
+    routing: Dict
+    fillers: Dict
+
+
+@dataclass(frozen=True)
+class STTConfig:
+    preprocessing: Dict
+    poll_interval_ms: int
+
+
+@dataclass(frozen=True)
+class PerformanceConfig:
+    max_response_time_ms: int
+    tts_timeout_ms: int
+    animation_transition_ms: int
+    idle_animation_interval_ms: int
+    turn_scheduler: Dict
+    loop_monitor: Dict
+    cassette: Dict
+    http_client: Dict
+    rate_limit_backoff_ms: int
+    message_dedupe: Dict
+    profiler: Dict
+
+
+@dataclass(frozen=True)
+class MemoryConfig:
+    conversation_history_limit: int
+    maintenance: Dict
+    shard_count: int
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    """app_config.yml から生成した不変のランタイム設定"""
+    raw: Dict
+    default_personality: str
+    personalities: Dict[str, PersonalityConfig]
+    gemini: GeminiConfig
+    tts: TTSConfig
+    stt: STTConfig
+    performance: PerformanceConfig
+    memory: MemoryConfig
+    logging: Dict
+    loaded_at: float = field(default_factory=time.time)
+
+    def personality(self, key: Optional[str]) -> PersonalityConfig:
+        """性格設定を取得（未知の性格はデフォルトにフォールバック）"""
+        if key in self.personalities:
+            return self.personalities[key]
+        if self.default_personality in self.personalities:
+            return self.personalities[self.default_personality]
+        return PersonalityConfig(
+            key=key or self.default_personality, name='', description='', voice_id=None,
+            speech_speed=1.0, system_prompt='',
+            full_template=PromptTemplate(''), streaming_template=PromptTemplate(''),
+        )
+
+
+def compile_runtime_config(raw: Dict) -> RuntimeConfig:
+    """設定辞書を検証・型変換し、性格ごとのプロンプトを事前コンパイル"""
+    character_config = raw.get('character_config') or {}
+    ai_settings = raw.get('ai_settings') or {}
+    tts_settings = raw.get('tts_settings') or {}
+    eleven_labs = tts_settings.get('eleven_labs') or {}
+    character_voices = tts_settings.get('character_voices') or {}
+    stt_settings = raw.get('stt_settings') or {}
+    performance = raw.get('performance') or {}
+    memory_settings = raw.get('memory_settings') or {}
+    logging_settings = raw.get('logging_settings') or {}
+
+    personalities = {}
+    for key, settings in (ai_settings.get('personalities') or {}).items():
+        settings = settings or {}
+        name = settings.get('name', '')
+        prompt = settings.get('prompt', '')
+        streaming_prompt = settings.get('streaming_prompt') or prompt
+        personalities[key] = PersonalityConfig(
+            key=key,
+            name=name,
+            description=settings.get('description', ''),
+            voice_id=character_voices.get(key),
+            speech_speed=float(settings.get('speech_speed', 1.0)),
+            system_prompt=settings.get('system_prompt') or prompt,
+            full_template=PromptTemplate(f"{prompt}\nユーザー: ", f"\n{name}:"),
+            streaming_template=PromptTemplate(f"{streaming_prompt}\n"),
+            fillers={
+                emotion: [str(text) for text in (texts or [])]
+                for emotion, texts in (settings.get('fillers') or {}).items()
+            },
+        )
+
+    gemini_models = ai_settings.get('gemini_models') or {}
+    tts_models = eleven_labs.get('models') or {}
+    codec_negotiation = eleven_labs.get('codec_negotiation') or {}
+
+    return RuntimeConfig(
+        raw=raw,
+        default_personality=character_config.get('default_personality', DEFAULT_PERSONALITY),
+        personalities=personalities,
+        gemini=GeminiConfig(
+            # 環境変数が設定されていれば優先する
+            primary_model=os.getenv('GEMINI_PRIMARY_MODEL') or gemini_models.get('primary', 'gemini-2.5-flash'),
+            fallback_model=os.getenv('GEMINI_FALLBACK_MODEL') or gemini_models.get('fallback', 'gemini-2.5-flash-lite'),
+        ),
+        tts=TTSConfig(
+            fast_model=tts_models.get('fast', 'eleven_turbo_v2_5'),
+            quality_model=tts_models.get('quality', 'eleven_multilingual_v2'),
+            fast_model_max_chars=int(eleven_labs.get('fast_model_max_chars', 100)),
+            output_format=eleven_labs.get('output_format', 'mp3_22050_32'),
+            chunk_size=int(eleven_labs.get('chunk_size', 50)),
+            default_voice_id=eleven_labs.get('default_voice_id', 'vGQNBgLaiM3EdZtxIiuY'),
+            codec_preferences=list(codec_negotiation.get('preferences') or []),
+            audio_cache_entries=int(eleven_labs.get('audio_cache_entries', 256)),
+            routing=dict(eleven_labs.get('routing') or {}),
+            fillers=dict(tts_settings.get('fillers') or {}),
+        ),
+        stt=STTConfig(
+            preprocessing=dict(stt_settings.get('preprocessing') or {}),
+            poll_interval_ms=int(stt_settings.get('poll_interval_ms', 3000)),
+        ),
+        performance=PerformanceConfig(
+            max_response_time_ms=int(performance.get('max_response_time_ms', 3000)),
+            tts_timeout_ms=int(performance.get('tts_timeout_ms', 10000)),
+            animation_transition_ms=int(performance.get('animation_transition_ms', 500)),
+            idle_animation_interval_ms=int(performance.get('idle_animation_interval_ms', 8000)),
+            turn_scheduler=dict(performance.get('turn_scheduler') or {}),
+            loop_monitor=dict(performance.get('loop_monitor') or {}),
+            cassette=dict(
+                performance.get('cassette') or {},
+                # 環境変数が設定されていれば優先する
+                **{key: value for key, value in (
+                    ('mode', os.getenv('CASSETTE_MODE')),
+                    ('path', os.getenv('CASSETTE_PATH')),
+                    ('output_path', os.getenv('CASSETTE_OUTPUT_PATH')),
+                ) if value}
+            ),
+            http_client=dict(performance.get('http_client') or {}),
+            rate_limit_backoff_ms=int(performance.get('rate_limit_backoff_ms', 5000)),
+            message_dedupe=dict(performance.get('message_dedupe') or {}),
+            profiler=dict(performance.get('profiler') or {}),
+        ),
+        memory=MemoryConfig(
+            conversation_history_limit=int(memory_settings.get('conversation_history_limit', 20)),
+            maintenance=dict(memory_settings.get('maintenance') or {}),
+            # 環境変数が設定されていれば優先する（変更時は再シャーディングが必要）
+            shard_count=int(os.getenv('MEMORY_SHARD_COUNT') or memory_settings.get('shard_count', 1)),
+        ),
+        logging=dict(
+            logging_settings,
+            # 環境変数が設定されていれば優先する
+            **{key: value for key, value in (
+                ('format', os.getenv('LOG_FORMAT')),
+                ('root_level', os.getenv('LOG_LEVEL')),
+            ) if value}
+        ),
+    )
+
+
+def lookup(raw: Dict, path: str) -> Any:
+    """'performance.turn_scheduler.max_workers' のようなドット区切りのパスで値を取得（無ければ None）"""
+    node: Any = raw
+    for key in path.split('.'):
+        if not isinstance(node, dict):
+            return None
+        node = node.get(key)
+    return node
+
+
+def merge_overrides(raw: Dict, overrides: Dict[str, Any]) -> Dict:
+    """設定辞書のコピーに、ドット区切りのパスで指定した上書きを適用する"""
+    merged = copy.deepcopy(raw)
+    for path, value in overrides.items():
+        keys = path.split('.')
+        node = merged
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = node[key] = {}
+            node = child
+        node[keys[-1]] = value
+    return merged
+
+
+class RuntimeConfigManager:
+    """ランタイム設定の読み込みとホットリロードを管理するクラス
+
+    設定は起動時（autoload=False の場合は初回アクセス時）に一度だけパースし、
+    ファイル変更時は新しい RuntimeConfig を完全に構築してから参照を差し替える。
+    読み込みに失敗した場合は旧設定を維持する。
+
+    実行中の上書き（apply_overrides）はファイルの内容の上に重ねて適用し、
+    ファイルのリロード後も維持する（プロセスの再起動で消える）。
+    """
+
+    def __init__(self, config_path: str, poll_interval: float = 2.0, autoload: bool = True):
+        self.config_path = os.path.abspath(config_path)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[RuntimeConfig, RuntimeConfig], None]] = []
+        self._mtime: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._load_lock = threading.RLock()
+        # リスナーは _load_lock の外で呼ぶ（リスナーが他のロックを取っても、設定の読み込みと待ち合わない）
+        self._notify_lock = threading.Lock()
+        self._loaded = False
+        self._loading = False
+        self._file_raw: Dict = {}
+        self._overrides: Dict[str, Any] = {}
+        self._current = compile_runtime_config({})
+        # リスナーに最後に渡した設定（通知は常にこれと現在の設定の組で行う）
+        self._delivered = self._current
+        if autoload:
+            self.ensure_loaded()
+
+    @property
+    def current(self) -> RuntimeConfig:
+        """現在の設定（1ターン中は同じ参照を使い回すこと）"""
+        if not self._loaded:
+            self.ensure_loaded()
+        return self._current
+
+    def ensure_loaded(self):
+        """未読み込みであれば設定ファイルを読み込む"""
+        with self._load_lock:
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+            try:
+                swapped = self._reload_locked()
+            finally:
+                self._loaded = True
+                self._loading = False
+        self._notify(swapped)
+
+    def add_listener(self, listener: Callable[[RuntimeConfig, RuntimeConfig], None]):
+        """リロード時のコールバック (old, new) を登録"""
+        self._listeners.append(listener)
+
+    @property
+    def overrides(self) -> Dict[str, Any]:
+        """実行中に上書きしている設定 { パス: 値 }"""
+        return dict(self._overrides)
+
+    def reload(self) -> bool:
+        """設定ファイルを読み込み直す"""
+        with self._load_lock:
+            swapped = self._reload_locked()
+        self._notify(swapped)
+        return swapped is not None
+
+    def _reload_locked(self) -> Optional[Tuple[RuntimeConfig, RuntimeConfig]]:
+        """設定ファイルを読み込んで差し替え、(旧設定, 新設定) を返す（_load_lock 内で呼ぶこと。失敗時は None）"""
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                raw = yaml.safe_load(f) or {}
+            new_config = compile_runtime_config(merge_overrides(raw, self._overrides))
+        except (OSError, yaml.YAMLError, TypeError, ValueError) as e:
+            logger.error(f"Failed to load runtime config from {self.config_path}: {e}")
+            return None
+
+        self._file_raw = raw
+        old_config = self._swap(new_config, mtime)
+        logger.info(f"Runtime config loaded: {len(new_config.personalities)} personalities")
+        return old_config, new_config
+
+    def apply_overrides(self, values: Dict[str, Any], reset: Iterable[str] = ()) -> Tuple[RuntimeConfig, RuntimeConfig]:
+        """設定を実行中に上書きし、(旧設定, 新設定) を返す
+
+        reset のパスは上書きをやめてファイルの値に戻す。全ての変更を1つの新しい設定として
+        まとめて差し替える（一部だけが反映された状態にはならない）。
+        変換に失敗した場合は TypeError / ValueError を送出し、現在の設定を維持する。
+        """
+        self.ensure_loaded()
+        with self._load_lock:
+            overrides = dict(self._overrides)
+            for path in reset:
+                overrides.pop(path, None)
+            overrides.update(values)
+            new_config = compile_runtime_config(merge_overrides(self._file_raw, overrides))
+            self._overrides = overrides
+            old_config = self._swap(new_config, self._mtime)
+        self._notify((old_config, new_config))
+        return old_config, new_config
+
+    def _swap(self, new_config: RuntimeConfig, mtime: Optional[float]) -> RuntimeConfig:
+        with self._lock:
+            old_config = self._current
+            self._current = new_config
+            self._mtime = mtime
+        return old_config
+
+    def _notify(self, swapped: Optional[Tuple[RuntimeConfig, RuntimeConfig]]):
+        """リスナーを呼ぶ（_load_lock を解放してから呼ぶこと）
+
+        ファイルのリロードと管理APIの上書きが競合すると、差し替えと通知の順序が入れ替わることがある。
+        通知は swapped の組ではなく「前回リスナーに渡した設定 → その時点の現在の設定」で行い、
+        既に渡した設定なら何もしない。これでリスナーが古い設定に戻されることはない。
+        """
+        if swapped is None:
+            return
+        with self._notify_lock:
+            old_config, new_config = self._delivered, self._current
+            if new_config is old_config:
+                return
+            self._delivered = new_config
+            listeners = list(self._listeners)
+            for listener in listeners:
+                try:
+                    listener(old_config, new_config)
+                except Exception as e:
+                    logger.error(f"Runtime config listener failed: {e}")
+
+    def reload_if_changed(self) -> bool:
+        """ファイルの更新時刻が変わっていればリロード"""
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        return self.reload()
+
+    def start_watcher(self):
+        """設定ファイル監視スレッドを開始"""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name='runtime-config-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.reload_if_changed()
@@ -0,0 +1,200 @@
+import os
+import hmac
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from runtime_config import RuntimeConfigManager, lookup
+
+logger = logging.getLogger(__name__)
+
+# 実行中に変更できる設定（app_config.yml のパス → 型・範囲）
+TUNABLE_SETTINGS: Dict[str, Dict] = {
+    'performance.turn_scheduler.max_workers': {
+        'type': int, 'min': 1, 'max': 64,
+        'description': 'ターン処理の同時実行数（待機中のターンは破棄せずに増減）',
+    },
+    'performance.turn_scheduler.voice_burst': {
+        'type': int, 'min': 1, 'max': 64,
+        'description': '音声ターンを連続で優先する最大回数',
+    },
+    'performance.turn_scheduler.max_pending_per_session': {
+        'type': int, 'min': 1, 'max': 64,
+        'description': 'セッションごとに溜められる未処理ターン数',
+    },
+    'performance.max_response_time_ms': {
+        'type': int, 'min': 500, 'max': 60000,
+        'description': '応答時間の目標（TTS モデルの選択に使う）',
+    },
+    'performance.tts_timeout_ms': {
+        'type': int, 'min': 1000, 'max': 120000,
+        'description': '1チャンクの音声合成のタイムアウト',
+    },
+    'performance.rate_limit_backoff_ms': {
+        'type': int, 'min': 0, 'max': 60000,
+        'description': 'Gemini のレート制限時に再試行するまでの待ち時間',
+    },
+    'tts_settings.eleven_labs.chunk_size': {
+        'type': int, 'min': 10, 'max': 1000,
+        'description': 'ストリーミング応答を TTS 用に分割する文字数',
+    },
+    'tts_settings.eleven_labs.fast_model_max_chars': {
+        'type': int, 'min': 0, 'max': 5000,
+        'description': '高速モデルを使う最大文字数',
+    },
+    'tts_settings.eleven_labs.routing.enabled': {
+        'type': bool,
+        'description': 'レイテンシに基づく TTS モデルの選択',
+    },
+    'tts_settings.eleven_labs.routing.budget_safety': {
+        'type': float, 'min': 0.1, 'max': 2.0,
+        'description': '残り時間のうち TTS に使ってよい割合',
+    },
+    'stt_settings.poll_interval_ms': {
+        'type': int, 'min': 200, 'max': 30000,
+        'description': 'AssemblyAI の認識結果をポーリングする間隔',
+    },
+    'memory_settings.maintenance.run_time_budget_ms': {
+        'type': int, 'min': 10, 'max': 60000,
+        'description': 'メモリメンテナンス1回の最大実行時間',
+    },
+}
+
+
+class TuningError(ValueError):
+    """変更内容が不正な場合の例外（設定は変更しない）"""
+
+
+def _convert(path: str, value: Any) -> Any:
+    spec = TUNABLE_SETTINGS.get(path)
+    if spec is None:
+        raise TuningError(f"{path} is not tunable")
+    expected = spec['type']
+    # JSON の true/false は数値として受け付けない
+    if expected is bool:
+        if not isinstance(value, bool):
+            raise TuningError(f"{path} must be a boolean")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TuningError(f"{path} must be a number")
+    if expected is int:
+        if value != int(value):
+            raise TuningError(f"{path} must be an integer")
+        value = int(value)
+    else:
+        value = float(value)
+    if value < spec['min'] or value > spec['max']:
+        raise TuningError(f"{path} must be between {spec['min']} and {spec['max']}")
+    return value
+
+
+class RuntimeTuner:
+    """実行中の性能設定の参照・変更と、変更の監査ログを管理するクラス
+
+    変更は RuntimeConfigManager の上書きとして適用する（全項目をまとめて1回で差し替え、
+    一部だけ反映された状態にはならない）。監査ログは JSON Lines で追記する。
+    トークン未設定の間は全ての操作を拒否する。
+    """
+
+    def __init__(self, config_manager: RuntimeConfigManager, audit_log_path: str,
+                 token_provider: Callable[[], Optional[str]]):
+        self.config_manager = config_manager
+        self.audit_log_path = audit_log_path
+        self.token_provider = token_provider
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token_provider())
+
+    def authorize(self, token: Optional[str]) -> bool:
+        expected = self.token_provider()
+        if not expected or not token:
+            return False
+        return hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+    def snapshot(self) -> Dict:
+        """変更できる設定の現在値（source: override / config / default）"""
+        raw = self.config_manager.current.raw
+        overrides = self.config_manager.overrides
+        settings = {}
+        for path, spec in TUNABLE_SETTINGS.items():
+            value = lookup(raw, path)
+            settings[path] = {
+                'value': value,
+                'source': 'override' if path in overrides else ('config' if value is not None else 'default'),
+                'type': spec['type'].__name__,
+                'min': spec.get('min'),
+                'max': spec.get('max'),
+                'description': spec['description'],
+            }
+        return {'settings': settings, 'overrides': overrides}
+
+    def apply(self, values: Dict[str, Any], reset: Iterable[str] = (), actor: str = '',
+              remote_addr: Optional[str] = None, reason: str = '') -> Dict:
+        """設定を変更して監査ログに記録し、記録した内容を返す（不正な変更は TuningError）"""
+        reset = list(reset)
+        with self._lock:
+            try:
+                if not values and not reset:
+                    raise TuningError('no changes')
+                converted = {path: _convert(path, value) for path, value in values.items()}
+                for path in reset:
+                    if path not in TUNABLE_SETTINGS:
+                        raise TuningError(f"{path} is not tunable")
+                before = self.config_manager.current.raw
+                try:
+                    _, after_config = self.config_manager.apply_overrides(converted, reset)
+                except (TypeError, ValueError) as e:
+                    raise TuningError(str(e))
+            except TuningError as e:
+                self._audit({
+                    'outcome': 'rejected', 'actor': actor, 'remote_addr': remote_addr,
+                    'reason': reason, 'requested': {'set': values, 'reset': reset}, 'error': str(e),
+                })
+                raise
+
+            after = after_config.raw
+            entry = {
+                'outcome': 'applied', 'actor': actor, 'remote_addr': remote_addr, 'reason': reason,
+                'changes': {
+                    path: {'old': lookup(before, path), 'new': lookup(after, path)}
+                    for path in list(converted) + [path for path in reset if path not in converted]
+                },
+            }
+            self._audit(entry)
+        logger.warning(f"Runtime settings changed by {actor or remote_addr or 'unknown'}: {entry['changes']}")
+        return entry
+
+    def record_denied(self, actor: str = '', remote_addr: Optional[str] = None):
+        """認証に失敗した変更の試みを記録"""
+        with self._lock:
+            self._audit({'outcome': 'unauthorized', 'actor': actor, 'remote_addr': remote_addr})
+
+    def _audit(self, entry: Dict):
+        entry = {'timestamp': datetime.now().isoformat(timespec='milliseconds'), **entry}
+        try:
+            directory = os.path.dirname(self.audit_log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.audit_log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        except OSError as e:
+            logger.error(f"Failed to write tuning audit log: {e}")
+
+    def audit_log(self, limit: int = 50) -> List[Dict]:
+        """監査ログの新しい順 limit 件"""
+        if not os.path.exists(self.audit_log_path):
+            return []
+        with open(self.audit_log_path, 'r', encoding='utf-8') as f:
+            lines = deque(f, maxlen=max(1, limit))
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return entries
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'interval_ms': 10,
+    'max_duration_s': 60,
+    'max_depth': 128,
+    # 待機中（ロック・キュー・select 待ち）のスタックも含めるか
+    'include_idle': False,
+}
+
+# スタックの先端がここにあるスレッドは待機中とみなす（ファイル名, 関数名）
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+    ('base_events.py', '_run_once'),
+    ('thread.py', '_worker'),
+}
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+class ProfilerBusyError(Exception):
+    """別のプロファイルを取得中の場合の例外"""
+
+
+class Profile:
+    """サンプリング結果（スレッド名 → スタック（根から先端のフレーム番号）→ 回数）"""
+
+    def __init__(self, interval_ms: float):
+        self.interval_ms = interval_ms
+        self.frames: List[Dict] = []
+        self.stacks: Dict[str, Counter] = {}
+        self.started_at = time.time()
+        self.duration_s = 0.0
+        self.samples = 0
+        self.idle_samples = 0
+        self.sampling_ms = 0.0
+
+    def to_collapsed(self) -> str:
+        """flamegraph.pl / speedscope で読める collapsed stacks 形式（"スレッド;関数;関数 回数"）"""
+        names = [frame['name'] for frame in self.frames]
+        lines = []
+        for thread_name, stacks in sorted(self.stacks.items()):
+            for stack, count in stacks.most_common():
+                lines.append(';'.join([thread_name] + [names[index] for index in stack]) + f' {count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_speedscope(self) -> Dict:
+        """speedscope の JSON 形式（スレッドごとの sampled プロファイル）"""
+        profiles = []
+        for thread_name, stacks in sorted(self.stacks.items()):
+            samples = [list(stack) for stack in stacks for _ in range(stacks[stack])]
+            profiles.append({
+                'type': 'sampled',
+                'name': thread_name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': len(samples) * self.interval_ms,
+                'samples': samples,
+                'weights': [self.interval_ms] * len(samples),
+            })
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': f"profile {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at))}",
+            'exporter': 'sampling_profiler',
+            'shared': {'frames': self.frames},
+            'profiles': profiles,
+        }
+
+    def summary(self) -> Dict:
+        return {
+            'duration_s': round(self.duration_s, 2),
+            'interval_ms': self.interval_ms,
+            'samples': self.samples,
+            'idle_samples_dropped': self.idle_samples,
+            'threads': {name: sum(stacks.values()) for name, stacks in sorted(self.stacks.items())},
+            # サンプリング自体にかかった時間の割合（プロファイラのオーバーヘッドの目安）
+            'overhead_ratio': round(self.sampling_ms / (self.duration_s * 1000), 4) if self.duration_s else None,
+        }
+
+
+class SamplingProfiler:
+    """全スレッドのスタックを一定間隔でサンプリングするプロファイラ
+
+    sys._current_frames() でスタックを読むだけなので、対象のコードに手を加えず、
+    再起動せずに稼働中のサーバーでフレームグラフを取れる。同時に取得できるのは1つだけ。
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict]):
+        self.settings_provider = settings_provider
+        self._busy = threading.Lock()
+        self.last_summary: Optional[Dict] = None
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    def profile(self, duration_s: float, interval_ms: Optional[float] = None,
+                include_idle: Optional[bool] = None) -> Profile:
+        """duration_s 秒間サンプリングして Profile を返す（呼び出し元はその間待つ）"""
+        settings = self.settings()
+        duration_s = min(max(0.1, float(duration_s)), float(settings['max_duration_s']))
+        interval_ms = max(1.0, float(interval_ms or settings['interval_ms']))
+        include_idle = settings['include_idle'] if include_idle is None else include_idle
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusyError('A profile is already being captured')
+        try:
+            profile = Profile(interval_ms)
+            sampler = threading.Thread(
+                target=self._sample, args=(profile, duration_s, settings['max_depth'], include_idle),
+                name='sampling-profiler', daemon=True
+            )
+            sampler.start()
+            sampler.join()
+            self.last_summary = profile.summary()
+            logger.info(f"[PERF] Captured profile: {self.last_summary}")
+            return profile
+        finally:
+            self._busy.release()
+
+    def _sample(self, profile: Profile, duration_s: float, max_depth: int, include_idle: bool):
+        own_id = threading.get_ident()
+        interval = profile.interval_ms / 1000
+        frame_index: Dict[object, int] = {}
+        started = time.perf_counter()
+        deadline = started + duration_s
+        next_tick = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._stack(frame, max_depth, frame_index, profile.frames)
+                if not stack:
+                    continue
+                if not include_idle and self._is_idle(profile.frames[stack[-1]]):
+                    profile.idle_samples += 1
+                    continue
+                thread_name = thread_names.get(thread_id, f'thread-{thread_id}')
+                profile.stacks.setdefault(thread_name, Counter())[stack] += 1
+                profile.samples += 1
+            profile.sampling_ms += (time.perf_counter() - now) * 1000
+            # 処理が遅れても間隔がずれていかないよう、予定時刻を基準に待つ
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+        profile.duration_s = time.perf_counter() - started
+
+    @staticmethod
+    def _stack(frame, max_depth: int, frame_index: Dict[object, int], frames: List[Dict]) -> Tuple[int, ...]:
+        """フレームを根から先端の順のフレーム番号に変換（コードオブジェクトごとに番号を振る）"""
+        stack = []
+        while frame is not None and len(stack) < max_depth:
+            code = frame.f_code
+            index = frame_index.get(code)
+            if index is None:
+                index = frame_index[code] = len(frames)
+                file_name = os.path.basename(code.co_filename)
+                frames.append({
+                    # collapsed 形式の区切り文字は名前に含めない
+                    'name': f"{code.co_name} ({file_name}:{code.co_firstlineno})".replace(';', ':'),
+                    'file': code.co_filename,
+                    'line': code.co_firstlineno,
+                })
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    @staticmethod
+    def _is_idle(leaf: Dict) -> bool:
+        file_name = os.path.basename(leaf['file'])
+        function = leaf['name'].split(' ', 1)[0]
+        return (file_name, function) in IDLE_FRAMES
@@ -0,0 +1,197 @@
+import bisect
+import random
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    # テキスト長のバケット境界（文字数）。レイテンシは長さでほぼ決まるのでバケットごとに推定する
+    'length_buckets': [20, 50, 100, 200],
+    # EWMA の平滑化係数（大きいほど直近の計測を重視）
+    'ewma_alpha': 0.2,
+    # p95 の計算に使う直近の計測数
+    'window': 50,
+    # この件数に満たない間は事前値（prior_ms）と組み合わせて推定する
+    'min_samples': 5,
+    # 計測がないモデルの想定レイテンシ
+    'prior_ms': {},
+    'default_prior_ms': 1500,
+    # 予算にこの割合を掛けてから比較する（ネットワークの揺らぎ分の余裕）
+    'budget_safety': 0.9,
+    # 残り予算がこれを下回っても、この値を予算として扱う
+    'min_budget_ms': 300,
+    # 予算外と推定したより高品質なモデルを、この割合だけ試す（推定が古いまま固定されないように）
+    'explore_ratio': 0.05,
+    # 失敗した合成は、この時間がかかったものとして記録する
+    'error_latency_ms': 5000,
+}
+
+
+class _LatencyStats:
+    """1つの (モデル, 長さバケット, 音声) の計測値"""
+    __slots__ = ('ewma', 'samples', 'count', 'errors')
+
+    def __init__(self, window: int):
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def add(self, latency_ms: float, alpha: float):
+        self.ewma = latency_ms if self.ewma is None else alpha * latency_ms + (1 - alpha) * self.ewma
+        self.samples.append(latency_ms)
+        self.count += 1
+
+    def p95(self) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class TTSModelRouter:
+    """観測したレイテンシをもとに TTS モデルを選ぶクラス
+
+    (モデル, テキスト長バケット, 音声) ごとに EWMA と p95 を保持し、
+    品質の高い順に並べたモデルのうち、ターンの残り予算に収まる最初のモデルを選ぶ。
+    どのモデルも収まらない場合は推定が最も短いモデルを使う。
+    予算外と推定したモデルは選ばれず計測も更新されないため、explore_ratio の割合で試して推定を更新する。
+    失敗は error_latency_ms の遅い計測として数える。
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict]):
+        self.settings_provider = settings_provider
+        self._stats: Dict[Tuple[str, int, str], _LatencyStats] = {}
+        self._lock = threading.Lock()
+        self.decisions: Dict[str, Dict[str, int]] = {}
+        self.last_decision: Optional[Dict] = None
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    def bucket_for(self, text_length: int, settings: Optional[Dict] = None) -> int:
+        buckets = (settings or self.settings())['length_buckets']
+        return bisect.bisect_left(sorted(buckets), text_length)
+
+    # ---- 推定 ----
+
+    def estimate(self, model_id: str, text_length: int, voice_id: str, settings: Optional[Dict] = None) -> Tuple[float, str]:
+        """想定レイテンシ（ms）と推定の根拠を返す
+
+        計測が十分あれば max(EWMA, p95)、足りなければ他の音声の同じバケットの計測、
+        それもなければ事前値を使う（計測が少ない間は事前値と按分する）。
+        """
+        settings = settings or self.settings()
+        bucket = self.bucket_for(text_length, settings)
+        prior = float((settings['prior_ms'] or {}).get(model_id, settings['default_prior_ms']))
+        with self._lock:
+            stats = self._stats.get((model_id, bucket, voice_id))
+            source = 'voice'
+            if stats is None or stats.count == 0:
+                # 音声をまたいだ同じモデル・バケットの計測で代用
+                pooled = [s for (m, b, _), s in self._stats.items() if m == model_id and b == bucket and s.count]
+                if not pooled:
+                    return prior, 'prior'
+                samples = [value for s in pooled for value in s.samples]
+                count = sum(s.count for s in pooled)
+                ewma = sum(s.ewma * s.count for s in pooled) / count
+                ordered = sorted(samples)
+                p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                source = 'pooled'
+            else:
+                count, ewma, p95 = stats.count, stats.ewma, stats.p95()
+
+        observed = max(ewma, p95)
+        min_samples = max(1, settings['min_samples'])
+        if count < min_samples:
+            weight = count / min_samples
+            return weight * observed + (1 - weight) * prior, source + '+prior'
+        return observed, source
+
+    # ---- 選択 ----
+
+    def choose(self, models: List[str], text_length: int, voice_id: str, budget_ms: float,
+               fallback_model: Optional[str] = None) -> str:
+        """予算内で最も品質の高いモデルを選ぶ（models は品質の高い順）"""
+        settings = self.settings()
+        if not settings['enabled'] or not models:
+            model_id = fallback_model or (models[-1] if models else '')
+            self._record_decision(model_id, 'disabled', text_length, budget_ms, None)
+            return model_id
+
+        effective_budget = max(budget_ms, settings['min_budget_ms']) * settings['budget_safety']
+        estimates = [(model_id, *self.estimate(model_id, text_length, voice_id, settings)) for model_id in models]
+        chosen = next((item for item in estimates if item[1] <= effective_budget), None)
+        reason = 'within_budget'
+        if chosen is None:
+            chosen = min(estimates, key=lambda item: item[1])
+            reason = 'fastest'
+
+        # 選んだモデルより品質の高いモデルを、一定の割合で試す
+        skipped = estimates[:estimates.index(chosen)]
+        if skipped and random.random() < float(settings['explore_ratio']):
+            chosen = random.choice(skipped)
+            reason = 'explore'
+
+        model_id, estimate_ms, source = chosen
+        self._record_decision(model_id, reason, text_length, budget_ms, estimate_ms, source)
+        return model_id
+
+    def _record_decision(self, model_id: str, reason: str, text_length: int, budget_ms: float,
+                         estimate_ms: Optional[float], source: Optional[str] = None):
+        with self._lock:
+            per_model = self.decisions.setdefault(model_id, {})
+            per_model[reason] = per_model.get(reason, 0) + 1
+            self.last_decision = {
+                'model_id': model_id,
+                'reason': reason,
+                'text_length': text_length,
+                'budget_ms': round(budget_ms, 1),
+                'estimate_ms': round(estimate_ms, 1) if estimate_ms is not None else None,
+                'estimate_source': source,
+            }
+
+    # ---- 計測 ----
+
+    def record(self, model_id: str, text_length: int, voice_id: str, latency_ms: Optional[float]):
+        """合成にかかった時間を記録（latency_ms が None なら失敗として数え、error_latency_ms の計測として扱う）"""
+        settings = self.settings()
+        key = (model_id, self.bucket_for(text_length, settings), voice_id)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _LatencyStats(settings['window'])
+            if latency_ms is None:
+                stats.errors += 1
+                latency_ms = float(settings['error_latency_ms'])
+            stats.add(latency_ms, settings['ewma_alpha'])
+
+    def report(self) -> Dict:
+        settings = self.settings()
+        buckets = sorted(settings['length_buckets'])
+        labels = [f"<={edge}" for edge in buckets] + [f">{buckets[-1]}" if buckets else 'all']
+        with self._lock:
+            estimates = [
+                {
+                    'model_id': model_id,
+                    'length_bucket': labels[bucket] if bucket < len(labels) else str(bucket),
+                    'voice_id': voice_id,
+                    'samples': stats.count,
+                    'errors': stats.errors,
+                    'ewma_ms': round(stats.ewma, 1) if stats.ewma is not None else None,
+                    'p95_ms': round(stats.p95(), 1) if stats.samples else None,
+                }
+                for (model_id, bucket, voice_id), stats in sorted(self._stats.items())
+            ]
+            return {
+                'enabled': settings['enabled'],
+                'decisions': {model_id: dict(reasons) for model_id, reasons in self.decisions.items()},
+                'last_decision': self.last_decision,
+                'estimates': estimates,
+            }
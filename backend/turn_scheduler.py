@@ -0,0 +1,229 @@
+import time
+import heapq
+import logging
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LANE_VOICE = 'voice'
+LANE_TEXT = 'text'
+LANES = (LANE_VOICE, LANE_TEXT)
+
+DEFAULT_SETTINGS = {
+    'max_workers': 8,
+    # 音声レーンを連続で優先する最大回数（テキストレーンの飢餓を防ぐ）
+    'voice_burst': 4,
+    'max_pending_per_session': 4,
+    # セッション別の重み { session_id: weight }（未指定は 1.0）
+    'session_weights': {},
+}
+
+
+class SchedulerFullError(Exception):
+    """セッションの待ち行列が上限に達した場合の例外"""
+
+
+class _Job:
+    __slots__ = ('func', 'future', 'lane', 'enqueued_at')
+
+    def __init__(self, func: Callable[[], object], lane: str):
+        self.func = func
+        self.future: Future = Future()
+        self.lane = lane
+        self.enqueued_at = time.perf_counter()
+
+
+class _Session:
+    __slots__ = ('session_id', 'mailbox', 'running', 'scheduled', 'finish_tag')
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.mailbox: Deque[_Job] = deque()
+        self.running = False
+        self.scheduled = False
+        self.finish_tag = 0.0
+
+
+class TurnScheduler:
+    """全セッション共通のターンスケジューラ
+
+    - 各セッションは順序付きのメールボックスで、同時に実行するターンは1つだけ（到着順）
+    - ワーカー数（max_workers）を全セッションで共有し、重み付き公平キューイングで配分する
+      （仮想時間で、実行回数÷重みが最も小さいセッションから実行）
+    - 音声ターンは優先レーンで先に実行する（voice_burst 回ごとにテキストにも譲る）
+    - max_workers は実行中に変更できる（resize）。減らす場合は実行中のターンを終えたワーカーから
+      止めるため、待ち行列のターンは破棄されない
+    """
+
+    def __init__(self, settings_provider: Callable[[], Dict], wait_history: int = 1000):
+        self.settings_provider = settings_provider
+        self._sessions: Dict[str, _Session] = {}
+        self._ready: Dict[str, List] = {lane: [] for lane in LANES}
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._voice_streak = 0
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._worker_ids = itertools.count()
+        self._waits: Dict[str, Deque[float]] = {lane: deque(maxlen=wait_history) for lane in LANES}
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def settings(self) -> Dict:
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings_provider() or {})
+        return settings
+
+    def start(self):
+        """ワーカースレッドを起動（何度呼んでも一度だけ）"""
+        # 設定の読み込みを待つことがあるので、ロックの外で読む
+        settings = self.settings()
+        with self._condition:
+            if self._workers:
+                return
+            self._add_workers(settings)
+
+    def resize(self):
+        """max_workers の変更を反映（増やす分はすぐに起動し、減らす分は手の空いたワーカーから止める）"""
+        settings = self.settings()
+        with self._condition:
+            if not self._workers:
+                # 未起動なら start 時に反映される
+                return
+            self._add_workers(settings)
+            self._condition.notify_all()
+
+    @staticmethod
+    def _target_workers(settings: Dict) -> int:
+        return max(1, int(settings['max_workers']))
+
+    def _add_workers(self, settings: Dict):
+        while len(self._workers) < self._target_workers(settings):
+            worker = threading.Thread(target=self._worker_loop, name=f'turn-worker-{next(self._worker_ids)}', daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _retire_if_excess(self, settings: Dict) -> bool:
+        """ワーカーが多すぎれば、呼び出したワーカーを停止対象にする（ロック内で呼ぶこと）"""
+        if len(self._workers) <= self._target_workers(settings):
+            return False
+        self._workers.remove(threading.current_thread())
+        # 受け取った通知を他のワーカーに引き継ぐ
+        self._condition.notify()
+        return True
+
+    # ---- 投入 ----
+
+    def submit(self, session_id: str, func: Callable[[], object], lane: str = LANE_TEXT) -> Future:
+        """ターンをセッションのメールボックスに追加し、完了を表す Future を返す"""
+        self.start()
+        settings = self.settings()
+        job = _Job(func, lane if lane in LANES else LANE_TEXT)
+        with self._condition:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(session_id)
+            if len(session.mailbox) >= settings['max_pending_per_session']:
+                self.rejected += 1
+                raise SchedulerFullError(f"Too many pending turns for session {session_id}")
+            session.mailbox.append(job)
+            self._schedule(session, settings)
+            self._condition.notify()
+        return job.future
+
+    def _schedule(self, session: _Session, settings: Dict):
+        """先頭のジョブが実行可能なら、仮想終了時刻を付けてレーンの待ち行列に入れる"""
+        if session.running or session.scheduled or not session.mailbox:
+            return
+        weight = float((settings['session_weights'] or {}).get(session.session_id, 1.0)) or 1.0
+        # 休止していたセッションは現在の仮想時間から再開（溜めた分で他を追い越さない）
+        start_tag = max(self._virtual_time, session.finish_tag)
+        session.finish_tag = start_tag + 1.0 / weight
+        session.scheduled = True
+        heapq.heappush(self._ready[session.mailbox[0].lane], (session.finish_tag, next(self._sequence), start_tag, session))
+
+    def _next_session(self, settings: Dict) -> Optional[_Session]:
+        voice, text = self._ready[LANE_VOICE], self._ready[LANE_TEXT]
+        if voice and (not text or self._voice_streak < settings['voice_burst']):
+            lane = voice
+            self._voice_streak += 1
+        elif text:
+            lane = text
+            self._voice_streak = 0
+        else:
+            return None
+        _, _, start_tag, session = heapq.heappop(lane)
+        # 仮想時間は実行を始めたジョブの開始タグ（SFQ）
+        self._virtual_time = max(self._virtual_time, start_tag)
+        return session
+
+    # ---- 実行 ----
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                settings = self.settings()
+                if self._retire_if_excess(settings):
+                    return
+                session = self._next_session(settings)
+                while session is None:
+                    self._condition.wait()
+                    settings = self.settings()
+                    if self._retire_if_excess(settings):
+                        return
+                    session = self._next_session(settings)
+                session.scheduled = False
+                session.running = True
+                job = session.mailbox.popleft()
+                self._running += 1
+                self._waits[job.lane].append((time.perf_counter() - job.enqueued_at) * 1000)
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.func())
+                    except BaseException as e:
+                        job.future.set_exception(e)
+                        logger.error(f"Turn for session {session.session_id} failed: {e}")
+            finally:
+                with self._condition:
+                    session.running = False
+                    self._running -= 1
+                    self.completed += 1
+                    self._schedule(session, self.settings())
+                    if not session.mailbox and not session.scheduled:
+                        self._sessions.pop(session.session_id, None)
+                    self._condition.notify()
+
+    # ---- 計測 ----
+
+    @staticmethod
+    def _percentiles(samples: List[float]) -> Dict:
+        if not samples:
+            return {'count': 0, 'p50_ms': None, 'p95_ms': None, 'max_ms': None}
+        ordered = sorted(samples)
+        return {
+            'count': len(ordered),
+            'p50_ms': round(ordered[len(ordered) // 2], 2),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            'max_ms': round(ordered[-1], 2),
+        }
+
+    def stats(self) -> Dict:
+        """待ち時間（投入から実行開始まで）の分布と、待ち行列・実行中の件数"""
+        with self._condition:
+            return {
+                'workers': len(self._workers),
+                'target_workers': self._target_workers(self.settings()),
+                'running': self._running,
+                'ready_sessions': {lane: len(self._ready[lane]) for lane in LANES},
+                'pending_turns': sum(len(session.mailbox) for session in self._sessions.values()),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'queue_wait': {lane: self._percentiles(list(self._waits[lane])) for lane in LANES},
+            }
@@ -0,0 +1,135 @@
+import time
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ターンを保持するセッション数の上限（超えたら、処理中でない古いセッションから忘れる）
+MAX_TRACKED_SESSIONS = 10000
+
+
+class Turn:
+    """1回のユーザー発話に対する応答処理（生成・音声合成・送信）の単位
+
+    キャンセルは協調的に行う。各処理は区切りごとに is_cancelled を確認する
+    （Gemini・ElevenLabs のストリームはチャンクの間、AssemblyAI はポーリングの間）。
+    AssemblyAI へのリクエストは add_cancel_callback で中断を登録し、通信中でも打ち切る。
+    """
+
+    def __init__(self, session_id: str, turn_id: int):
+        self.session_id = session_id
+        self.turn_id = turn_id
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.superseded_by: Optional[int] = None
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def add_cancel_callback(self, callback: Callable[[], None]):
+        """キャンセル時に呼ぶ処理を登録（既にキャンセル済みなら即座に呼ぶ）"""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def remove_cancel_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self, superseded_by: Optional[int] = None):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.superseded_by = superseded_by
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _run_callback(self, callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Turn cancel callback failed: {e}")
+
+
+class TurnRegistry:
+    """セッションごとの現在のターンを管理するクラス
+
+    新しいターンを開始すると、同じセッションで処理中の直前のターンをキャンセルする。
+    ターンIDはプロセス全体で単調増加にする（セッションを忘れた後も、クライアントが新しい応答を古いと誤判定しない）。
+    保持するセッション数は max_sessions までで、処理中でない古いセッションから忘れる。
+    """
+
+    def __init__(self, max_sessions: int = MAX_TRACKED_SESSIONS):
+        self.max_sessions = max_sessions
+        self._turns: 'OrderedDict[str, Turn]' = OrderedDict()
+        self._turn_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {
+            'turns_started': 0,
+            'turns_superseded': 0,
+            'gemini_streams_aborted': 0,
+            'tts_requests_skipped': 0,
+            'tts_streams_aborted': 0,
+        }
+
+    def begin(self, session_id: str) -> Tuple[Turn, Optional[Turn]]:
+        """新しいターンを開始し、(新しいターン, キャンセルした旧ターン) を返す（処理中のターンが無ければ旧ターンは None）"""
+        with self._lock:
+            turn_id = next(self._turn_ids)
+            previous = self._turns.pop(session_id, None)
+            turn = Turn(session_id, turn_id)
+            self._turns[session_id] = turn
+            self._evict()
+            self.stats['turns_started'] += 1
+            if previous is not None and (previous.is_cancelled or previous.finished_at is not None):
+                previous = None
+            if previous is not None:
+                self.stats['turns_superseded'] += 1
+
+        if previous is not None:
+            previous.cancel(superseded_by=turn_id)
+            logger.info(f"Turn {previous.turn_id} of session {session_id} superseded by turn {turn_id}")
+        return turn, previous
+
+    def _evict(self):
+        """上限を超えた分を、古いセッションのうち処理中でないものから捨てる（ロック内で呼ぶこと）"""
+        excess = len(self._turns) - self.max_sessions
+        if excess <= 0:
+            return
+        idle = []
+        for session_id, turn in self._turns.items():
+            if turn.finished_at is not None or turn.is_cancelled:
+                idle.append(session_id)
+                if len(idle) >= excess:
+                    break
+        for session_id in idle:
+            del self._turns[session_id]
+
+    def current(self, session_id: str) -> Optional[Turn]:
+        with self._lock:
+            return self._turns.get(session_id)
+
+    def finish(self, turn: Turn):
+        """応答生成の完了を記録"""
+        turn.finished_at = time.time()
+
+    def record(self, key: str, count: int = 1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + count
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            active = sum(1 for turn in self._turns.values() if turn.finished_at is None and not turn.is_cancelled)
+            return dict(self.stats, active_turns=active)
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceCatalog:
+    """ElevenLabs音声一覧のキャッシュ管理クラス
+
+    - TTL内はメモリから返し、TTL切れ（stale）は古い一覧を返しつつバックグラウンドで更新
+    - 取得失敗は指数バックオフ付きでネガティブキャッシュし、毎ターンAPIを叩かない
+    - 同時に発生したキャッシュミスは1回の取得にまとめる（single-flight）
+    - 取得結果をディスクにスナップショット保存し、再起動直後から即座に返す
+    """
+
+    def __init__(self, fetcher: Callable[[], List[Dict]], snapshot_path: Optional[str] = None,
+                 ttl: float = 3600, min_backoff: float = 5, max_backoff: float = 300,
+                 fetch_timeout: float = 15):
+        self.fetcher = fetcher
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.fetch_timeout = fetch_timeout
+
+        self._lock = threading.Lock()
+        self._voices: Optional[List[Dict]] = None
+        self._fetched_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._inflight: Optional[threading.Event] = None
+        self._snapshot_loaded = False
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0,
+                       'fetch_errors': 0, 'negative_hits': 0, 'coalesced': 0}
+
+    def get(self, block: bool = True) -> List[Dict]:
+        """音声一覧を取得（block=False の場合はネットワーク待ちをしない）"""
+        self._load_snapshot()
+        now = time.time()
+
+        voices = self._voices
+        if voices is not None:
+            if now - self._fetched_at < self.ttl:
+                self._stats['hits'] += 1
+            else:
+                # stale-while-revalidate: 古い一覧を返しつつ裏で更新
+                self._stats['stale_hits'] += 1
+                if now >= self._retry_at:
+                    self._refresh_async()
+            return voices
+
+        if now < self._retry_at:
+            self._stats['negative_hits'] += 1
+            return []
+
+        self._stats['misses'] += 1
+        if not block:
+            self._refresh_async()
+            return []
+
+        self._refresh()
+        return self._voices or []
+
+    def invalidate(self):
+        """キャッシュを期限切れにする（次回アクセスで更新）"""
+        self._fetched_at = 0.0
+        self._retry_at = 0.0
+
+    def _refresh_async(self):
+        if self._inflight is not None:
+            return
+        threading.Thread(target=self._refresh, name='voice-catalog-refresh', daemon=True).start()
+
+    def _refresh(self):
+        """single-flight で音声一覧を取得"""
+        with self._lock:
+            inflight = self._inflight
+            if inflight is None:
+                self._inflight = threading.Event()
+
+        if inflight is not None:
+            # 他スレッドの取得完了を待つ
+            self._stats['coalesced'] += 1
+            inflight.wait(self.fetch_timeout)
+            return
+
+        try:
+            self._stats['fetches'] += 1
+            voices = self.fetcher()
+            self._voices = voices
+            self._fetched_at = time.time()
+            self._failures = 0
+            self._retry_at = 0.0
+            self._save_snapshot(voices)
+            logger.info(f"Successfully cached {len(voices)} ElevenLabs voices.")
+        except Exception as e:
+            self._stats['fetch_errors'] += 1
+            self._failures += 1
+            backoff = min(self.max_backoff, self.min_backoff * (2 ** (self._failures - 1)))
+            self._retry_at = time.time() + backoff
+            logger.error(f"Failed to get ElevenLabs voices (retry in {backoff:.0f}s): {e}")
+        finally:
+            with self._lock:
+                event, self._inflight = self._inflight, None
+            event.set()
+
+    def _load_snapshot(self):
+        """ディスクのスナップショットを読み込む（初回のみ・期限切れ扱い）"""
+        if self._snapshot_loaded:
+            return
+        self._snapshot_loaded = True
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if self._voices is None:
+                self._voices = snapshot['voices']
+                self._fetched_at = float(snapshot.get('fetched_at', 0))
+                logger.info(f"Loaded {len(self._voices)} voices from snapshot: {self.snapshot_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to load voice snapshot: {e}")
+
+    def _save_snapshot(self, voices: List[Dict]):
+        """スナップショットをアトミックに保存"""
+        if not self.snapshot_path:
+            return
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'fetched_at': self._fetched_at, 'voices': voices}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Failed to save voice snapshot: {e}")
+
+    def stats(self) -> Dict:
+        """キャッシュの統計情報"""
+        now = time.time()
+        return dict(
+            self._stats,
+            cached_voices=len(self._voices) if self._voices is not None else None,
+            age_seconds=round(now - self._fetched_at, 1) if self._voices is not None else None,
+            consecutive_failures=self._failures,
+            retry_in_seconds=round(max(0.0, self._retry_at - now), 1),
+        )
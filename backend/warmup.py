@@ -0,0 +1,99 @@
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupManager:
+    """起動後のバックグラウンドウォームアップとレディネスを管理するクラス
+
+    登録されたステップを別スレッドで順番に実行する。失敗したステップは
+    degraded として記録し、残りのステップは継続する（初回リクエスト時に再試行される）。
+    """
+
+    def __init__(self):
+        self.process_started_at = time.time()
+        self._steps: List[Tuple[str, Callable[[], None]]] = []
+        self._results: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.warmup_started_at: Optional[float] = None
+        self.warmup_completed_at: Optional[float] = None
+        self.first_request_at: Optional[float] = None
+        self.first_turn_latency_ms: Optional[float] = None
+
+    def add_step(self, name: str, func: Callable[[], None]):
+        """ウォームアップステップを登録"""
+        self._steps.append((name, func))
+
+    def start(self):
+        """ウォームアップを開始（二重起動しない）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.warmup_started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for name, func in self._steps:
+            step_start = time.time()
+            try:
+                func()
+                status, error = 'ok', None
+            except Exception as e:
+                status, error = 'failed', str(e)
+                logger.warning(f"Warm-up step '{name}' failed: {e}")
+
+            self._results[name] = {
+                'status': status,
+                'duration_ms': round((time.time() - step_start) * 1000, 1),
+                'error': error,
+            }
+
+        self.warmup_completed_at = time.time()
+        self._ready_event.set()
+        logger.info(f"Warm-up completed in {self.warmup_completed_at - self.warmup_started_at:.2f}s")
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready_event.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready_event.wait(timeout)
+
+    def mark_request(self):
+        """最初に処理したリクエストの時刻を記録"""
+        if self.first_request_at is None:
+            self.first_request_at = time.time()
+
+    def mark_turn(self, latency_seconds: float):
+        """最初の会話ターンのレイテンシを記録"""
+        if self.first_turn_latency_ms is None:
+            self.first_turn_latency_ms = round(latency_seconds * 1000, 1)
+
+    def _elapsed_ms(self, timestamp: Optional[float]) -> Optional[float]:
+        if timestamp is None:
+            return None
+        return round((timestamp - self.process_started_at) * 1000, 1)
+
+    def status(self) -> Dict:
+        """レディネス状態と起動時の計測値を取得"""
+        degraded = [name for name, result in self._results.items() if result['status'] != 'ok']
+        return {
+            'ready': self.is_ready,
+            'degraded': degraded,
+            'steps': dict(self._results),
+            'pending': [name for name, _ in self._steps if name not in self._results],
+            'metrics': {
+                'warmup_started_ms': self._elapsed_ms(self.warmup_started_at),
+                'warmup_completed_ms': self._elapsed_ms(self.warmup_completed_at),
+                'time_to_first_request_ms': self._elapsed_ms(self.first_request_at),
+                'first_turn_latency_ms': self.first_turn_latency_ms,
+            },
+            'timestamp': datetime.now().isoformat(),
+        }
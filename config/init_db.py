@@ -1,53 +1,24 @@
 import sqlite3
 import os
+import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from db_migrations import apply_migrations
+
 def init_database(db_path):
     """
     SQLiteデータベースを初期化し、必要なテーブルを作成します
-    現在のAI Wife アプリケーションで実際に使用されるテーブルのみを定義
+    スキーマは backend/db_migrations.py で一元管理し、未適用のマイグレーションのみ適用します
     """
     # ディレクトリが存在しない場合は作成
     db_dir = os.path.dirname(db_path)
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
     
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # 会話履歴テーブル（実際に使用中）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT NOT NULL,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            emotion TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # インデックスを作成
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_session_timestamp 
-        ON conversations (session_id, timestamp)
-    ''')
+    version = apply_migrations(db_path)
     
-    # ユーザー情報テーブル（実際に使用中）
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_info (
-            session_id TEXT PRIMARY KEY,
-            name TEXT,
-            preferences TEXT,
-            context_data TEXT,
-            last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"Database initialized successfully at: {db_path}")
+    print(f"Database initialized successfully at: {db_path} (schema version {version})")
 
 def create_sample_data(db_path):
     """
@@ -85,8 +56,6 @@ def create_sample_data(db_path):
     print("Sample data created successfully")
 
 if __name__ == "__main__":
-    import sys
-    
     db_path = sys.argv[1] if len(sys.argv) > 1 else "./config/memory.db"
     
     print(f"Initializing database: {db_path}")
@@ -13,6 +13,9 @@ class AIWifeApp {
     constructor() {
         this.socket = null;
         this.sessionId = this.generateSessionId();
+        this.handledMessageIds = new Set();
+        // 結果をまだ受け取っていない送信（再接続時に同じ message_id で再送する）
+        this.pendingMessage = null;
         this.isRecording = false;
         this.mediaRecorder = null;
         this.audioChunks = [];
@@ -45,6 +48,7 @@ class AIWifeApp {
         this.frequencyData = null;
         this.lipSyncWeight = 0.0;
         this.currentAudio = null;
+        this.fillerAudio = null; // 応答を待つ間に再生するフィラー（相づち）音声
         this.lipSyncSensitivity = 1.0; // 大きめの重みで視認性向上
         
         // 3D UI System
@@ -64,6 +68,12 @@ class AIWifeApp {
         this.audioPlaybackIndex = 0;
         this.receivedChunks = new Map(); // chunk_index -> chunk_data
         this.fullResponseText = '';
+        this.latestTurnId = 0; // サーバーが割り当てたターンID（これより古い応答は破棄）
+        
+        // アセットマニフェスト（/api/assets/manifest）
+        this.assetManifest = null;
+        this.assetEntries = new Map(); // '/models/xxx.vrma' -> manifest entry
+        this.assetManifestPromise = null;
         
         // アニメーション状態管理
         this.currentAnimationType = null;
@@ -117,9 +127,13 @@ class AIWifeApp {
      */
     async init() {
         try {
+            // マニフェスト取得と重要アセットのプリロードを最初に開始（待たずに並行実行）
+            this.assetManifestPromise = this.loadAssetManifest();
+            
             this.setupEventListeners();
             this.initWebSocket();
             await this.init3DScene();
+            await this.assetManifestPromise;
             await this.loadBackground();
             await this.loadCharacter();
             this.loadSettings();
@@ -145,6 +159,56 @@ class AIWifeApp {
         }
     }
     
+    /**
+     * アセットマニフェストの読み込みと重要アセットのプリロード
+     */
+    async loadAssetManifest() {
+        try {
+            const response = await fetch('/api/assets/manifest');
+            if (!response.ok) {
+                console.warn('Asset manifest not available:', response.status);
+                return;
+            }
+            
+            this.assetManifest = await response.json();
+            this.assetEntries.clear();
+            for (const entry of this.assetManifest.assets) {
+                this.assetEntries.set(entry.url, entry);
+            }
+            
+            // critical / high のアセットを並列でプリロード（HTTPキャッシュを温める）
+            const preloadTargets = this.assetManifest.assets.filter(
+                (entry) => entry.available && entry.priority_rank <= 1
+            );
+            for (const entry of preloadTargets) {
+                fetch(entry.fingerprinted_url).catch((error) => {
+                    console.warn(`Failed to preload asset: ${entry.url}`, error);
+                });
+            }
+            
+            console.log(`Asset manifest loaded: ${this.assetManifest.assets.length} assets, preloading ${preloadTargets.length}`);
+        } catch (error) {
+            console.warn('Failed to load asset manifest:', error);
+        }
+    }
+    
+    /**
+     * マニフェストからアセットのエントリを取得（'./models/a.vrma' と '/models/a.vrma' を同一視）
+     */
+    getAssetEntry(path) {
+        if (!this.assetManifest || !path) return null;
+        const normalized = path.startsWith('./') ? path.slice(1) : path;
+        return this.assetEntries.get(normalized) || null;
+    }
+    
+    /**
+     * フィンガープリント付きURLに解決（マニフェストにない場合はそのまま）
+     */
+    resolveAssetUrl(path) {
+        const entry = this.getAssetEntry(path);
+        return entry && entry.available ? entry.fingerprinted_url : path;
+    }
+    
     /**
      * ブリンクタイマーの初期化
      */
@@ -170,6 +234,76 @@ class AIWifeApp {
                Math.random().toString(36).substring(2, 15);
     }
     
+    /**
+     * 送信ごとのメッセージID（再送時はサーバー側で重複排除される）
+     */
+    generateMessageId() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return 'msg_' + Date.now().toString(36) + Math.random().toString(36).substring(2, 12);
+    }
+    
+    /**
+     * ターンを開始するメッセージを送信（結果が届くまで保持し、再接続時に再送する）
+     *
+     * 新しいメッセージはサーバー側で前のターンを置き換えるので、保持するのは最後の1件だけ。
+     */
+    sendTurnMessage(event, payload) {
+        this.pendingMessage = { event: event, payload: { ...payload, message_id: this.generateMessageId() } };
+        // 切断中は送らない（接続時に resendPendingMessage が送る）
+        if (this.socket.connected) {
+            this.socket.emit(event, this.pendingMessage.payload);
+        }
+    }
+    
+    /**
+     * 結果が届いていないメッセージを同じ message_id で再送
+     * （サーバーは処理中なら完了時に結果を、処理済みなら記録した結果を返し、ターンは再実行しない）
+     */
+    resendPendingMessage() {
+        if (!this.pendingMessage) return;
+        console.log('[Debug] Resending pending message:', this.pendingMessage.payload.message_id);
+        this.socket.emit(this.pendingMessage.event, this.pendingMessage.payload);
+    }
+    
+    /**
+     * 送信したメッセージの結果が届いたら保持をやめる
+     */
+    settlePendingMessage(messageId) {
+        if (this.pendingMessage && messageId === this.pendingMessage.payload.message_id) {
+            this.pendingMessage = null;
+        }
+    }
+    
+    /**
+     * 再送したメッセージへの受領通知（処理中: 完了時に結果が届く / 完了済み: 結果は既に届いているか、置き換えられた）
+     */
+    handleMessageAck(data) {
+        if (!this.pendingMessage || data.message_id !== this.pendingMessage.payload.message_id) return;
+        console.log('[Debug] Message ack:', data.message_id, data.status);
+        if (data.status === 'completed') {
+            this.pendingMessage = null;
+            this.hideLoading();
+        }
+    }
+    
+    /**
+     * 同じメッセージへの応答を二重に処理しない（再送への応答が重なった場合）
+     */
+    isDuplicateResponse(data) {
+        if (!data || !data.message_id) return false;
+        if (this.handledMessageIds.has(data.message_id)) {
+            console.log('[Debug] Dropping duplicate response for message:', data.message_id);
+            return true;
+        }
+        this.handledMessageIds.add(data.message_id);
+        if (this.handledMessageIds.size > 200) {
+            this.handledMessageIds.delete(this.handledMessageIds.values().next().value);
+        }
+        return false;
+    }
+    
     /**
      * イベントリスナーの設定
      */
@@ -300,6 +434,13 @@ class AIWifeApp {
         this.socket.on('connect', () => {
             console.log('Connected to server');
             this.updateConnectionStatus('connected');
+            this.sendClientCapabilities();
+            this.resendPendingMessage();
+        });
+        
+        this.socket.on('audio_format', (data) => {
+            console.log('[Debug] Negotiated audio format:', data.format);
+            this.audioFormat = data.format;
         });
         
         this.socket.on('disconnect', () => {
@@ -308,25 +449,52 @@ class AIWifeApp {
         });
         
         this.socket.on('message_response', (data) => {
+            this.settlePendingMessage(data.message_id);
+            if (this.isDuplicateResponse(data)) return;
+            if (this.isStaleTurn(data)) return;
             this.handleMessageResponse(data);
         });
         
         // ストリーミング対応イベントハンドラー
         this.socket.on('message_chunk', (data) => {
             console.log('[Debug] WebSocket received message_chunk event');
+            if (this.isStaleTurn(data)) return;
             this.handleMessageChunk(data);
         });
         
         this.socket.on('streaming_complete', (data) => {
             console.log('[Debug] WebSocket received streaming_complete event');
+            if (this.isStaleTurn(data)) return;
             this.handleStreamingComplete(data);
         });
         
+        // 新しい発話で前の応答が置き換えられた（バージイン）
+        this.socket.on('turn_superseded', (data) => {
+            this.handleTurnSuperseded(data);
+        });
+        
+        // 応答の生成中に流すフィラー音声（サーバーで事前に合成済み）
+        this.socket.on('filler_audio', (data) => {
+            if (this.isStaleTurn(data)) return;
+            this.playFillerAudio(data);
+        });
+        
         this.socket.on('audio_response', (data) => {
             this.handleAudioResponse(data);
         });
         
+        // 再送したメッセージの処理状況
+        this.socket.on('message_ack', (data) => {
+            this.handleMessageAck(data);
+        });
+        
         this.socket.on('error', (data) => {
+            if (data.message_id) {
+                this.settlePendingMessage(data.message_id);
+            } else {
+                // message_id のないエラー（混雑時の拒否など）はこの接続からの送信が受け付けられなかったもの
+                this.pendingMessage = null;
+            }
             this.showError(data.message);
             this.hideLoading();
         });
@@ -336,6 +504,60 @@ class AIWifeApp {
         });
     }
     
+    /**
+     * 置き換えられたターンの応答かどうかを判定（ターンIDのない応答は常に受け付ける）
+     */
+    isStaleTurn(data) {
+        if (!data || data.turn_id == null) return false;
+        if (data.session_id && data.session_id !== this.sessionId) return true;
+        if (data.turn_id < this.latestTurnId) {
+            console.log('[Debug] Dropping response of superseded turn:', data.turn_id);
+            return true;
+        }
+        this.latestTurnId = data.turn_id;
+        return false;
+    }
+    
+    /**
+     * 前のターンの再生を止め、未再生の音声チャンクを破棄
+     */
+    handleTurnSuperseded(data) {
+        if (data.session_id && data.session_id !== this.sessionId) return;
+        console.log('[Debug] Turn superseded:', data.turn_id, '->', data.superseded_by);
+        this.latestTurnId = Math.max(this.latestTurnId, data.superseded_by);
+        
+        this.audioChunkQueue = [];
+        this.receivedChunks.clear();
+        this.fullResponseText = '';
+        this.currentStreamingSession = null;
+        this.stopFillerAudio();
+        
+        if (this.currentAudio) {
+            const audio = this.currentAudio;
+            this.currentAudio = null;
+            audio.pause();
+            // 再生完了待ちの処理（チャンクの順次再生など）を先に進める
+            audio.dispatchEvent(new Event('ended'));
+        }
+    }
+    
+    /**
+     * 再生可能なコーデックをサーバーに通知（音声の出力形式をセッションごとに決めてもらう）
+     */
+    sendClientCapabilities() {
+        if (!this.socket || !this.socket.connected) return;
+        
+        const probe = document.createElement('audio');
+        const codecs = [];
+        if (probe.canPlayType('audio/ogg; codecs="opus"')) codecs.push('opus');
+        if (probe.canPlayType('audio/mpeg')) codecs.push('mp3');
+        
+        this.socket.emit('client_capabilities', {
+            session_id: this.sessionId,
+            codecs: codecs
+        });
+    }
+    
     /**
      * 3Dシーンの初期化
      */
@@ -553,7 +775,7 @@ class AIWifeApp {
         // ユーザーメッセージを会話履歴に追加
         this.addMessageToConversation('user', message);
         
-        this.socket.emit('send_message', {
+        this.sendTurnMessage('send_message', {
             session_id: this.sessionId,
             message: message,
             voice_id: this.settings.voiceId,
@@ -705,7 +927,7 @@ class AIWifeApp {
                 textureUrl = selectedOption.dataset.localUrl;
             } else {
                 // デフォルトファイルの場合
-                textureUrl = `/backgrounds/${this.settings.background}`;
+                textureUrl = this.resolveAssetUrl(`/backgrounds/${this.settings.background}`);
             }
             
             const loader = new THREE.TextureLoader();
@@ -786,7 +1008,7 @@ class AIWifeApp {
                 modelUrl = selectedOption.dataset.localUrl;
             } else {
                 // デフォルトファイルの場合
-                modelUrl = `./models/${this.settings.character}`;
+                modelUrl = this.resolveAssetUrl(`./models/${this.settings.character}`);
             }
             
             const gltfVrm = await loader.loadAsync(modelUrl);
@@ -882,7 +1104,7 @@ class AIWifeApp {
                 modelUrl = selectedOption.dataset.localUrl;
             } else {
                 // デフォルトファイルの場合
-                modelUrl = `./models/${this.settings.character}`;
+                modelUrl = this.resolveAssetUrl(`./models/${this.settings.character}`);
             }
             
             const gltfVrm = await loader.loadAsync(modelUrl);
@@ -942,20 +1164,30 @@ class AIWifeApp {
             // VRMAnimationLoaderPluginを使用してVRMA形式を読み込み
             loader.register((parser) => new VRMAnimationLoaderPlugin(parser));
             
-            // ファイル存在チェック（フェッチで確認）
-            try {
-                const response = await fetch(animationPath, { method: 'HEAD' });
-                if (!response.ok) {
+            // ファイル存在チェック（マニフェストにあればHEADリクエストを省略）
+            let animationUrl = animationPath;
+            const assetEntry = this.getAssetEntry(animationPath);
+            if (assetEntry) {
+                if (!assetEntry.available) {
                     console.warn(`Animation file not found: ${animationPath}`);
                     return null;
                 }
-            } catch (fetchError) {
-                console.warn(`Failed to check animation file: ${animationPath}`, fetchError);
-                return null;
+                animationUrl = assetEntry.fingerprinted_url;
+            } else {
+                try {
+                    const response = await fetch(animationPath, { method: 'HEAD' });
+                    if (!response.ok) {
+                        console.warn(`Animation file not found: ${animationPath}`);
+                        return null;
+                    }
+                } catch (fetchError) {
+                    console.warn(`Failed to check animation file: ${animationPath}`, fetchError);
+                    return null;
+                }
             }
             
             // glTFファイルの読み込み（VRMA拡張付き）
-            const gltf = await loader.loadAsync(animationPath);
+            const gltf = await loader.loadAsync(animationUrl);
             
             // VRMAアニメーションデータを取得
             const vrmAnimation = gltf.userData.vrmAnimations?.[0];
@@ -1728,6 +1960,8 @@ class AIWifeApp {
         console.log(`[Debug] Attempting to play audio chunk ${chunk.index}`);
         console.log(`[Debug] Audio data format:`, chunk.audio.substring(0, 50));
         
+        this.stopFillerAudio();
+        
         return new Promise((resolve, reject) => {
             try {
                 const audio = new Audio(chunk.audio);
@@ -1971,7 +2205,7 @@ class AIWifeApp {
             const arrayBuffer = await audioBlob.arrayBuffer();
             const audioData = Array.from(new Uint8Array(arrayBuffer));
             
-            this.socket.emit('send_audio', {
+            this.sendTurnMessage('send_audio', {
                 session_id: this.sessionId,
                 audio_data: audioData.map(b => b.toString(16).padStart(2, '0')).join(''),
                 voice_id: this.settings.voiceId
@@ -2064,6 +2298,37 @@ class AIWifeApp {
         }
     }
     
+    /**
+     * フィラー音声を再生（本来の応答音声が届いたら止める）
+     */
+    playFillerAudio(data) {
+        if (!data || !data.audio_data) return;
+        this.stopFillerAudio();
+        console.log('[Debug] Playing filler:', data.text, '(emotion:', data.emotion + ')');
+        
+        const audio = new Audio(data.audio_data);
+        audio.volume = this.settings.volume;
+        audio.playbackRate = this.settings.voiceSpeed;
+        audio.addEventListener('ended', () => {
+            if (this.fillerAudio === audio) this.fillerAudio = null;
+        });
+        this.fillerAudio = audio;
+        audio.play().catch((error) => {
+            console.log('[Debug] Filler playback failed:', error);
+            if (this.fillerAudio === audio) this.fillerAudio = null;
+        });
+    }
+    
+    /**
+     * 再生中のフィラー音声を止める
+     */
+    stopFillerAudio() {
+        if (!this.fillerAudio) return;
+        const audio = this.fillerAudio;
+        this.fillerAudio = null;
+        audio.pause();
+    }
+    
     /**
      * Base64エンコードされた音声データを再生
      */
@@ -2080,6 +2345,7 @@ class AIWifeApp {
             }
 
             // Base64データから音声オブジェクトを作成
+            this.stopFillerAudio();
             const audio = new Audio(audioData);
             console.log('[Debug] Created Audio object from base64 data');
             console.log('[Debug] Audio object created successfully:', !!audio);
@@ -2522,6 +2788,8 @@ class AIWifeApp {
             
             // 新しいセッションIDを生成
             this.sessionId = this.generateSessionId();
+            this.latestTurnId = 0;
+            this.sendClientCapabilities();
             console.log('New session started after memory reset:', this.sessionId);
             
             // 成功メッセージ
@@ -2997,6 +3265,8 @@ class AIWifeApp {
 
         // 新しいセッションを開始
         this.sessionId = this.generateSessionId();
+        this.latestTurnId = 0;
+        this.sendClientCapabilities();
         this.conversationMessages = [];
         
         // 保存タイムアウトをクリア
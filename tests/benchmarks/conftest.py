@@ -0,0 +1,162 @@
+"""
+Microbenchmark harness for hot-path components.
+
+Each benchmark measures the median (best of several batches) and p95 time of
+one call and compares the median with the stored baseline. A benchmark fails
+when it is slower than baseline * (1 + threshold) twice in a row.
+
+Options:
+  --bench-baseline PATH    baseline JSON (default: tests/benchmarks/baseline.json)
+  --bench-save             write the results of this run as the new baseline
+  --bench-threshold RATIO  allowed slowdown (default 0.25, env BENCH_THRESHOLD)
+  --bench-output PATH      write the results of this run (default: .benchmarks/latest.json)
+
+Per-benchmark thresholds can be set in the baseline file under "thresholds".
+Baselines are machine specific; regenerate them with --bench-save on the
+machine that runs the comparison.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(ROOT, '.benchmarks', 'latest.json')
+# 1回の計測で最低限かける時間と、計測回数の上限
+MIN_TIME_S = 0.2
+MAX_ROUNDS = 20000
+WARMUP_ROUNDS = 3
+REPEATS = 5
+
+_results = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('benchmarks')
+    group.addoption('--bench-baseline', default=DEFAULT_BASELINE)
+    group.addoption('--bench-save', action='store_true', default=False)
+    group.addoption('--bench-threshold', type=float, default=float(os.getenv('BENCH_THRESHOLD', '0.25')))
+    group.addoption('--bench-output', default=DEFAULT_OUTPUT)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {'results': {}, 'thresholds': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    baseline.setdefault('results', {})
+    baseline.setdefault('thresholds', {})
+    return baseline
+
+
+def measure(func, *args, min_time=MIN_TIME_S, max_rounds=MAX_ROUNDS, repeats=REPEATS):
+    """func(*args) を繰り返し実行し、(バッチごとの中央値の最小値, 全サンプル) をマイクロ秒で返す
+
+    実行環境の一時的な揺らぎ（他プロセス・GC）の影響を減らすため、計測を repeats 個のバッチに分け、
+    最も速かったバッチの中央値を代表値にする。
+    """
+    for _ in range(WARMUP_ROUNDS):
+        func(*args)
+    samples = []
+    batch_medians = []
+    for _ in range(repeats):
+        batch = []
+        started = time.perf_counter()
+        while len(batch) < max_rounds // repeats and (time.perf_counter() - started < min_time / repeats or len(batch) < 5):
+            call_start = time.perf_counter()
+            func(*args)
+            batch.append((time.perf_counter() - call_start) * 1e6)
+        batch_medians.append(statistics.median(batch))
+        samples.extend(batch)
+    return min(batch_medians), samples
+
+
+@pytest.fixture(scope='session')
+def bench_baseline(request):
+    return load_baseline(request.config.getoption('--bench-baseline'))
+
+
+@pytest.fixture
+def bench(request, bench_baseline):
+    """bench(name, func, *args) で計測し、ベースラインより遅ければ失敗させる"""
+    config = request.config
+
+    def run(name, func, *args, min_time=MIN_TIME_S, max_rounds=MAX_ROUNDS):
+        def summarize(median, samples):
+            ordered = sorted(samples)
+            return {
+                'median_us': round(median, 3),
+                'p95_us': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                'rounds': len(ordered),
+            }
+
+        result = summarize(*measure(func, *args, min_time=min_time, max_rounds=max_rounds))
+        _results[name] = result
+
+        baseline = bench_baseline['results'].get(name)
+        if baseline is None or config.getoption('--bench-save'):
+            return result
+        threshold = bench_baseline['thresholds'].get(name, config.getoption('--bench-threshold'))
+        limit = baseline['median_us'] * (1 + threshold)
+        if result['median_us'] > limit:
+            # 一時的な揺らぎで失敗しないよう、もう一度計測して確かめる
+            retry = summarize(*measure(func, *args, min_time=min_time, max_rounds=max_rounds))
+            if retry['median_us'] < result['median_us']:
+                result = _results[name] = retry
+        if result['median_us'] > limit:
+            pytest.fail(
+                f"{name} regressed: median {result['median_us']:.1f}us > "
+                f"{limit:.1f}us (baseline {baseline['median_us']:.1f}us + {threshold:.0%})"
+            )
+        return result
+
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _results:
+        return
+    config = session.config
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': dict(sorted(_results.items())),
+    }
+
+    output = config.getoption('--bench-output')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if config.getoption('--bench-save'):
+        path = config.getoption('--bench-baseline')
+        # 既存の閾値の上書き設定は残す
+        report['thresholds'] = load_baseline(path)['thresholds']
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section('benchmarks')
+    for name, result in sorted(_results.items()):
+        terminalreporter.write_line(
+            f"{name:<48} median {result['median_us']:>10.2f}us  p95 {result['p95_us']:>10.2f}us  ({result['rounds']} rounds)"
+        )
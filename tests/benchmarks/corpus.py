@@ -0,0 +1,71 @@
+"""Synthetic but realistic inputs for the microbenchmarks (fixed seeds, reproducible)."""
+
+import random
+
+# 会話でよく出る文（感情語・技術語・記号・絵文字風の表現を含む）
+SENTENCES = [
+    'こんにちは！今日はどんな一日だった？',
+    '昨日は友達と映画を見に行って、すごく楽しかったよ。',
+    'えっ、本当に？それはびっくりだね！',
+    '最近ちょっと疲れたなって思うことが多いんだ…',
+    'PythonでFlaskのAPIを作ってるんだけど、Socket.IOの接続がたまに切れるんだよね。',
+    'Dockerのイメージが大きすぎて、ビルドに時間がかかって困った。',
+    'ねえねえ、週末はどこか行きたいところある？',
+    '雨の日はおうちでゆっくり本を読むのが好き♪',
+    'そのデータベースの設計、正規化しすぎると逆にSQLが遅くなることもあるよ。',
+    'ありがとう、あなたと話してると本当に幸せな気持ちになる。',
+    'うーん、それはちょっと悲しいな。でも大丈夫、元気出して！',
+    '機械学習のモデルをAWSにデプロイしたいんだけど、何から始めればいい？',
+    'おなかすいたー。今日の晩ごはん何にしようかな。',
+    'Three.jsでVRMのモデルを動かすの、思ったより簡単だったよ！',
+    'なるほど、そういう考え方もあるんだね。',
+    '信じられない！まさかそんな結末になるなんて。',
+]
+
+
+def japanese_text(chars, seed=0):
+    """おおよそ chars 文字の会話文を作る"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < chars:
+        sentence = rng.choice(SENTENCES)
+        parts.append(sentence)
+        length += len(sentence)
+    return ''.join(parts)
+
+
+# 1ターンの入力・応答として典型的な長さ
+SHORT_TEXT = japanese_text(30, seed=1)
+MEDIUM_TEXT = japanese_text(150, seed=2)
+LONG_TEXT = japanese_text(800, seed=3)
+TEXTS = {'short': SHORT_TEXT, 'medium': MEDIUM_TEXT, 'long': LONG_TEXT}
+
+# mp3_22050_32（32kbps = 4KB/秒）で 1秒・8秒・30秒相当の音声
+AUDIO_SIZES = {'1s': 4 * 1024, '8s': 32 * 1024, '30s': 120 * 1024}
+
+
+def synthetic_audio(size, seed=0):
+    """圧縮済み音声に近い（ほぼランダムな）バイト列"""
+    return random.Random(seed).randbytes(size)
+
+
+# 会話履歴の件数（新規・通常・長期利用のセッション）
+HISTORY_SIZES = {'small': 20, 'medium': 500, 'large': 5000}
+
+
+def history_messages(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        ('user' if index % 2 == 0 else 'assistant', rng.choice(SENTENCES), rng.choice(['neutral', 'happy', 'sad']))
+        for index in range(count)
+    ]
+
+
+def mixamo_nodes(bone_names, extra_nodes=120, seed=0):
+    """Mixamo からの書き出しに近いノード配列（ボーン以外のメッシュ・補助ノードを含む）"""
+    rng = random.Random(seed)
+    nodes = [{'name': f'mixamorig_helper_{index}'} for index in range(extra_nodes)]
+    for name in bone_names:
+        nodes.insert(rng.randrange(len(nodes) + 1), {'name': name})
+    return nodes
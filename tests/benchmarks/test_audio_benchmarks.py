@@ -0,0 +1,18 @@
+"""合成音声の base64 data URL 化（TTS の応答ごと）のベンチマーク"""
+
+import base64
+
+import pytest
+
+from corpus import AUDIO_SIZES, synthetic_audio
+
+
+def to_data_url(audio_data, mime_type='audio/mpeg'):
+    # TTSManager.synthesize_speech_optimized と同じ変換
+    return f"data:{mime_type};base64,{base64.b64encode(audio_data).decode('utf-8')}"
+
+
+@pytest.mark.parametrize('duration', list(AUDIO_SIZES))
+def test_base64_data_url(bench, duration):
+    audio = synthetic_audio(AUDIO_SIZES[duration])
+    bench(f'audio.base64_data_url[{duration}]', to_data_url, audio)
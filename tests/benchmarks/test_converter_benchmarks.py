@@ -0,0 +1,23 @@
+"""GLTFToVRMAConverter のボーン検索（マッピング全体）のベンチマーク"""
+
+import pytest
+
+from corpus import mixamo_nodes
+from gltf_to_vrma_converter import GLTFToVRMAConverter
+
+
+@pytest.fixture(scope='module')
+def converter():
+    return GLTFToVRMAConverter()
+
+
+@pytest.mark.parametrize('extra_nodes', [0, 120, 1000])
+def test_find_bone_index_all_bones(bench, converter, extra_nodes):
+    bone_names = list(converter.bone_mapping['mapping'])
+    nodes = mixamo_nodes(bone_names, extra_nodes=extra_nodes)
+
+    def map_all_bones():
+        return [converter.find_bone_index(nodes, name) for name in bone_names]
+
+    assert None not in map_all_bones()
+    bench(f'gltf_converter.find_bone_index[{extra_nodes}_extra_nodes]', map_all_bones)
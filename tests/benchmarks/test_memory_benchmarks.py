@@ -0,0 +1,38 @@
+"""MemoryManager の読み書き（1ターンで数回呼ばれる）のベンチマーク"""
+
+import itertools
+
+import pytest
+
+from corpus import HISTORY_SIZES, MEDIUM_TEXT, history_messages
+
+app = pytest.importorskip('app', reason='backend dependencies are not installed')
+
+
+@pytest.fixture(scope='module')
+def memory(tmp_path_factory):
+    manager = app.MemoryManager(str(tmp_path_factory.mktemp('memory') / 'memory.db'))
+    for size, count in HISTORY_SIZES.items():
+        for role, content, emotion in history_messages(count, seed=count):
+            manager.save_message(f'bench-{size}', role, content, emotion)
+    return manager
+
+
+def test_save_message(bench, memory):
+    counter = itertools.count()
+    bench('memory.save_message', lambda: memory.save_message(f'bench-write-{next(counter) % 50}', 'user', MEDIUM_TEXT, 'neutral'))
+
+
+@pytest.mark.parametrize('size', list(HISTORY_SIZES))
+def test_get_conversation_history(bench, memory, size):
+    bench(f'memory.get_conversation_history[{size}]', memory.get_conversation_history, f'bench-{size}', 20)
+
+
+@pytest.mark.parametrize('size', list(HISTORY_SIZES))
+def test_search_memory(bench, memory, size):
+    bench(f'memory.search_memory[{size}]', memory.search_memory, f'bench-{size}', '映画を見に行って')
+
+
+def test_get_user_info(bench, memory):
+    memory.update_user_info('bench-small', name='ユイ', preferences='映画')
+    bench('memory.get_user_info', memory.get_user_info, 'bench-small')
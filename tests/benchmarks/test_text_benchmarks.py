@@ -0,0 +1,33 @@
+"""TextSplitter と感情・話題判定（毎ターン・毎チャンクで呼ばれる）のベンチマーク"""
+
+import pytest
+
+from corpus import TEXTS
+
+app = pytest.importorskip('app', reason='backend dependencies are not installed')
+
+
+@pytest.fixture(scope='module')
+def conversation_manager():
+    return app.AIConversationManager(app.memory_manager)
+
+
+@pytest.mark.parametrize('size', list(TEXTS))
+def test_split_for_streaming(bench, size):
+    splitter = app.TextSplitter(50)
+    bench(f'text_splitter.split_for_streaming[{size}]', splitter.split_for_streaming, TEXTS[size])
+
+
+@pytest.mark.parametrize('size', list(TEXTS))
+def test_analyze_emotion(bench, conversation_manager, size):
+    bench(f'analyze_emotion[{size}]', conversation_manager.analyze_emotion, TEXTS[size])
+
+
+@pytest.mark.parametrize('size', list(TEXTS))
+def test_analyze_emotion_simple(bench, size):
+    bench(f'analyze_emotion_simple[{size}]', app.analyze_emotion_simple, TEXTS[size])
+
+
+@pytest.mark.parametrize('size', list(TEXTS))
+def test_is_technical_topic(bench, conversation_manager, size):
+    bench(f'is_technical_topic[{size}]', conversation_manager.is_technical_topic, TEXTS[size])
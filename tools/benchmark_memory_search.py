@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Memory search benchmark
+Builds a synthetic conversations database (Zipf-distributed vocabulary and
+session sizes) and compares the auto / FTS5 (trigram) / session scan search
+strategies against a LIKE table scan.
+
+Usage: python benchmark_memory_search.py [rows] [--db path] [--keep]
+"""
+
+import os
+import sys
+import argparse
+import time
+import random
+import sqlite3
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from db_migrations import apply_migrations
+from memory_search import SCAN_THRESHOLD, search_conversations
+
+KATAKANA = 'アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン'
+TEMPLATES = [
+    '昨日は{}の話をしたよね。',
+    '{}がすごく好きなんだ。',
+    '今度の週末は{}に行きたいな♪',
+    '{}についてもっと教えて！',
+    'そういえば{}ってどうだった？',
+    '最近{}にはまっているんだよね。',
+]
+VOCABULARY_SIZE = 5000
+SESSIONS = 1000
+QUERIES = 200
+STRATEGIES = ('auto', 'fts', 'scan')
+
+
+def zipf_weights(count):
+    return [1.0 / (rank + 1) for rank in range(count)]
+
+
+def build_vocabulary(rng):
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choice(KATAKANA) for _ in range(rng.randint(3, 6))))
+    return sorted(words)
+
+
+def build_database(db_path, rows):
+    """合成データでデータベースを作成（語彙とセッションの大きさは Zipf 分布）"""
+    apply_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(42)
+    vocabulary = build_vocabulary(rng)
+    word_weights = zipf_weights(len(vocabulary))
+    session_weights = zipf_weights(SESSIONS)
+
+    def generate():
+        batch = 10000
+        for offset in range(0, rows, batch):
+            size = min(batch, rows - offset)
+            sessions = rng.choices(range(SESSIONS), session_weights, k=size)
+            words = rng.choices(vocabulary, word_weights, k=size * 2)
+            for i in range(size):
+                text = rng.choice(TEMPLATES).format(words[2 * i]) + rng.choice(TEMPLATES).format(words[2 * i + 1])
+                yield (f"session_{sessions[i]:04d}", 'user' if i % 2 else 'assistant', text, 'neutral')
+
+    start = time.time()
+    conn.executemany(
+        'INSERT INTO conversations (session_id, role, content, emotion) VALUES (?, ?, ?, ?)',
+        generate()
+    )
+    conn.commit()
+    conn.close()
+    print(f"Inserted {rows} rows (with FTS triggers) in {time.time() - start:.1f}s")
+
+
+def percentile(samples, ratio):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def report(label, samples):
+    print(f"  {label:<12} p50={statistics.median(samples):7.2f}ms p95={percentile(samples, 0.95):7.2f}ms "
+          f"max={max(samples):7.2f}ms")
+
+
+def benchmark(db_path):
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(7)
+    sessions = conn.execute('SELECT session_id, message_count + archived_count FROM conversation_sessions').fetchall()
+
+    # 実在する語を問い合わせに使う（カタカナ語をそのまま抜き出す）
+    vocabulary = sorted({
+        word for (content,) in conn.execute('SELECT content FROM conversations WHERE id % 997 = 0')
+        for word in ''.join(ch if ch in KATAKANA else ' ' for ch in content).split() if len(word) >= 3
+    })
+    queries = [f"{word}のこと覚えてる？" for word in vocabulary]
+
+    groups = (
+        ('large sessions', [s for s in sessions if s[1] > SCAN_THRESHOLD]),
+        ('small sessions', [s for s in sessions if s[1] <= SCAN_THRESHOLD]),
+    )
+    for label, group in groups:
+        if not group:
+            continue
+        cases = [(rng.choice(group)[0], rng.choice(queries)) for _ in range(QUERIES)]
+        samples = {strategy: [] for strategy in STRATEGIES}
+        hits = 0
+        for session_id, query in cases:
+            for strategy in STRATEGIES:
+                elapsed, results = timed(lambda: search_conversations(
+                    conn, session_id, query, top_k=5, budget_ms=1000, strategy=strategy))
+                samples[strategy].append(elapsed)
+                if strategy == 'auto':
+                    hits += bool(results)
+
+        sizes = [s[1] for s in group]
+        print(f"{label}: {len(group)} sessions, {min(sizes)}-{max(sizes)} messages, "
+              f"hit_rate={hits / len(cases):.0%}")
+        for strategy in STRATEGIES:
+            report(strategy, samples[strategy])
+
+    # 比較対象: インデックスを使わない全表走査
+    table_scan = []
+    for _ in range(10):
+        session_id, query = rng.choice(sessions)[0], rng.choice(queries)
+        table_scan.append(timed(lambda: conn.execute(
+            'SELECT id FROM conversations NOT INDEXED WHERE session_id = ? AND content LIKE ?',
+            (session_id, f"%{query.split('の')[0]}%")
+        ).fetchall())[0])
+    print("table scan:")
+    report('LIKE', table_scan)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FTS5 memory search')
+    parser.add_argument('rows', nargs='?', type=int, default=1_000_000)
+    parser.add_argument('--db', help='Reuse or create the database at this path')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated database')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'memory_bench.db')
+    if not os.path.exists(db_path):
+        build_database(db_path, args.rows)
+    print(f"Database: {db_path} ({os.path.getsize(db_path) / 1024 / 1024:.1f} MB)")
+
+    benchmark(db_path)
+
+    if not args.keep and not args.db:
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Sharded memory store write benchmark
+Runs concurrent writer threads (one per simulated session group) against
+1, 2, 4 and 8 shards and reports message writes per second, so the scaling
+of write throughput with shard count can be checked.
+
+Usage: python benchmark_memory_shards.py [--writers 16] [--seconds 5] [--shards 1,2,4,8] [--dir path]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import sqlite3
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from db_migrations import apply_migrations
+from memory_shards import ShardWriter, shard_index, shard_paths
+
+
+def run(directory, shard_count, writers, seconds):
+    """shard_count シャードに writers 本のスレッドで書き込み、(書き込み数/秒, エラー数) を返す"""
+    base_path = os.path.join(directory, f'bench_{shard_count}.db')
+    paths = shard_paths(base_path, shard_count)
+    for path in paths:
+        apply_migrations(path)
+    shard_writers = [ShardWriter(path) for path in paths]
+
+    counts = [0] * writers
+    errors = [0] * writers
+    stop = threading.Event()
+
+    def writer(worker):
+        session_ids = [f'session-{worker}-{index}' for index in range(8)]
+        turn = 0
+        while not stop.is_set():
+            session_id = session_ids[turn % len(session_ids)]
+            try:
+                shard_writers[shard_index(session_id, shard_count)].insert_message(
+                    session_id, 'user', f'メッセージ {turn} の本文です。今日はいい天気ですね。', 'neutral'
+                )
+                counts[worker] += 1
+            except sqlite3.Error:
+                errors[worker] += 1
+            turn += 1
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    for shard_writer in shard_writers:
+        shard_writer.close()
+    return sum(counts) / elapsed, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark write throughput of the sharded memory store')
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--shards', default='1,2,4,8')
+    parser.add_argument('--dir', help='directory for the benchmark databases (default: temporary)')
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix='memory-shards-')
+    os.makedirs(directory, exist_ok=True)
+    try:
+        baseline = None
+        print(f"{'shards':>6} {'writes/s':>10} {'scaling':>8} {'errors':>7}")
+        for shard_count in [int(value) for value in args.shards.split(',')]:
+            throughput, errors = run(directory, shard_count, args.writers, args.seconds)
+            baseline = baseline or throughput
+            print(f"{shard_count:>6} {throughput:10.0f} {throughput / baseline:7.2f}x {errors:>7}")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
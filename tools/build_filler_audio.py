@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Filler audio build tool
+Synthesizes the per-character filler phrases (ai_settings.personalities.<key>.fillers)
+with each character's voice and stores them under FILLER_AUDIO_DIR, so the
+server only loads them from disk at startup. Phrases that are already stored
+are skipped; changing a phrase, voice, model or output format writes a new file.
+
+Usage:
+  python build_filler_audio.py [--config path] [--output dir] [--dry-run]
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from audio_codecs import get_audio_format
+from filler_audio import FillerBank
+from runtime_config import RuntimeConfigManager
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_CONFIG = os.path.join(PROJECT_ROOT, 'config', 'app_config.yml')
+DEFAULT_OUTPUT = os.path.join(PROJECT_ROOT, 'config', 'fillers')
+
+
+def elevenlabs_synthesizer():
+    from elevenlabs.client import ElevenLabs
+
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        sys.exit('ELEVENLABS_API_KEY is not set')
+    client = ElevenLabs(api_key=api_key)
+
+    def synthesize(text, voice_id, model_id, output_format):
+        print(f"  synthesizing: {text} ({voice_id})")
+        return b''.join(client.text_to_speech.convert(
+            text=text, voice_id=voice_id, model_id=model_id, output_format=output_format
+        ))
+
+    return synthesize
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-synthesize per-character filler audio')
+    parser.add_argument('--config', default=os.getenv('APP_CONFIG_PATH', DEFAULT_CONFIG))
+    parser.add_argument('--output', default=os.getenv('FILLER_AUDIO_DIR', DEFAULT_OUTPUT))
+    parser.add_argument('--dry-run', action='store_true', help='only report which phrases are missing')
+    args = parser.parse_args()
+
+    config = RuntimeConfigManager(args.config, autoload=False).current
+    bank = FillerBank(args.output, lambda: config.tts.fillers)
+    settings = bank.settings()
+
+    def voice_for(personality):
+        return config.personality(personality).voice_id or config.tts.default_voice_id
+
+    result = bank.prepare(
+        {key: personality.fillers for key, personality in config.personalities.items()},
+        voice_for,
+        None if args.dry_run else elevenlabs_synthesizer(),
+        settings['model'] or config.tts.quality_model,
+        get_audio_format(settings['output_format'] or config.tts.output_format),
+    )
+    print(f"{args.output}: {result}")
+    if result['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
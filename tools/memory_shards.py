@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Memory shard tool
+Operates on the sharded conversation store (memory_settings.shard_count).
+Run reshard while the application is stopped.
+
+Usage:
+  python memory_shards.py status   [--db path] [--shards N]
+  python memory_shards.py export   [--db path] [--shards N] [--output file.ndjson]
+  python memory_shards.py maintain [--db path] [--shards N]
+  python memory_shards.py reshard  [--db path] --from N --to M
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from memory_shards import ShardedMaintenance, iter_export, reshard, shard_paths, shard_status
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'memory.db')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, export, maintain and reshard the conversation store')
+    parser.add_argument('command', choices=('status', 'export', 'maintain', 'reshard'))
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', DEFAULT_DB), help='base database path')
+    parser.add_argument('--shards', type=int, default=int(os.getenv('MEMORY_SHARD_COUNT', '1')))
+    parser.add_argument('--output', help='export destination (default: stdout)')
+    parser.add_argument('--from', dest='source_count', type=int, help='current shard count (reshard)')
+    parser.add_argument('--to', dest='target_count', type=int, help='new shard count (reshard)')
+    args = parser.parse_args()
+
+    base_path = os.path.abspath(args.db)
+    paths = shard_paths(base_path, args.shards)
+
+    if args.command == 'status':
+        for shard in shard_status(paths):
+            print(json.dumps(shard, ensure_ascii=False))
+
+    elif args.command == 'export':
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for line in iter_export(paths):
+                out.write(line)
+        finally:
+            if args.output:
+                out.close()
+
+    elif args.command == 'maintain':
+        # 時間予算を外して、全シャードのメンテナンスを一度に行う
+        maintenance = ShardedMaintenance(lambda: paths, lambda: {'run_time_budget_ms': 60000})
+        for path, result in maintenance.run_once().items():
+            print(json.dumps(dict(result, path=path), ensure_ascii=False))
+
+    else:
+        if not args.source_count or not args.target_count:
+            parser.error('reshard requires --from and --to')
+        if args.source_count == args.target_count:
+            parser.error('--from and --to are the same')
+        result = reshard(shard_paths(base_path, args.source_count), base_path, args.target_count)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        print(f"Set memory_settings.shard_count (or MEMORY_SHARD_COUNT) to {args.target_count} before restarting.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Cassette replay tool
+Inspects cassettes recorded with performance.cassette.mode = record, resends
+the recorded turns to a server running in replay mode, and compares turn and
+upstream stage latencies between two cassettes (e.g. the original recording
+and the output_path written during a replay against a new build).
+
+Usage:
+  python replay_cassette.py summary <cassette>
+  python replay_cassette.py send <cassette> [--url http://localhost:5000] [--speed 1.0] [--timeout 30]
+  python replay_cassette.py compare <base> <candidate>
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from cassettes import read_cassette
+
+SERVICES = ('assemblyai', 'gemini', 'elevenlabs')
+LANE_EVENTS = {'text': 'send_message', 'voice': 'send_audio'}
+# ターンの終わりとみなすイベント（送った message_id と一致したものだけ数える）
+DONE_EVENTS = ('message_response', 'error')
+
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def turn_stages(entries):
+    """ターンごとの所要時間と、上流サービス別の合計時間（記録順）"""
+    turns = {}
+    order = []
+    for entry in entries:
+        key = (entry.get('session_id'), entry.get('turn_id'))
+        if entry['type'] == 'turn_input':
+            order.append(key)
+            turns.setdefault(key, {'services': {}})
+        elif entry['type'] == 'turn':
+            turns.setdefault(key, {'services': {}})['total'] = entry['duration_ms']
+        elif entry['type'] == 'call':
+            services = turns.setdefault(key, {'services': {}})['services']
+            services[entry['service']] = services.get(entry['service'], 0.0) + entry['duration_ms']
+    return [(key, turns[key]) for key in order if 'total' in turns[key]]
+
+
+def summarize(path):
+    entries = read_cassette(path)
+    calls = [entry for entry in entries if entry['type'] == 'call']
+    inputs = [entry for entry in entries if entry['type'] == 'turn_input']
+    print(f"{path}: {len(inputs)} turns, {len(calls)} upstream calls, {os.path.getsize(path) / 1024:.1f} KiB")
+    for service in SERVICES:
+        durations = [entry['duration_ms'] for entry in calls if entry['service'] == service]
+        errors = sum(1 for entry in calls if entry['service'] == service and entry.get('error'))
+        if durations:
+            print(f"  {service:<11} calls={len(durations):<5} p50={statistics.median(durations):8.1f}ms "
+                  f"p95={percentile(durations, 0.95):8.1f}ms errors={errors}")
+    totals = [stages['total'] for _, stages in turn_stages(entries)]
+    if totals:
+        print(f"  {'turn':<11} count={len(totals):<5} p50={statistics.median(totals):8.1f}ms p95={percentile(totals, 0.95):8.1f}ms")
+
+
+def send(path, url, speed, timeout):
+    """記録したターンの入力を、記録どおりの間隔（speed 倍速）でサーバーに送る"""
+    import socketio
+
+    inputs = [entry for entry in read_cassette(path) if entry['type'] == 'turn_input']
+    if not inputs:
+        print('No recorded turns')
+        return
+
+    client = socketio.Client()
+    done = threading.Event()
+    pending = {'message_id': None}
+
+    def handler(event):
+        def on_event(payload=None, *args):
+            message_id = payload.get('message_id') if isinstance(payload, dict) else None
+            # message_response は全クライアントに配信されるので、送った message_id のものだけ数える。
+            # message_id の無い error（混雑時の拒否など）はこの接続宛てにしか届かない
+            if message_id == pending['message_id'] or (event == 'error' and message_id is None):
+                done.set()
+        return on_event
+
+    for event in DONE_EVENTS:
+        client.on(event, handler(event))
+    client.connect(url)
+
+    started = time.perf_counter()
+    first_received_at = inputs[0]['received_at']
+    for entry in inputs:
+        if speed > 0:
+            due = started + (entry['received_at'] - first_received_at) / speed
+            time.sleep(max(0.0, due - time.perf_counter()))
+        done.clear()
+        # 記録時の message_id を使い回すとサーバーの重複排除で再実行されないので、毎回振り直す
+        pending['message_id'] = f"replay-{uuid.uuid4().hex}"
+        data = dict(entry['data'], message_id=pending['message_id'])
+        turn_started = time.perf_counter()
+        client.emit(LANE_EVENTS.get(entry['lane'], 'send_message'), data)
+        finished = done.wait(timeout)
+        elapsed_ms = (time.perf_counter() - turn_started) * 1000
+        print(f"  turn {entry['session_id']}#{entry['turn_id']} ({entry['lane']}): "
+              f"{elapsed_ms:.1f}ms{'' if finished else ' (timeout)'}")
+    client.disconnect()
+
+
+def compare(base_path, candidate_path):
+    """2つのカセットのターンを記録順に対応させ、所要時間を比較"""
+    base = turn_stages(read_cassette(base_path))
+    candidate = turn_stages(read_cassette(candidate_path))
+    pairs = list(zip(base, candidate))
+    if not pairs:
+        print('No comparable turns')
+        return
+
+    columns = ('total',) + SERVICES + ('app',)
+
+    def stage_values(stages):
+        values = {'total': stages['total']}
+        for service in SERVICES:
+            values[service] = stages['services'].get(service, 0.0)
+        # 上流の待ち時間以外（アプリ内の処理）
+        values['app'] = max(0.0, stages['total'] - sum(stages['services'].values()))
+        return values
+
+    print(f"{len(pairs)} turns compared ({len(base)} in base, {len(candidate)} in candidate)")
+    print(f"{'stage':<11} {'base p50':>10} {'cand p50':>10} {'delta':>9} {'base p95':>10} {'cand p95':>10}")
+    for column in columns:
+        base_values = [stage_values(stages)[column] for (_, stages), _ in pairs]
+        cand_values = [stage_values(stages)[column] for _, (_, stages) in pairs]
+        base_p50, cand_p50 = statistics.median(base_values), statistics.median(cand_values)
+        print(f"{column:<11} {base_p50:10.1f} {cand_p50:10.1f} {cand_p50 - base_p50:+9.1f} "
+              f"{percentile(base_values, 0.95):10.1f} {percentile(cand_values, 0.95):10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, resend and compare upstream cassettes')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary_parser = subparsers.add_parser('summary')
+    summary_parser.add_argument('cassette')
+    send_parser = subparsers.add_parser('send')
+    send_parser.add_argument('cassette')
+    send_parser.add_argument('--url', default='http://localhost:5000')
+    send_parser.add_argument('--speed', type=float, default=1.0, help='0 sends turns back to back')
+    send_parser.add_argument('--timeout', type=float, default=30.0)
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        summarize(args.cassette)
+    elif args.command == 'send':
+        send(args.cassette, args.url, args.speed, args.timeout)
+    else:
+        compare(args.base, args.candidate)
+
+
+if __name__ == '__main__':
+    main()